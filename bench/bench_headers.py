@@ -0,0 +1,61 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Benchmarks for header serialization.
+"""
+
+import benchutil
+from nihil import headers as H
+
+
+def sample_headers():
+    yield H.Accept("text/html,application/xhtml+xml")
+    yield H.AcceptEncoding("gzip, deflate")
+    yield H.AcceptRanges.BYTES
+    yield H.Allow("GET, HEAD, POST")
+    yield H.Authorization("Basic", "dXNlcjpwYXNzd29yZA==")
+    yield H.Connection.KEEP_ALIVE
+    yield H.ContentEncoding("gzip")
+    yield H.ContentLength(31337)
+    yield H.ContentRange(0, 500, 31337)
+    yield H.ContentType.TEXT_HTML
+    yield H.CustomHeader("X-Powered-By", "nihil")
+    yield H.ETag("5d41402abc4b2a76b9719d911017c592")
+    yield H.Host("www.example.com", 8080)
+    yield H.IfModifiedSince(784111777)
+    yield H.IfNoneMatch('"5d41402abc4b2a76", W/"7d793037a0760186"')
+    yield H.LastModified(784111777)
+    yield H.Location("http://www.example.com/some/where")
+    yield H.ProxyAuthenticate("Basic", "proxy")
+    yield H.ProxyAuthorization("Basic", "dXNlcjpwYXNzd29yZA==")
+    yield H.Range("bytes=0-499,1000-")
+    yield H.RetryAfter(120)
+    yield H.Server("nihil/0.0.1")
+    yield H.TransferEncoding.CHUNKED
+    yield H.UserAgent("Mozilla/5.0 (X11; Linux x86_64; rv:34.0)")
+    yield H.Vary("Accept-Encoding")
+    yield H.WWWAuthenticate("Basic", "nihil")
+
+
+def benchmarks():
+    covered = set()
+    for header in sample_headers():
+        cls = header.__class__
+        covered.add(cls)
+        yield ("headers.str." + cls.__name__, lambda h=header: str(h))
+        yield ("headers.to_bytes." + cls.__name__,
+                lambda h=header: h.to_bytes())
+    # Make sure that newly added header classes get benchmarked.
+    missing = set(H.registry.values()) - covered
+    assert not missing, "No benchmark for: {}".format(
+            ", ".join(sorted(cls.__name__ for cls in missing)))
+
+
+if __name__ == "__main__":
+    benchutil.main(benchmarks)
@@ -0,0 +1,62 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Benchmarks for response serialization.
+"""
+
+import benchutil
+from nihil import headers as H
+from nihil.cache import ResponseCache
+from nihil.request import Request
+from nihil.response import Response
+
+
+HEADER_SETS = {
+    "0": (),
+    "2": (H.ContentType.TEXT_HTML, H.ContentLength(1024)),
+    "8": (H.ContentType.TEXT_HTML, H.ContentLength(1024),
+        H.Connection.KEEP_ALIVE, H.Server("nihil/0.0.1"),
+        H.Location("/foo/bar"), H.Allow("GET, HEAD"),
+        H.CustomHeader("X-Request-Id", "5f0c5e14"),
+        H.CustomHeader("Cache-Control", "no-cache")),
+    "20": tuple(H.CustomHeader("X-Header-{}".format(i), "value {}".format(i))
+        for i in range(20)),
+}
+
+BODIES = {
+    "text": lambda: u"x" * 1024,
+    "bytes": lambda: b"x" * 1024,
+    "chunks": lambda: [b"x" * 64] * 16,
+    "generator": lambda: (b"x" * 64 for _ in range(16)),
+}
+
+
+def benchmarks():
+    for header_count in sorted(HEADER_SETS, key=int):
+        headers = HEADER_SETS[header_count]
+        for body_name in sorted(BODIES):
+            body = BODIES[body_name]
+            suffix = "{}_headers.{}".format(header_count, body_name)
+            yield ("response.iter." + suffix,
+                    lambda body=body, headers=headers:
+                        list(Response(body(), headers)))
+            yield ("response.buffers." + suffix,
+                    lambda body=body, headers=headers:
+                        Response(body(), headers).buffers())
+        cache = ResponseCache(lambda request, body=body, headers=headers:
+                Response(body(), headers))
+        request = Request("GET", "/", "HTTP/1.1")
+        cache(request)
+        yield ("response.cached_hit.{}_headers".format(header_count),
+                lambda cache=cache, request=request:
+                    cache(request).buffers(b"HTTP/1.1 200 OK\r\n"))
+
+
+if __name__ == "__main__":
+    benchutil.main(benchmarks)
@@ -0,0 +1,36 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Benchmarks for status exceptions and their bodies.
+"""
+
+import benchutil
+from nihil import status
+
+
+def benchmarks():
+    for name in sorted(status.__all__):
+        cls = getattr(status, name)
+        if cls.code is None:
+            continue
+        e = cls()
+        yield ("status.render_html." + name, e.render_html)
+        yield ("status.render_plain." + name, e.render_plain)
+        m = cls(u"Something <went> wrong")
+        yield ("status.render_html_message." + name, m.render_html)
+        yield ("status.render_plain_message." + name, m.render_plain)
+    for cls in (status.HTTPNotFound, status.HTTPMethodNotAllowed,
+            status.HTTPTooManyRequests):
+        yield ("status.create." + cls.__name__, cls)
+        yield ("status.create_buffers." + cls.__name__,
+                lambda cls=cls: cls().buffers(cls.status_line))
+
+
+if __name__ == "__main__":
+    benchutil.main(benchmarks)
@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Helpers shared by the benchmark modules.
+"""
+
+from os import path, devnull
+from timeit import default_timer
+import sys
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..")))
+
+
+def measure(func, repeat=5, min_time=0.1):
+    """
+    Times calls to `func`. The amount of calls per round is calibrated so
+    a round takes at least `min_time` seconds, and the best of `repeat`
+    rounds is reported, as seconds per call.
+    """
+    number = 1
+    while True:
+        start = default_timer()
+        for _ in range(number):
+            func()
+        elapsed = default_timer() - start
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = default_timer()
+        for _ in range(number):
+            func()
+        timings.append((default_timer() - start) / number)
+    return {
+        "iterations": number,
+        "best": min(timings),
+        "mean": sum(timings) / len(timings),
+    }
+
+
+def run(sources, pattern=None, **kw):
+    """
+    Runs the benchmarks produced by each of the `sources` (callables which
+    return ``(name, function)`` pairs), optionally only those whose name
+    contains `pattern`, and returns a list of results.
+    """
+    results = []
+    for source in sources:
+        for name, func in source():
+            if pattern is not None and pattern not in name:
+                continue
+            result = measure(func, **kw)
+            result["name"] = name
+            result["ops_per_second"] = 1.0 / result["best"]
+            results.append(result)
+            sys.stderr.write("{:<60} {:12.0f} ops/s\n".format(name,
+                result["ops_per_second"]))
+    return results
+
+
+def environment():
+    import platform
+    import subprocess
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"],
+                cwd=path.dirname(path.abspath(__file__)),
+                stderr=open(devnull, "w")).decode("ascii").strip()
+    except Exception:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "commit": commit,
+    }
+
+
+def compare(old, new, out=sys.stdout):
+    """
+    Prints the relative change of each benchmark in `new` with respect to
+    the same benchmark in `old`; positive values are speedups.
+    """
+    baseline = dict((r["name"], r["best"]) for r in old["results"])
+    for result in new["results"]:
+        before = baseline.get(result["name"])
+        if before is None:
+            continue
+        change = (before / result["best"] - 1.0) * 100.0
+        out.write("{:<60} {:+7.1f}%\n".format(result["name"], change))
+
+
+def main(*sources):
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(
+            description=sys.modules["__main__"].__doc__)
+    parser.add_argument("-o", "--output", default=None,
+            help="write JSON results to a file instead of stdout")
+    parser.add_argument("-k", "--filter", default=None,
+            help="only run benchmarks whose name contains this text")
+    parser.add_argument("-c", "--compare", default=None,
+            help="compare with the results stored in a JSON file")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+            help="rounds to run for each benchmark (default: %(default)s)")
+    args = parser.parse_args()
+
+    data = environment()
+    data["results"] = run(sources, args.filter, repeat=args.repeat)
+    if args.output is None:
+        json.dump(data, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(json.load(f), data, sys.stderr)
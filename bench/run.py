@@ -0,0 +1,28 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Runs all the benchmarks and reports the results as JSON.
+
+Usage::
+
+    python bench/run.py -o before.json
+    ... apply changes ...
+    python bench/run.py -o after.json -c before.json
+"""
+
+import benchutil
+import bench_headers
+import bench_parser
+import bench_response
+import bench_status
+
+
+if __name__ == "__main__":
+    benchutil.main(bench_headers.benchmarks, bench_parser.benchmarks,
+            bench_response.benchmarks, bench_status.benchmarks)
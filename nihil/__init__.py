@@ -0,0 +1,42 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Nothing-but-Iffy HTTP I/O Library.
+"""
+
+# Submodules are imported the first time they are accessed as attributes
+# of the package (PEP 562), so "import nihil" alone is cheap.
+_submodules = frozenset((
+    "cache",
+    "client",
+    "compression",
+    "conditional",
+    "files",
+    "headers",
+    "metadata",
+    "metrics",
+    "offload",
+    "parser",
+    "protocol",
+    "ratelimit",
+    "request",
+    "response",
+    "routing",
+    "server",
+    "status",
+    "timeouts",
+))
+
+
+def __getattr__(name):
+    if name in _submodules:
+        from importlib import import_module
+        return import_module("." + name, __name__)
+    raise AttributeError("module {!r} has no attribute {!r}".format(
+        __name__, name))
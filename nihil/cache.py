@@ -0,0 +1,234 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+In-memory response cache.
+"""
+
+from trololio import asyncio
+from . import headers as H
+from .protocol import then, _is_awaitable, _is_async_iterable, \
+        _future_loop
+from .response import Response, to_buffer
+from collections import OrderedDict
+import time
+
+
+# Status codes of responses which are cacheable by default, as per
+# RFC 7231, section 6.1.
+CACHEABLE_CODES = frozenset((200, 203, 204, 300, 301, 404, 405, 410, 414,
+    501))
+
+
+def _cache_control(headers):
+    header = headers.get("Cache-Control")
+    if header is None:
+        return {}
+    directives = {}
+    for item in header.string_value.split(","):
+        name, _, value = item.partition("=")
+        directives[name.strip().lower()] = value.strip().strip('"')
+    return directives
+
+
+class CacheEntry(object):
+    """
+    A response stored in a :class:`ResponseCache`, serialized to bytes.
+    """
+    __slots__ = ("code", "title", "reason", "headers", "body", "size",
+            "expires")
+
+    def __init__(self, response, body, expires):
+        self.code = response.code
+        self.title = response.title
+        self.reason = response.reason
+        self.headers = response.headers
+        self.body = (body,)
+        self.expires = expires
+        # Rendering now keeps the header block in the map for later.
+        self.size = len(self.headers.to_bytes(response.status_line)) \
+                + len(body)
+
+    def response(self):
+        """
+        Creates a :class:`CachedResponse` which replays the entry.
+        """
+        return CachedResponse(self)
+
+
+class CachedResponse(Response):
+    """
+    Response created from a :class:`CacheEntry`. Its header block is the
+    one rendered when the entry was stored (unless headers are added to
+    it), and its body is a single bytes object.
+    """
+    def __init__(self, entry):
+        Response.__init__(self, entry.body, entry.headers.copy())
+        self.code = entry.code
+        self.title = entry.title
+        self.reason = entry.reason
+
+
+class ResponseCache(object):
+    """
+    Wraps a `handler`, keeping its responses in memory as bytes so they can
+    be sent again without producing them.
+
+    Responses are cached for requests with one of the given `methods`, and
+    keyed by method, path, query, and the values of the request headers
+    named in `vary`. Responses with a ``Vary`` header which names other
+    headers are not cached, nor responses to requests with credentials,
+    responses with cookies, or marked with ``Cache-Control: no-store``,
+    ``no-cache`` or ``private``. Only :data:`CACHEABLE_CODES` are cached,
+    and only bodies produced synchronously.
+
+    Entries expire after `ttl` seconds, or after the ``s-maxage`` or
+    ``max-age`` given in the ``Cache-Control`` header of the response. The
+    least recently used entries are evicted to keep the total size of the
+    entries under `max_size` bytes.
+
+    While an asynchronous handler is producing a response, further
+    requests for the same key wait for it instead of calling the handler
+    again.
+    """
+    _clock = staticmethod(time.time)
+
+    def __init__(self, handler, max_size=64 * 1024 * 1024, ttl=60,
+            vary=(), methods=("GET", "HEAD")):
+        self.handler = handler
+        self.max_size = max_size
+        self.ttl = ttl
+        self.vary = tuple(vary)
+        self.methods = frozenset(methods)
+        self.size = 0
+        self._vary_names = frozenset(name.lower() for name in vary)
+        self._entries = OrderedDict()
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, request):
+        """
+        Returns the key used to cache the response to a `request`, or
+        ``None`` if the response must not be cached.
+        """
+        if request.method not in self.methods \
+                or H.Authorization in request.headers:
+            return None
+        key = [request.method, request.path, request.query]
+        for name in self.vary:
+            header = request.header(name)
+            key.append(None if header is None else header.string_value)
+        return tuple(key)
+
+    def get(self, key):
+        """
+        Returns the :class:`CacheEntry` for a `key`, or ``None``.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        if entry.expires <= self._clock():
+            self.size -= entry.size
+            return None
+        self._entries[key] = entry
+        return entry
+
+    def invalidate(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def _ttl(self, response):
+        headers = response.headers
+        if response.code not in CACHEABLE_CODES \
+                or "Set-Cookie" in headers or H.Connection in headers:
+            return None
+        vary = headers.get(H.Vary)
+        if vary is not None:
+            for name in vary.string_value.split(","):
+                if name.strip().lower() not in self._vary_names:
+                    return None
+        directives = _cache_control(headers)
+        if "no-store" in directives or "no-cache" in directives \
+                or "private" in directives:
+            return None
+        for name in ("s-maxage", "max-age"):
+            if name in directives:
+                try:
+                    return int(directives[name])
+                except ValueError:
+                    return None
+        return self.ttl
+
+    def store(self, key, response):
+        """
+        Stores a `response` for a `key`. Returns the new
+        :class:`CacheEntry`, or ``None`` if the response is not cacheable.
+        Bodies produced by iterators are consumed, and replaced in the
+        response by the data they produced.
+        """
+        ttl = self._ttl(response)
+        content = response.content
+        if not ttl or ttl <= 0 or _is_awaitable(content) \
+                or _is_async_iterable(content):
+            return None
+        body = b"".join(map(to_buffer, content))
+        response.content = body
+        headers = response.headers
+        if H.ContentLength not in headers:
+            headers.add(H.ContentLength(len(body)))
+        entry = CacheEntry(response, body, self._clock() + ttl)
+        if entry.size > self.max_size:
+            return None
+        self.invalidate(key)
+        while self._entries and self.size + entry.size > self.max_size:
+            self.size -= self._entries.popitem(last=False)[1].size
+        self._entries[key] = entry
+        self.size += entry.size
+        return entry
+
+    def __call__(self, request):
+        key = self.key(request)
+        if key is None:
+            return self.handler(request)
+        entry = self.get(key)
+        if entry is not None:
+            return entry.response()
+        waiting = self._pending.get(key)
+        if waiting is not None:
+            return then(waiting, lambda entry: self._miss(key, request)
+                    if entry is None else entry.response())
+        return self._miss(key, request)
+
+    def _miss(self, key, request):
+        pending = []
+        def store(response):
+            entry = self.store(key, response)
+            if pending and not pending[0].done():
+                pending[0].set_result(entry)
+            return response if entry is None else entry.response()
+        result = then(self.handler(request), store)
+        if _is_awaitable(result):
+            waiting = asyncio.Future(loop=_future_loop(result))
+            pending.append(waiting)
+            self._pending[key] = waiting
+            result.add_done_callback(lambda f: self._done(key, waiting))
+        return result
+
+    def _done(self, key, waiting):
+        if self._pending.get(key) is waiting:
+            del self._pending[key]
+        if not waiting.done():
+            # The handler failed, waiting requests call it themselves.
+            waiting.set_result(None)
@@ -0,0 +1,521 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+HTTP client with pooled keep-alive connections.
+"""
+
+from trololio import asyncio
+from collections import deque
+from six.moves.urllib.parse import urlsplit
+from . import headers as H
+from . import status
+from .parser import ResponseParser
+from .protocol import _ensure_future, _chain, _StopAsyncIteration
+from .response import to_buffer
+
+
+# Reading from a connection is paused while this many bytes of a response
+# body are buffered and not yet consumed.
+BODY_HIGH_WATER = 256 * 1024
+
+DEFAULT_USER_AGENT = H.UserAgent("nihil")
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Requests which can be safely sent again if a pooled connection turns out
+# to have been closed by the server before answering.
+_IDEMPOTENT = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+
+
+class ClientResponse(object):
+    """
+    Response received by a :class:`Client`, with the ``version``,
+    ``code``, ``reason`` and ``headers`` of its
+    :class:`~nihil.parser.ResponseHead`.
+
+    The body is streamed: a response is an asynchronous iterable over the
+    fragments of the body as they arrive, and :meth:`read()` collects the
+    whole body. The connection goes back to the pool once the body has
+    been received; responses whose body is not going to be read must be
+    closed with :meth:`close()`.
+    """
+    def __init__(self, head, connection, loop):
+        self.version = head.version
+        self.code = head.code
+        self.reason = head.reason
+        self.headers = head.headers
+        self.keep_alive = head.keep_alive
+        self._connection = connection
+        self._loop = loop
+        self._chunks = deque()
+        self._size = 0
+        self._done = False
+        self._error = None
+        self._waiter = None
+
+    def __repr__(self):  # pragma: no cover
+        return "<ClientResponse {} {}>".format(self.code, self.reason)
+
+    def header(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def _feed(self, chunks):
+        for chunk in chunks:
+            if chunk:
+                self._chunks.append(chunk)
+                self._size += len(chunk)
+        self._wakeup()
+        return self._size
+
+    def _finish(self, error=None):
+        self._done = True
+        self._error = error
+        self._connection = None
+        self._wakeup()
+
+    def _wakeup(self):
+        waiter = self._waiter
+        if waiter is not None and (self._chunks or self._done):
+            self._waiter = None
+            if not waiter.cancelled():
+                self._next(waiter)
+
+    def _next(self, future):
+        if self._chunks:
+            chunk = self._chunks.popleft()
+            self._size -= len(chunk)
+            if self._connection is not None \
+                    and self._size < BODY_HIGH_WATER:
+                self._connection.pause_reading(False)
+            future.set_result(chunk)
+        elif self._error is not None:
+            future.set_exception(self._error)
+        else:
+            future.set_exception(_StopAsyncIteration())
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        future = asyncio.Future(loop=self._loop)
+        if self._chunks or self._done:
+            self._next(future)
+        else:
+            self._waiter = future
+        return future
+
+    def read(self):
+        """
+        Returns a future for the complete body, as bytes.
+        """
+        result = asyncio.Future(loop=self._loop)
+        parts = []
+        def step(future):
+            while True:
+                if future is not None:
+                    try:
+                        parts.append(future.result())
+                    except _StopAsyncIteration:
+                        result.set_result(b"".join(parts))
+                        return
+                    except Exception as e:
+                        result.set_exception(e)
+                        return
+                future = self.__anext__()
+                if not future.done():
+                    future.add_done_callback(step)
+                    return
+        step(None)
+        return result
+
+    def close(self):
+        """
+        Discards the rest of the body. The connection is closed if the
+        body has not been completely received.
+        """
+        connection = self._connection
+        self._chunks.clear()
+        self._size = 0
+        if not self._done:
+            self._finish()
+            if connection is not None:
+                connection.close()
+
+
+class _Connection(asyncio.Protocol):
+    """
+    Connection to a server, which sends one request at a time.
+    """
+    def __init__(self, pool, key, loop, limits):
+        self.pool = pool
+        self.key = key
+        self.transport = None
+        self.used = False
+        self.received = False
+        self.expiry = None
+        self._loop = loop
+        self._parser = ResponseParser(limits)
+        self._method = None
+        self._waiter = None
+        self._response = None
+        self._closing = False
+        self._reading_paused = False
+
+    @property
+    def open(self):
+        return self.transport is not None and not self._closing
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self._closing = True
+        try:
+            self._parser.eof()
+        except status.HTTPException as e:
+            self._fail(e)
+        else:
+            if self._waiter is not None:
+                self._fail(status.HTTPBadGateway())
+            else:
+                self._process()
+        self.pool._closed(self)
+
+    def data_received(self, data):
+        self.received = True
+        self._parser.feed(data)
+        self._process()
+
+    def pause_reading(self, pause):
+        if pause != self._reading_paused and self.transport is not None:
+            self._reading_paused = pause
+            if pause:
+                self.transport.pause_reading()
+            else:
+                self.transport.resume_reading()
+
+    def close(self):
+        self._closing = True
+        if self.transport is not None:
+            self.transport.close()
+
+    def send(self, method, head, body):
+        """
+        Writes a request, returning a future for its :class:`ClientResponse`.
+        """
+        self._method = method
+        self.received = False
+        self._waiter = asyncio.Future(loop=self._loop)
+        if body:
+            self.transport.writelines((head, body))
+        else:
+            self.transport.write(head)
+        return self._waiter
+
+    def _process(self):
+        parser = self._parser
+        try:
+            if self._waiter is not None:
+                head = parser.next_response(self._method)
+                if head is None:
+                    return
+                waiter, self._waiter = self._waiter, None
+                self._response = ClientResponse(head, self, self._loop)
+                if not waiter.cancelled():
+                    waiter.set_result(self._response)
+            response = self._response
+            if response is None:
+                return
+            if response._feed(parser.read()) >= BODY_HIGH_WATER:
+                self.pause_reading(True)
+        except status.HTTPException as e:
+            self._fail(e)
+            self.close()
+            return
+        if parser.complete:
+            self._response = None
+            self.used = True
+            response._finish()
+            self.pause_reading(False)
+            if parser.until_close or not response.keep_alive:
+                self.close()
+            elif not self._closing:
+                self.pool.release(self)
+
+    def _fail(self, error):
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_exception(error)
+        response, self._response = self._response, None
+        if response is not None:
+            response._finish(error)
+
+
+class ConnectionPool(object):
+    """
+    Keeps connections to each server (identified by scheme, host and port)
+    open to be reused by later requests.
+
+    At most `max_size` connections are opened to each server; when all of
+    them are busy, requests wait for one to be released. Idle connections
+    are closed after `idle_timeout` seconds. Connections to HTTPS servers
+    use the given `ssl` context, or the default one. Responses are parsed
+    with the given size `limits` (see :class:`~nihil.parser.Limits`).
+    """
+    def __init__(self, max_size=10, idle_timeout=30, ssl=None, limits=None,
+            loop=None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._ssl = ssl
+        self._limits = limits
+        self._loop = loop
+        self._idle = {}
+        self._count = {}
+        self._waiters = {}
+        self._closed_pool = False
+
+    def _get_loop(self):
+        return self._loop or asyncio.get_event_loop()
+
+    def connections(self, key=None):
+        """
+        Returns the amount of open connections, in total or to the server
+        identified by a ``(scheme, host, port)`` `key`.
+        """
+        if key is None:
+            return sum(self._count.values())
+        return self._count.get(key, 0)
+
+    def idle(self, key):
+        """
+        Returns the amount of idle connections to a server.
+        """
+        return len(self._idle.get(key, ()))
+
+    def acquire(self, key):
+        """
+        Returns a future for a connection to the server identified by a
+        ``(scheme, host, port)`` `key`.
+        """
+        if self._closed_pool:
+            raise ValueError("Connection pool is closed")
+        loop = self._get_loop()
+        idle = self._idle.get(key)
+        while idle:
+            connection = idle.pop()
+            connection.expiry.cancel()
+            connection.expiry = None
+            if connection.open:
+                future = asyncio.Future(loop=loop)
+                future.set_result(connection)
+                return future
+        if self._count.get(key, 0) < self.max_size:
+            return self._connect(key)
+        future = asyncio.Future(loop=loop)
+        self._waiters.setdefault(key, deque()).append(future)
+        return future
+
+    def _connect(self, key, result=None):
+        loop = self._get_loop()
+        scheme, host, port = key
+        ssl = None
+        if scheme == "https":
+            ssl = True if self._ssl is None else self._ssl
+        self._count[key] = self._count.get(key, 0) + 1
+        connected = _ensure_future(loop.create_connection(
+            lambda: _Connection(self, key, loop, self._limits), host, port,
+            ssl=ssl), loop=loop)
+        if result is None:
+            result = asyncio.Future(loop=loop)
+        def done(f):
+            if f.cancelled() or f.exception() is not None:
+                self._discount(key)
+                if result.done():
+                    pass
+                elif f.cancelled():
+                    result.cancel()
+                else:
+                    result.set_exception(f.exception())
+            elif result.done():
+                # Nobody is waiting for the connection anymore.
+                self.release(f.result()[1])
+            else:
+                result.set_result(f.result()[1])
+        connected.add_done_callback(done)
+        return result
+
+    def _waiter(self, key):
+        waiters = self._waiters.get(key)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                return waiter
+        return None
+
+    def _wakeup(self, key):
+        # A connection was closed, which leaves room for a new one.
+        if self._count.get(key, 0) < self.max_size:
+            waiter = self._waiter(key)
+            if waiter is not None:
+                self._connect(key, waiter)
+
+    def release(self, connection):
+        """
+        Returns a `connection` to the pool once a response was received.
+        """
+        if not connection.open:
+            return
+        if self._closed_pool:
+            connection.close()
+            return
+        waiter = self._waiter(connection.key)
+        if waiter is not None:
+            waiter.set_result(connection)
+            return
+        connection.expiry = self._get_loop().call_later(self.idle_timeout,
+                connection.close)
+        self._idle.setdefault(connection.key, []).append(connection)
+
+    def _closed(self, connection):
+        key = connection.key
+        idle = self._idle.get(key)
+        if idle and connection in idle:
+            idle.remove(connection)
+        if connection.expiry is not None:
+            connection.expiry.cancel()
+            connection.expiry = None
+        self._discount(key)
+
+    def _discount(self, key):
+        self._count[key] -= 1
+        if not self._count[key]:
+            del self._count[key]
+        self._wakeup(key)
+
+    def close(self):
+        """
+        Closes idle connections; busy ones are closed when released.
+        """
+        self._closed_pool = True
+        for idle in list(self._idle.values()):
+            for connection in list(idle):
+                connection.close()
+        for key in list(self._waiters):
+            waiter = self._waiter(key)
+            while waiter is not None:
+                waiter.cancel()
+                waiter = self._waiter(key)
+
+
+class Client(object):
+    """
+    Asynchronous HTTP/1.1 client.
+
+    Requests are sent over keep-alive connections taken from a
+    :class:`ConnectionPool` (a new one is created if `pool` is not given),
+    and include the given default `headers` (e.g. a
+    :class:`~nihil.headers.UserAgent` or
+    :class:`~nihil.headers.Authorization`), which can be overriden by the
+    headers passed with each request.
+
+    Idempotent requests are retried once on a new connection if a pooled
+    connection was closed by the server before answering.
+    """
+    def __init__(self, pool=None, headers=(DEFAULT_USER_AGENT,), loop=None):
+        self.pool = ConnectionPool(loop=loop) if pool is None else pool
+        self.headers = H.HeaderMap(headers)
+        self._loop = loop
+
+    def request(self, method, url, headers=(), body=None):
+        """
+        Sends a request for `url`, returning a future for the
+        :class:`ClientResponse`. The `body` may be a string or bytes.
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in _DEFAULT_PORTS or not parts.hostname:
+            raise ValueError("Unsupported URL: {}".format(url))
+        host = parts.hostname
+        port = parts.port or _DEFAULT_PORTS[scheme]
+
+        request_headers = self.headers.copy()
+        if H.Host not in request_headers:
+            name = "[{}]".format(host) if ":" in host else host
+            request_headers.set(H.Host(name,
+                None if port == _DEFAULT_PORTS[scheme] else port))
+        for header in headers:
+            request_headers.set(header)
+        if body is not None:
+            body = bytes(to_buffer(body))
+            request_headers.set(H.ContentLength(len(body)))
+        elif method in ("POST", "PUT", "PATCH"):
+            request_headers.set(H.ContentLength(0))
+
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        head = request_headers.to_bytes("{} {} HTTP/1.1\r\n".format(method,
+            target).encode("latin-1"))
+
+        loop = self._loop or asyncio.get_event_loop()
+        result = asyncio.Future(loop=loop)
+        self._send((scheme, host, port), method, head, body, result,
+                method in _IDEMPOTENT)
+        return result
+
+    def _send(self, key, method, head, body, result, retry):
+        def connected(f):
+            if f.cancelled():
+                result.cancel()
+                return
+            if f.exception() is not None:
+                if not result.done():
+                    result.set_exception(f.exception())
+                return
+            connection = f.result()
+            if result.done():
+                self.pool.release(connection)
+                return
+            reused = connection.used
+            connection.send(method, head, body).add_done_callback(
+                    lambda f: answered(connection, reused, f))
+
+        def answered(connection, reused, f):
+            if result.cancelled():
+                if not f.cancelled() and f.exception() is None:
+                    f.result().close()
+                return
+            if f.exception() is not None and retry and reused \
+                    and not connection.received:
+                self._send(key, method, head, body, result, False)
+            else:
+                _chain(f, result)
+
+        self.pool.acquire(key).add_done_callback(connected)
+
+    def get(self, url, headers=()):
+        return self.request("GET", url, headers)
+
+    def head(self, url, headers=()):
+        return self.request("HEAD", url, headers)
+
+    def post(self, url, body=b"", headers=()):
+        return self.request("POST", url, headers, body)
+
+    def put(self, url, body=b"", headers=()):
+        return self.request("PUT", url, headers, body)
+
+    def delete(self, url, headers=()):
+        return self.request("DELETE", url, headers)
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,173 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Response compression.
+"""
+
+from . import headers as H
+from .protocol import then, map_chunks, _is_async_iterable, _is_awaitable
+from .response import Response, to_buffer
+import zlib
+
+
+# Content types which are worth compressing, in addition to text/* and
+# the +json and +xml suffixes. Other types (images, video, archives) are
+# usually compressed already.
+COMPRESSIBLE_TYPES = frozenset((
+    "application/atom+xml",
+    "application/ecmascript",
+    "application/javascript",
+    "application/json",
+    "application/rss+xml",
+    "application/x-javascript",
+    "application/xhtml+xml",
+    "application/xml",
+    "image/svg+xml",
+))
+
+# Window bits passed to zlib.compressobj() for each content coding.
+_WBITS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS,
+}
+
+
+def compressible(content_type):
+    """
+    Checks whether a response with the given
+    :class:`~nihil.headers.ContentType` header is worth compressing.
+    """
+    if content_type is None:
+        return False
+    mime = content_type.string_value.partition(";")[0].strip().lower()
+    return mime.startswith("text/") \
+        or mime in COMPRESSIBLE_TYPES \
+        or mime.endswith("+json") \
+        or mime.endswith("+xml")
+
+
+def negotiate(accept_encoding):
+    """
+    Picks the content coding to use given the
+    :class:`~nihil.headers.AcceptEncoding` header of a request (which may
+    be ``None``). Returns ``"gzip"``, ``"deflate"``, or ``None``.
+    """
+    if accept_encoding is None:
+        return None
+    best, best_q = None, 0.0
+    for coding in ("gzip", "deflate"):
+        q = accept_encoding.qvalue(coding)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _compressor(coding, level):
+    return zlib.compressobj(level, zlib.DEFLATED, _WBITS[coding])
+
+
+def _compress_chunks(content, coding, level):
+    compressor = _compressor(coding, level)
+    if _is_async_iterable(content):
+        # Chunks of asynchronous bodies are flushed as they arrive, so
+        # streamed data is not held back.
+        func = lambda chunk: compressor.compress(chunk) \
+                + compressor.flush(zlib.Z_SYNC_FLUSH)
+    else:
+        func = compressor.compress
+    return map_chunks(content, func, compressor.flush)
+
+
+def _add_vary(headers):
+    vary = headers.get(H.Vary)
+    if vary is not None:
+        tokens = [t.strip().lower() for t in vary.string_value.split(",")]
+        if "accept-encoding" in tokens or "*" in tokens:
+            return
+    headers.add(H.Vary("Accept-Encoding"))
+
+
+def _derive(response, content, headers):
+    result = Response(content, headers)
+    result.code = response.code
+    result.title = response.title
+    result.reason = response.reason
+    result.trailers = response.trailers
+    return result
+
+
+def compress_response(request, response, level=6, min_size=1024):
+    """
+    Compresses the body of a `response` to a `request`, if the client
+    accepts a content coding supported by the server and the response is
+    worth compressing: its content type is :func:`compressible`, it is
+    not compressed already nor partial, and its body is at least
+    `min_size` bytes long (when the size is known in advance).
+
+    Bodies whose size is known (strings and sequences) are compressed at
+    once and get an updated ``Content-Length``. Iterators and asynchronous
+    iterables are compressed incrementally while they are being sent, and
+    awaitable bodies are left as they are.
+
+    Responses may be sent more than once, so the given one is not
+    modified: a new response is returned when headers or body change.
+    """
+    headers = response.headers
+    if response.code < 200 or response.code in (204, 206, 304) \
+            or H.ContentEncoding in headers \
+            or H.ContentRange in headers \
+            or not compressible(headers.get(H.ContentType)):
+        return response
+
+    headers = headers.copy()
+    _add_vary(headers)
+    content = response.content
+    coding = negotiate(request.header(H.AcceptEncoding))
+    if coding is None or _is_awaitable(content):
+        return _derive(response, content, headers)
+    length = headers.get(H.ContentLength)
+    if length is not None and length.value < min_size:
+        return _derive(response, content, headers)
+
+    if hasattr(content, "__len__") and not _is_async_iterable(content):
+        data = b"".join(map(to_buffer, content))
+        if len(data) < min_size:
+            return _derive(response, content, headers)
+        compressor = _compressor(coding, level)
+        content = compressor.compress(data) + compressor.flush()
+        headers.add(H.ContentLength(len(content)))
+    else:
+        content = _compress_chunks(content, coding, level)
+        headers.pop(H.ContentLength)
+
+    etag = headers.get(H.ETag)
+    if etag is not None:
+        # The compressed body is a different representation, so it cannot
+        # share a strong entity tag with the uncompressed one.
+        headers.add(etag.weaken())
+    # Byte ranges would refer to offsets in the uncompressed body.
+    headers.pop(H.AcceptRanges)
+    headers.add(H.ContentEncoding(coding))
+    return _derive(response, content, headers)
+
+
+class Compressor(object):
+    """
+    Wraps a `handler`, compressing its responses with
+    :func:`compress_response`.
+    """
+    def __init__(self, handler, level=6, min_size=1024):
+        self.handler = handler
+        self.level = level
+        self.min_size = min_size
+
+    def __call__(self, request):
+        return then(self.handler(request), lambda response:
+                compress_response(request, response, self.level,
+                    self.min_size))
@@ -0,0 +1,183 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Conditional requests.
+"""
+
+from . import headers as H
+from . import status
+from .protocol import then, map_chunks, _is_awaitable, _is_async_iterable
+from .response import to_buffer
+from collections import OrderedDict
+
+
+# Headers of a response which are sent along with a 304 Not Modified.
+NOT_MODIFIED_HEADERS = (H.ETag, H.LastModified, H.Vary, "Cache-Control",
+        "Content-Location", "Expires", "Date")
+
+
+def not_modified(request, response):
+    """
+    Checks the ``If-None-Match`` and ``If-Modified-Since`` headers of a
+    `request` against the validators of a `response`. Returns ``True`` if
+    the client has a fresh copy, and a 304 Not Modified can be sent.
+    """
+    if request.method not in ("GET", "HEAD") \
+            or response.code not in (200, 206):
+        return False
+    headers = response.headers
+    if_none_match = request.header(H.IfNoneMatch)
+    if if_none_match is not None:
+        return if_none_match.matches(headers.get(H.ETag))
+    if_modified_since = request.header(H.IfModifiedSince)
+    if if_modified_since is not None:
+        last_modified = headers.get(H.LastModified)
+        return last_modified is not None \
+            and last_modified.value is not None \
+            and if_modified_since.value is not None \
+            and last_modified.value <= if_modified_since.value
+    return False
+
+
+def not_modified_response(response):
+    """
+    Creates a 304 Not Modified reply for a `response`, including the
+    relevant headers from it.
+    """
+    headers = response.headers
+    return status.HTTPNotModified(headers=[h for h in
+        (headers.get(name) for name in NOT_MODIFIED_HEADERS)
+        if h is not None])
+
+
+def _digest():
+    import hashlib
+    return hashlib.sha1()
+
+
+def compute_etag(buffers):
+    """
+    Returns a strong :class:`~nihil.headers.ETag` for a body made of a
+    sequence of `buffers`.
+    """
+    digest = _digest()
+    for buf in buffers:
+        digest.update(buf)
+    return H.ETag(digest.hexdigest())
+
+
+class ETagCache(object):
+    """
+    Remembers the entity tags computed for up to `max_entries` resources,
+    evicting the least recently used ones. Each tag is stored along with a
+    version (the ``Last-Modified`` value of the response, if any), and is
+    only used for responses with the same version.
+    """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, version=None):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._entries[key] = entry
+        return entry[1] if entry[0] == version else None
+
+    def set(self, key, etag, version=None):
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.max_entries:
+            self._entries.popitem(last=False)
+        self._entries[key] = (version, etag)
+
+    def invalidate(self, key):
+        """
+        Forgets the tag for the resource `key`, which must be done when its
+        content changes without a change in its ``Last-Modified`` date.
+        """
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class ConditionalGet(object):
+    """
+    Wraps a `handler`, replying to conditional ``GET`` and ``HEAD``
+    requests with 304 Not Modified when the validators of the response
+    (``ETag`` and ``Last-Modified`` headers) show that the client has a
+    fresh copy. The body of the response is not produced at all then.
+
+    Responses without an ``ETag`` whose body is of known size get a strong
+    one computed from it. When an `etag_cache` is given, tags are computed
+    as well for streamed bodies, incrementally while they are sent, and
+    remembered per resource (its request URI) so later streamed responses
+    for the same resource carry them in their headers. Cached tags are
+    updated when the body turns out to be different, but the application
+    must :meth:`ETagCache.invalidate` resources which change without a
+    change in their ``Last-Modified`` date to avoid replying with stale
+    304s. The cache is not used for bodies of known size, whose tag is
+    always computed.
+    """
+    def __init__(self, handler, etag_cache=None):
+        self.handler = handler
+        self.etag_cache = etag_cache
+
+    def __call__(self, request):
+        return then(self.handler(request), lambda response:
+                self.check(request, response))
+
+    def check(self, request, response):
+        """
+        Returns the reply to `request`: either the `response`, or a 304
+        Not Modified for it.
+        """
+        if request.method not in ("GET", "HEAD") \
+                or response.code not in (200, 206):
+            return response
+        headers = response.headers
+        cache = self.etag_cache
+        compute = H.ETag not in headers and response.code == 200
+        if compute and cache is not None:
+            key, version = request.uri, headers.get(H.LastModified)
+            if version is not None:
+                version = version.string_value
+
+        content = response.content
+        streamed = _is_awaitable(content) or _is_async_iterable(content) \
+                or not hasattr(content, "__len__")
+        if compute and not streamed:
+            # The body is at hand, so its tag is always computed: a cached
+            # one could be stale.
+            buffers = [b for b in map(to_buffer, content) if b]
+            response.content = buffers
+            etag = compute_etag(buffers)
+            headers.add(etag)
+            if cache is not None:
+                cache.set(key, etag, version)
+        elif compute and cache is not None:
+            etag = cache.get(key, version)
+            if etag is not None:
+                headers.add(etag)
+        if not_modified(request, response):
+            return not_modified_response(response)
+
+        if compute and streamed and cache is not None \
+                and not _is_awaitable(content):
+            digest = _digest()
+            def update(chunk):
+                digest.update(chunk)
+                return chunk
+            def finish():
+                cache.set(key, H.ETag(digest.hexdigest()), version)
+            response.content = map_chunks(content, update, finish)
+        return response
@@ -0,0 +1,309 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Static file responses.
+"""
+
+from . import headers as H
+from . import status
+from .response import Response
+from collections import OrderedDict
+from binascii import hexlify
+import errno
+import stat
+import time
+import os
+
+
+# Size of the buffers produced when a file is not sent using sendfile(),
+# small enough to let write backpressure kick in between them.
+FILE_CHUNK_SIZE = 256 * 1024
+
+# Requests for more ranges than this (after merging overlapping ones) are
+# answered with the complete file.
+MAX_RANGES = 16
+
+_content_types = {}
+
+
+def guess_content_type(path):
+    """
+    Returns a :class:`~nihil.headers.ContentType` header for a file, based
+    on its name. Unknown and compressed files are sent as
+    ``application/octet-stream``.
+    """
+    import mimetypes
+    mime, encoding = mimetypes.guess_type(path)
+    if mime is None or encoding is not None:
+        mime = "application/octet-stream"
+    header = _content_types.get(mime)
+    if header is None:
+        header = _content_types[mime] = H.ContentType(mime)
+    return header
+
+
+def _identity(st):
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+
+
+class OpenFile(object):
+    """
+    A file opened by a :class:`FileCache`, along with its ``stat`` result.
+    The file is closed once neither the cache nor any response use it.
+    """
+    __slots__ = ("path", "file", "stat", "checked", "_map", "_validators")
+
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._validators = None
+        self.file = None
+        self.file = open(path, "rb", 0)
+        try:
+            self.stat = os.fstat(self.file.fileno())
+            if not stat.S_ISREG(self.stat.st_mode):
+                raise IOError(errno.EACCES, "Not a regular file", path)
+        except Exception:
+            self.close()
+            raise
+        self.checked = time.time()
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # Still in use, gets closed when collected.
+            self._map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @property
+    def validators(self):
+        """
+        The :class:`~nihil.headers.ETag` and
+        :class:`~nihil.headers.LastModified` headers for the file, derived
+        from its ``stat`` result.
+        """
+        if self._validators is None:
+            st = self.stat
+            self._validators = (H.ETag("{:x}-{:x}-{:x}".format(st.st_ino,
+                st.st_size, int(st.st_mtime * 1000000))),
+                H.LastModified(st.st_mtime))
+        return self._validators
+
+    def chunks(self, start, stop):
+        """
+        Yields the contents of the file from offset `start` up to `stop`
+        in buffers of up to :data:`FILE_CHUNK_SIZE` bytes. The file is
+        mapped in memory, so the buffers do not copy its contents.
+        """
+        if start >= stop:
+            return
+        if self._map is None:
+            import mmap
+            try:
+                self._map = mmap.mmap(self.file.fileno(), 0,
+                        access=mmap.ACCESS_READ)
+            except (ValueError, EnvironmentError):
+                for chunk in self._read_chunks(start, stop):
+                    yield chunk
+                return
+        try:
+            data = memoryview(self._map)
+        except TypeError:
+            data = self._map  # Python 2: slicing copies.
+        for offset in range(start, stop, FILE_CHUNK_SIZE):
+            yield data[offset:min(offset + FILE_CHUNK_SIZE, stop)]
+
+    def _read_chunks(self, start, stop):
+        fd = self.file.fileno()
+        while start < stop:
+            # Seek on each read: other responses may be using the file.
+            os.lseek(fd, start, os.SEEK_SET)
+            chunk = os.read(fd, min(FILE_CHUNK_SIZE, stop - start))
+            if not chunk:
+                raise IOError(errno.EIO, "File truncated", self.path)
+            start += len(chunk)
+            yield chunk
+
+
+class FileCache(object):
+    """
+    Keeps up to `max_entries` files open along with their ``stat`` results,
+    evicting the least recently used ones. Cached files are checked against
+    the file system at most once every `ttl` seconds, so changes to them
+    are picked up.
+    """
+    def __init__(self, max_entries=128, ttl=2.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        return path in self._entries
+
+    def clear(self):
+        self._entries.clear()
+
+    def open(self, path):
+        """
+        Returns an :class:`OpenFile` for `path`. Raises
+        ``EnvironmentError`` if the file cannot be opened.
+        """
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            now = time.time()
+            if now - entry.checked >= self.ttl:
+                if _identity(os.stat(path)) != _identity(entry.stat):
+                    entry = None
+                else:
+                    entry.checked = now
+        if entry is None:
+            entry = OpenFile(path)
+            while len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+        self._entries[path] = entry
+        return entry
+
+default_cache = FileCache()
+
+
+class _FileBody(object):
+    """
+    Body of a :class:`FileResponse`. Each part is either a buffer or a
+    ``(start, stop)`` range of the file.
+    """
+    __slots__ = ("entry", "parts")
+
+    def __init__(self, entry, parts):
+        self.entry = entry
+        self.parts = parts
+
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, tuple):
+                for chunk in self.entry.chunks(*part):
+                    yield chunk
+            else:
+                yield part
+
+    def sendfile_parts(self):
+        """
+        Yields the parts of the body as buffers and ``(file, offset,
+        count)`` tuples, which :class:`~nihil.protocol.HTTPProtocol` sends
+        using ``loop.sendfile()`` when possible.
+        """
+        for part in self.parts:
+            if isinstance(part, tuple):
+                start, stop = part
+                if start < stop:
+                    yield (self.entry.file, start, stop - start)
+            else:
+                yield part
+
+
+class FileResponse(Response):
+    """
+    Response which sends the file at `path`, without reading it into
+    Python strings: :class:`~nihil.protocol.HTTPProtocol` sends it with
+    ``sendfile()`` on plain sockets, and otherwise the file is mapped in
+    memory. Open files and their ``stat`` results are kept in a
+    :class:`FileCache` (by default, :data:`default_cache`). ``ETag`` and
+    ``Last-Modified`` headers are derived from the ``stat`` results, so
+    :class:`~nihil.conditional.ConditionalGet` can reply to conditional
+    requests without sending the file.
+
+    When the `request` is given, its ``Range`` header is honored, replying
+    with :class:`~nihil.status.HTTPPartialContent` (using a
+    ``multipart/byteranges`` body for multiple ranges), or raising
+    :class:`~nihil.status.HTTPRequestRangeNotSatisfiable`. Ranges are
+    ignored if an ``If-Range`` header does not match the validators of the
+    file. Missing files
+    raise :class:`~nihil.status.HTTPNotFound`, and files which cannot be
+    read :class:`~nihil.status.HTTPForbidden`.
+    """
+    def __init__(self, path, request=None, content_type=None, headers=(),
+            cache=None):
+        if cache is None:
+            cache = default_cache
+        try:
+            entry = cache.open(path)
+        except EnvironmentError as e:
+            if e.errno in (errno.EACCES, errno.EPERM):
+                raise status.HTTPForbidden()
+            raise status.HTTPNotFound()
+
+        if content_type is None:
+            content_type = guess_content_type(path)
+        elif not isinstance(content_type, H.Header):
+            content_type = H.ContentType(content_type)
+
+        size = entry.stat.st_size
+        ranges = None
+        if request is not None and request.method in ("GET", "HEAD"):
+            range_header = request.header(H.Range)
+            if_range = request.header(H.IfRange)
+            if if_range is not None and not if_range.matches(
+                    *entry.validators):
+                # The file changed since the client got the first part.
+                range_header = None
+            if range_header is not None:
+                ranges = range_header.ranges(size)
+                if ranges is not None and len(ranges) > MAX_RANGES:
+                    ranges = None
+        if ranges is not None and not ranges:
+            raise status.HTTPRequestRangeNotSatisfiable(
+                    headers=(H.ContentRange(size),))
+
+        Response.__init__(self, (), headers)
+        self.entry = entry
+        self.headers.add(H.AcceptRanges.BYTES)
+        self.headers.update(entry.validators)
+        if ranges is None:
+            parts = [(0, size)]
+            self.headers.add(content_type)
+        else:
+            self._set_status(status.HTTPPartialContent)
+            if len(ranges) == 1:
+                parts = ranges
+                self.headers.add(content_type)
+                self.headers.add(H.ContentRange(ranges[0][0],
+                    ranges[0][1], size))
+            else:
+                parts = self._multipart(ranges, size, content_type)
+        self.headers.add(H.ContentLength(sum(
+            part[1] - part[0] if isinstance(part, tuple) else len(part)
+            for part in parts)))
+        self.content = _FileBody(entry, parts)
+
+    def _set_status(self, cls):
+        self.code = cls.code
+        self.title = cls.title
+        self.reason = cls.reason
+
+    def _multipart(self, ranges, size, content_type):
+        boundary = hexlify(os.urandom(12)).decode("ascii")
+        self.headers.add(H.ContentType(
+            "multipart/byteranges; boundary=" + boundary))
+        parts = []
+        for start, stop in ranges:
+            parts.append("\r\n--{}\r\n{}{}\r\n".format(boundary,
+                content_type, H.ContentRange(start, stop, size))
+                .encode("latin-1"))
+            parts.append((start, stop))
+        parts.append("\r\n--{}--\r\n".format(boundary).encode("latin-1"))
+        return parts
@@ -10,20 +10,125 @@
 Utilities to work with HTTP headers.
 """
 
-from six import string_types
+from six import string_types, integer_types, add_metaclass, PY3
 from functools import total_ordering
+import time
+
+
+if PY3:  # pragma: no cover
+    _encode = lambda s: s.encode("latin-1")
+else:  # pragma: no cover
+    _encode = lambda s: s
+
+
+# Maps lowercase header names to their Header subclasses.
+registry = {}
+
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+           "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def http_date(timestamp):
+    """
+    Formats a `timestamp` (seconds since the epoch) as an HTTP date, e.g.
+    ``Sun, 06 Nov 1994 08:49:37 GMT``.
+    """
+    t = time.gmtime(timestamp)
+    return "{}, {:02d} {} {:04d} {:02d}:{:02d}:{:02d} GMT".format(
+            _WEEKDAYS[t.tm_wday], t.tm_mday, _MONTHS[t.tm_mon - 1],
+            t.tm_year, t.tm_hour, t.tm_min, t.tm_sec)
+
+
+def _days_from_civil(year, month, day):
+    # Days since 1970-01-01 in the proleptic Gregorian calendar.
+    year -= month <= 2
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    return era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 719468
+
+
+def parse_http_date(value):
+    """
+    Parses an HTTP date and returns it as seconds since the epoch, or
+    ``None`` if the date is not valid. The obsolete RFC 850 and asctime()
+    formats are accepted as well.
+    """
+    parts = value.split()
+    try:
+        if len(parts) == 6 and parts[5] == "GMT":
+            hour, minute, second = map(int, parts[4].split(":"))
+            days = _days_from_civil(int(parts[3]),
+                    _MONTHS.index(parts[2]) + 1, int(parts[1]))
+            return ((days * 24 + hour) * 60 + minute) * 60 + second
+    except ValueError:
+        return None
+    from email.utils import parsedate_tz, mktime_tz
+    parsed = parsedate_tz(value)
+    return None if parsed is None else mktime_tz(parsed)
+
+
+class _HeaderMeta(type):
+    """
+    Registers classes which define a header `name` in the :data:`registry`.
+    """
+    def __init__(cls, name, bases, namespace):
+        super(_HeaderMeta, cls).__init__(name, bases, namespace)
+        header_name = namespace.get("name")
+        if isinstance(header_name, str):
+            registry[header_name.lower()] = cls
+
+
+def lookup(name):
+    """
+    Returns the :class:`Header` subclass for a header `name` (compared
+    case-insensitively), or ``None`` if there is no class for it.
+    """
+    return registry.get(name.lower())
+
+
+def parse_header(name, value):
+    """
+    Creates a header object from a `name` and `value` as read from the wire.
+    The value is converted using the ``from_string()`` method of the class
+    registered for the name, and headers without a registered class or for
+    which the value cannot be converted are returned as a
+    :class:`CustomHeader`.
+    """
+    cls = registry.get(name.lower())
+    if cls is not None:
+        try:
+            return cls.from_string(value)
+        except ValueError:
+            pass
+    return CustomHeader(name, value)
 
 
 @total_ordering
+@add_metaclass(_HeaderMeta)
 class Header(object):
     # Name of the header, e.g. Content-Type
     name = None
     single_value = False
 
-    __slots__ = ("_value",)
+    __slots__ = ("_value", "_encoded")
 
     def __init__(self, value):
         self._value = value
+        self._encoded = None
+
+    @classmethod
+    def from_string(cls, value):
+        """
+        Creates a header from its `value` as read from the wire. Subclasses
+        may defer converting the value until it is used.
+        """
+        return cls(value)
+
+    @property
+    def value(self):
+        return self._value
 
     def __repr__(self):  # pragma: no cover
         return "<Header:{} {!r}>".format(self.name, self.string_value)
@@ -31,6 +136,16 @@ class Header(object):
     def __str__(self):
         return "{}: {}\r\n".format(self.name, self.string_value)
 
+    def to_bytes(self):
+        """
+        Returns the header line encoded as bytes, ready to be written to
+        the wire. The encoded line is cached, so repeatedly sending the same
+        header object (e.g. ``ContentType.TEXT_HTML``) does no formatting.
+        """
+        if self._encoded is None:
+            self._encoded = _encode(str(self))
+        return self._encoded
+
     @property
     def string_value(self):
         return str(self._value)
@@ -39,12 +154,12 @@ class Header(object):
         if isinstance(other, string_types):
             return self.string_value == other
         return self.__class__ is other.__class__ \
-           and self._value == other._value
+           and self.value == other.value
 
     def __lt__(self, other):
         assert isinstance(other, Header)
         return self.name < other.name \
-            or self._value < other._value
+            or self.value < other.value
 
     def __iadd__(self, other):
         if isinstance(other, string_types):
@@ -54,6 +169,7 @@ class Header(object):
         else:
             raise ValueError(other)
         self._value = "{}, {}".format(self.string_value, append_value)
+        self._encoded = None
         return self
 
 
@@ -73,6 +189,19 @@ class _NumericHeader(Header):
     def __init__(self, value):
         super(_NumericHeader, self).__init__(int(value))
 
+    @classmethod
+    def from_string(cls, value):
+        # Keep the string, it gets converted the first time it is read.
+        header = cls.__new__(cls)
+        Header.__init__(header, value)
+        return header
+
+    @property
+    def value(self):
+        if not isinstance(self._value, integer_types):
+            self._value = int(self._value)
+        return self._value
+
 
 class _EnumHeader(Header):
     values = ()
@@ -84,6 +213,10 @@ class _EnumHeader(Header):
             raise ValueError(value)
         super(_EnumHeader, self).__init__(value)
 
+    @classmethod
+    def from_string(cls, value):
+        return cls(value.lower())
+
     @property
     def string_value(self):
         return self.values[self._value]
@@ -112,6 +245,17 @@ Connection.KEEP_ALIVE \
     = map(Connection, range(len(Connection.values)))
 
 
+class TransferEncoding(_StringHeader):
+    name = "Transfer-Encoding"
+
+TransferEncoding.CHUNKED = TransferEncoding("chunked")
+
+
+class Allow(_StringHeader):
+    name = "Allow"
+    single_value = True
+
+
 class Host(_StringHeader):
     name = "Host"
 
@@ -134,6 +278,34 @@ class Accept(_StringHeader):
     name = "Accept"
 
 
+class AcceptEncoding(_StringHeader):
+    name = "Accept-Encoding"
+
+    def qvalue(self, coding):
+        """
+        Returns the quality value given to a content `coding` (e.g. "gzip"),
+        taking ``*`` into account. Zero means that the coding is not
+        acceptable.
+        """
+        coding = coding.lower()
+        star = None
+        for item in self.string_value.split(","):
+            token, _, params = item.partition(";")
+            token = token.strip().lower()
+            q = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            if token == coding:
+                return q
+            if token == "*":
+                star = q
+        return 0.0 if star is None else star
+
+
 class Authorization(_StringHeader):
     name = "Authorization"
 
@@ -143,6 +315,11 @@ class Authorization(_StringHeader):
         super(Authorization, self).__init__(payload)
         self.__set_method(method)
 
+    @classmethod
+    def from_string(cls, value):
+        method, _, payload = value.partition(" ")
+        return cls(method, payload.lstrip())
+
     @property
     def string_value(self):
         return "{} {}".format(self._method, self._value)
@@ -151,12 +328,14 @@ class Authorization(_StringHeader):
         return self._method
     def __set_method(self, value):
         self._method = str(value)
+        self._encoded = None
     method = property(__get_method, __set_method, doc="Authentication method")
 
     def __get_payload(self):
         return self._value
     def __set_payload(self, value):
         self._value = str(value)
+        self._encoded = None
     payload = property(__get_payload, __set_payload,
             doc="Authentication method payload")
 
@@ -174,6 +353,14 @@ class WWWAuthenticate(_StringHeader):
         super(WWWAuthenticate, self).__init__(realm)
         self.__set_method(method)
 
+    @classmethod
+    def from_string(cls, value):
+        method, _, realm = value.partition(" ")
+        realm = realm.lstrip()
+        if realm.startswith("realm="):
+            realm = realm[6:]
+        return cls(method, realm)
+
     @property
     def string_value(self):
         return "{} realm={}".format(self._method, self._value)
@@ -182,12 +369,14 @@ class WWWAuthenticate(_StringHeader):
         return self._method
     def __set_method(self, value):
         self._method = str(value)
+        self._encoded = None
     method = property(__get_method, __set_method, doc="Authentication method")
 
     def __get_realm(self):
         return self._value
     def __set_realm(self, value):
         self._value = str(value)
+        self._encoded = None
     realm = property(__get_realm, __set_realm, doc="Authentication realm")
 
 
@@ -197,3 +386,373 @@ class ProxyAuthenticate(WWWAuthenticate):
 
 class Location(_StringHeader):
     name = "Location"
+
+
+class ContentEncoding(_StringHeader):
+    name = "Content-Encoding"
+    single_value = True
+
+
+class Vary(_StringHeader):
+    name = "Vary"
+
+
+class AcceptRanges(_StringHeader):
+    name = "Accept-Ranges"
+    single_value = True
+
+AcceptRanges.BYTES = AcceptRanges("bytes")
+AcceptRanges.NONE = AcceptRanges("none")
+
+
+class Range(_StringHeader):
+    name = "Range"
+    single_value = True
+
+    def ranges(self, size):
+        """
+        Returns the byte ranges requested for a resource of `size` bytes, as
+        a sorted list of ``(start, stop)`` tuples (``stop`` is exclusive),
+        with overlapping and adjacent ranges merged. Unsatisfiable ranges
+        are skipped, so the list is empty if none can be satisfied. ``None``
+        is returned if the header is not a valid byte range set, in which
+        case it should be ignored.
+        """
+        unit, _, spec = self.string_value.partition("=")
+        if unit.strip().lower() != "bytes":
+            return None
+        result = []
+        for item in spec.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            first, dash, last = item.partition("-")
+            first, last = first.strip(), last.strip()
+            if not dash or not (first or last) \
+                    or not (first.isdigit() or not first) \
+                    or not (last.isdigit() or not last):
+                return None
+            try:
+                if first:
+                    start = int(first)
+                    stop = int(last) + 1 if last else size
+                    if last and stop <= start:
+                        return None
+                else:
+                    start, stop = size - int(last), size
+            except ValueError:
+                return None
+            start, stop = max(start, 0), min(stop, size)
+            if start < stop:
+                result.append((start, stop))
+        if not result and not spec.strip():
+            return None
+        result.sort()
+        merged = result[:1]
+        for start, stop in result[1:]:
+            if start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(stop, merged[-1][1]))
+            else:
+                merged.append((start, stop))
+        return merged
+
+
+class ContentRange(_StringHeader):
+    name = "Content-Range"
+    single_value = True
+
+    def __init__(self, start, stop=None, size=None):
+        if stop is None:
+            # Only the complete length, for unsatisfiable ranges.
+            value = "bytes */{}".format(int(start))
+        else:
+            value = "bytes {}-{}/{}".format(int(start), int(stop) - 1,
+                    int(size))
+        super(ContentRange, self).__init__(value)
+
+    @classmethod
+    def from_string(cls, value):
+        header = cls.__new__(cls)
+        Header.__init__(header, value)
+        return header
+
+
+class RetryAfter(_StringHeader):
+    name = "Retry-After"
+    single_value = True
+
+    def __init__(self, delay):
+        # Fractions of a second are rounded up.
+        delay = int(delay) + (delay > int(delay))
+        super(RetryAfter, self).__init__(str(delay))
+
+    @classmethod
+    def from_string(cls, value):
+        # May be a date as well, keep the value as-is.
+        header = cls.__new__(cls)
+        Header.__init__(header, value)
+        return header
+
+
+class _DateHeader(Header):
+    single_value = True
+
+    def __init__(self, timestamp):
+        super(_DateHeader, self).__init__(int(timestamp))
+
+    @classmethod
+    def from_string(cls, value):
+        # Keep the string, it gets parsed the first time it is read.
+        header = cls.__new__(cls)
+        Header.__init__(header, value)
+        return header
+
+    @property
+    def value(self):
+        """
+        The date as seconds since the epoch, or ``None`` if the header
+        value is not a valid date.
+        """
+        if isinstance(self._value, string_types):
+            timestamp = parse_http_date(self._value)
+            if timestamp is None:
+                return None
+            self._value = timestamp
+        return self._value
+
+    @property
+    def string_value(self):
+        if isinstance(self._value, string_types):
+            return self._value
+        return http_date(self._value)
+
+
+class LastModified(_DateHeader):
+    name = "Last-Modified"
+
+
+class IfModifiedSince(_DateHeader):
+    name = "If-Modified-Since"
+
+
+class ETag(_StringHeader):
+    name = "ETag"
+    single_value = True
+
+    def __init__(self, tag, weak=False):
+        super(ETag, self).__init__('{}"{}"'.format("W/" if weak else "",
+            tag))
+
+    @classmethod
+    def from_string(cls, value):
+        header = cls.__new__(cls)
+        Header.__init__(header, value.strip())
+        return header
+
+    @property
+    def weak(self):
+        return self.string_value.startswith("W/")
+
+    @property
+    def opaque_tag(self):
+        """
+        The quoted tag, without the weakness indicator.
+        """
+        value = self.string_value
+        return value[2:] if value.startswith("W/") else value
+
+    def weaken(self):
+        """
+        Returns a weak version of the entity tag.
+        """
+        if self.weak:
+            return self
+        return ETag.from_string("W/" + self.string_value)
+
+
+class IfNoneMatch(_StringHeader):
+    name = "If-None-Match"
+
+    def matches(self, etag):
+        """
+        Checks whether an :class:`ETag` (which may be ``None`` when the
+        resource does not have one) is listed, using weak comparison.
+        """
+        value = self.string_value.strip()
+        if value == "*":
+            return True
+        if etag is None:
+            return False
+        tag = etag.opaque_tag
+        start = value.find('"')
+        while start >= 0:
+            end = value.find('"', start + 1)
+            if end < 0:
+                break
+            if value[start:end + 1] == tag:
+                return True
+            start = value.find('"', end + 1)
+        return False
+
+
+class IfRange(_StringHeader):
+    name = "If-Range"
+    single_value = True
+
+    def matches(self, etag, last_modified):
+        """
+        Checks whether the validator in the header matches the current
+        :class:`ETag` or :class:`LastModified` header of a resource (either
+        may be ``None``). Entity tags use strong comparison, so weak tags
+        never match, and dates must be exactly the same.
+        """
+        value = self.string_value.strip()
+        if value.startswith('"') or value.startswith("W/"):
+            return etag is not None and not etag.weak \
+                    and value == etag.string_value
+        if last_modified is None:
+            return False
+        timestamp = parse_http_date(value)
+        return timestamp is not None and timestamp == last_modified.value
+
+
+def _key(name):
+    if isinstance(name, type):
+        name = name.name
+    return name.lower()
+
+
+class HeaderMap(object):
+    """
+    Ordered collection of headers, indexed by their case-insensitive names.
+
+    Adding a header for which :attr:`Header.single_value` is set replaces
+    the existing one, if any; otherwise the new value is appended to the
+    existing header as done by ``+=``. Headers can be looked up using either
+    their name or their :class:`Header` subclass.
+
+    Copies made with :meth:`copy()` share their contents with the original
+    until one of them is modified, so deriving a map from another with a
+    few more headers is cheap. The header block rendered by
+    :meth:`to_bytes()` is kept until the map is modified, and shared by
+    copies as well; therefore headers must not be modified in place once
+    added to a map.
+    """
+    __slots__ = ("_headers", "_index", "_shared", "_encoded")
+
+    def __init__(self, headers=()):
+        self._headers = []
+        self._index = {}
+        self._shared = False
+        self._encoded = None
+        for h in headers:
+            self.add(h)
+
+    def __repr__(self):  # pragma: no cover
+        return "<HeaderMap {!r}>".format(self._headers)
+
+    def __len__(self):
+        return len(self._headers)
+
+    def __iter__(self):
+        return iter(self._headers)
+
+    def __contains__(self, name):
+        return _key(name) in self._index
+
+    def __getitem__(self, name):
+        return self._headers[self._index[_key(name)]]
+
+    def get(self, name, default=None):
+        index = self._index.get(_key(name))
+        return default if index is None else self._headers[index]
+
+    def _unshare(self):
+        self._encoded = None
+        if self._shared:
+            self._headers = list(self._headers)
+            self._index = dict(self._index)
+            self._shared = False
+
+    def add(self, header):
+        """
+        Adds a `header`, replacing or combining it with an existing header
+        of the same name as indicated by :attr:`Header.single_value`.
+        """
+        self._unshare()
+        key = header.name.lower()
+        index = self._index.get(key)
+        if index is None:
+            self._index[key] = len(self._headers)
+            self._headers.append(header)
+        elif header.single_value:
+            self._headers[index] = header
+        else:
+            # Header objects may be shared, combine into a copy.
+            from copy import copy
+            combined = copy(self._headers[index])
+            combined += header.string_value
+            self._headers[index] = combined
+
+    def set(self, header):
+        """
+        Adds a `header`, replacing any existing header of the same name.
+        """
+        self._unshare()
+        key = header.name.lower()
+        index = self._index.get(key)
+        if index is None:
+            self._index[key] = len(self._headers)
+            self._headers.append(header)
+        else:
+            self._headers[index] = header
+
+    def update(self, headers):
+        for h in headers:
+            self.add(h)
+
+    def __delitem__(self, name):
+        self._unshare()
+        del self._headers[self._index.pop(_key(name))]
+        self._index = dict((h.name.lower(), i)
+                for (i, h) in enumerate(self._headers))
+
+    def pop(self, name, default=None):
+        header = self.get(name)
+        if header is None:
+            return default
+        del self[name]
+        return header
+
+    def copy(self):
+        """
+        Returns a copy of the map, which shares its contents with the
+        original until one of them is modified.
+        """
+        result = self.__class__.__new__(self.__class__)
+        result._headers = self._headers
+        result._index = self._index
+        result._shared = self._shared = True
+        result._encoded = self._encoded
+        return result
+
+    def derive(self, *headers):
+        """
+        Returns a copy of the map with additional `headers` added.
+        """
+        result = self.copy()
+        result.update(headers)
+        return result
+
+    def to_bytes(self, status_line=b""):
+        """
+        Returns the header block, including the empty line which ends it
+        and optionally preceded by a `status_line`, as a bytes object.
+        """
+        encoded = self._encoded
+        if encoded is not None and encoded[0] == status_line:
+            return encoded[1]
+        data = b"".join([status_line]
+                + [h.to_bytes() for h in self._headers] + [b"\r\n"])
+        self._encoded = (status_line, data)
+        return data
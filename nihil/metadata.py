@@ -6,25 +6,47 @@
 #
 # Distributed under terms of the GPLv3 license.
 
-from codecs import open
-from textwrap import dedent
-from email import parser, message
 from os import path
-from re import match
 
 
-class Metadata(message.Message, object):
+class Metadata(object):
+    """
+    Package metadata, read from a file in RFC 822 format. The file is only
+    read and parsed (and the ``email`` package imported) on first use.
+    """
     @staticmethod
     def get_author_field(name, field):
+        from re import match
         return match(r"^([^<]+)\s+<([^>]*)>$", name).group(field)
     @staticmethod
     def get_multiline(content):
         return [line.strip() for line in content.splitlines() if line]
     @staticmethod
     def get_sub_keyed(content):
-        m = parser.Parser().parsestr(content.strip())
+        from email import parser
+        from textwrap import dedent
+        m = parser.Parser().parsestr(dedent(content).strip())
         return dict((k, Metadata.get_multiline(m[k])) for k in m.keys())
 
+    def __init__(self, filename):
+        self.filename = filename
+        self._message = None
+
+    @property
+    def message(self):
+        if self._message is None:
+            from codecs import open
+            from email import parser
+            with open(self.filename, "r", encoding="utf-8") as f:
+                self._message = parser.Parser().parse(f)
+        return self._message
+
+    def __getitem__(self, name):
+        return self.message[name]
+
+    def get(self, name, default=None):
+        return self.message.get(name, default)
+
     description = property(lambda self: self["Description"])
     version = property(lambda self: self["Version"])
     package = property(lambda self: self["Package"])
@@ -37,7 +59,7 @@ class Metadata(message.Message, object):
     test_requirements = property(lambda self:
             self.get_multiline(self.get("Test-Requirements", "")))
     extra_requirements = property(lambda self:
-            self.get_sub_keyed(dedent(self.get("Extra-Requirements", ""))))
+            self.get_sub_keyed(self.get("Extra-Requirements", "")))
     entry_points = property(lambda self:
             self.get_multiline(self.get("Scripts", "")))
     requirements = property(lambda self:
@@ -48,8 +70,4 @@ class Metadata(message.Message, object):
             self.get_multiline(self.get("Authors", "")))
 
 
-def metadata():
-    with open(path.join(path.dirname(__file__), "META"), "rU",
-            encoding="utf-8") as f:
-        return parser.Parser(Metadata).parse(f)
-metadata = metadata()
+metadata = Metadata(path.join(path.dirname(__file__), "META"))
@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Request timing and response status metrics.
+"""
+
+from . import headers as H
+from .response import Response
+from array import array
+from bisect import bisect_left
+import time
+
+
+_clock = getattr(time, "perf_counter", time.time)
+
+# Upper bounds, in seconds, of the latency histogram buckets. Values above
+# the last one are counted in an additional overflow bucket.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+        0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stages of handling a request which are timed.
+STAGES = ("parse", "route", "handler", "write", "total")
+
+# Status codes are counted in slots indexed by code; codes out of range
+# are counted in slot 0.
+_MAX_CODE = 600
+
+_STATUS_CLASSES = (
+    (1, "informational"),
+    (2, "success"),
+    (3, "redirect"),
+    (4, "client_error"),
+    (5, "server_error"),
+)
+
+
+class Histogram(object):
+    """
+    Histogram with fixed buckets with the given upper `bounds`. Counts
+    are kept in a preallocated array, so observing a value does not
+    allocate memory.
+    """
+    __slots__ = ("bounds", "counts", "total")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = array("d", sorted(bounds))
+        self.counts = array("L", [0]) * (len(self.bounds) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def cumulative(self):
+        """
+        Returns a list of ``(bound, count)`` tuples with the amount of
+        values less or equal than each bound, the last bound being
+        infinity.
+        """
+        result, count = [], 0
+        for bound, n in zip(tuple(self.bounds) + (float("inf"),),
+                self.counts):
+            count += n
+            result.append((bound, count))
+        return result
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.total = 0.0
+
+
+class Metrics(object):
+    """
+    Collects response counts by status code, and latency histograms for
+    each of the :data:`STAGES` of handling a request.
+
+    A metrics object can be passed to :class:`~nihil.protocol.HTTPProtocol`,
+    which times parsing, handlers (from the moment a request is parsed
+    until its response is available), writing responses, and their total,
+    and to :class:`~nihil.routing.Router`, which times routing. Subclasses
+    may override :meth:`observe()` and :meth:`count()` to get notified
+    of each measurement.
+
+    The collected metrics are rendered as plain text by :meth:`render()`,
+    and can be served by using the object as a handler.
+    """
+    _clock = staticmethod(_clock)
+
+    def __init__(self, buckets=LATENCY_BUCKETS, prefix="nihil"):
+        self.prefix = prefix
+        self.statuses = array("L", [0]) * _MAX_CODE
+        self.histograms = dict((stage, Histogram(buckets))
+                for stage in STAGES)
+
+    def observe(self, stage, seconds):
+        """
+        Adds a measurement of `seconds` for a `stage`.
+        """
+        self.histograms[stage].observe(seconds)
+
+    def count(self, code):
+        """
+        Counts a response with the given status `code`.
+        """
+        self.statuses[code if 0 < code < _MAX_CODE else 0] += 1
+
+    def status_counts(self):
+        """
+        Returns a dictionary which maps status codes to the amount of
+        responses sent with them.
+        """
+        return dict((code, n) for code, n in enumerate(self.statuses) if n)
+
+    def class_counts(self):
+        """
+        Returns a dictionary which maps status code classes (``"success"``,
+        ``"client_error"``, etc.) to the amount of responses in them.
+        """
+        counts = dict((name, 0) for _, name in _STATUS_CLASSES)
+        for code, n in self.status_counts().items():
+            for digit, name in _STATUS_CLASSES:
+                if code // 100 == digit:
+                    counts[name] += n
+        return counts
+
+    def reset(self):
+        for i in range(_MAX_CODE):
+            self.statuses[i] = 0
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    def render(self):
+        """
+        Returns the metrics in the plain text exposition format used by
+        Prometheus.
+        """
+        prefix = self.prefix
+        lines = ["# TYPE {}_responses_total counter".format(prefix)]
+        for code, n in sorted(self.status_counts().items()):
+            lines.append('{}_responses_total{{code="{}"}} {}'.format(
+                prefix, code or "other", n))
+        lines.append("# TYPE {}_responses_class_total counter".format(
+            prefix))
+        counts = self.class_counts()
+        for _, name in _STATUS_CLASSES:
+            lines.append('{}_responses_class_total{{class="{}"}} {}'.format(
+                prefix, name, counts[name]))
+        lines.append("# TYPE {}_latency_seconds histogram".format(prefix))
+        for stage in STAGES:
+            histogram = self.histograms[stage]
+            for bound, n in histogram.cumulative():
+                lines.append('{}_latency_seconds_bucket{{stage="{}",'
+                        'le="{}"}} {}'.format(prefix, stage,
+                            "+Inf" if bound == float("inf") else repr(bound),
+                            n))
+            lines.append('{}_latency_seconds_sum{{stage="{}"}} {!r}'.format(
+                prefix, stage, histogram.total))
+            lines.append('{}_latency_seconds_count{{stage="{}"}} {}'.format(
+                prefix, stage, histogram.count))
+        lines.append("")
+        return "\n".join(lines)
+
+    def __call__(self, request, **kw):
+        return Response(self.render(), (H.ContentType.TEXT_PLAIN,))
@@ -0,0 +1,182 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Running blocking handlers outside of the event loop.
+"""
+
+from trololio import asyncio
+from functools import partial, wraps
+from importlib import import_module
+from types import FunctionType
+from . import headers as H
+from . import status
+from .protocol import then, _is_awaitable, _is_async_iterable, \
+        _StopAsyncIteration
+from .response import Response
+
+
+_END = object()
+
+
+class _ExecutorIterator(object):
+    """
+    Asynchronous iterator which produces each chunk of a (blocking)
+    iterator by calling ``next()`` on it in the executor of a `pool`.
+    """
+    def __init__(self, iterator, pool):
+        self._iterator = iterator
+        self._pool = pool
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return then(self._pool._run(next, self._iterator, _END),
+                self._chunk)
+
+    @staticmethod
+    def _chunk(chunk):
+        if chunk is _END:
+            raise _StopAsyncIteration()
+        return chunk
+
+
+class _HandlerRef(object):
+    """
+    Picklable reference to a handler decorated with
+    :meth:`HandlerPool.blocking`, which is looked up by name when called.
+    Functions are pickled by name, and the name of a decorated function
+    refers to the decorator instead, so they cannot be sent to processes
+    directly.
+    """
+    __slots__ = ("module", "name")
+
+    def __init__(self, handler):
+        self.module = handler.__module__
+        self.name = getattr(handler, "__qualname__", handler.__name__)
+
+    def __getstate__(self):
+        return (self.module, self.name)
+
+    def __setstate__(self, state):
+        self.module, self.name = state
+
+    def __call__(self, *arg, **kw):
+        handler = import_module(self.module)
+        for name in self.name.split("."):
+            handler = getattr(handler, name)
+        return getattr(handler, "__wrapped__", handler)(*arg, **kw)
+
+
+class HandlerPool(object):
+    """
+    Runs blocking handlers in an executor: a ``ThreadPoolExecutor`` with
+    `max_workers` threads, or a ``ProcessPoolExecutor`` when `processes`
+    is set. An existing `executor` may be passed instead, along with the
+    amount of `max_workers` it has.
+
+    Up to `max_queue` calls may wait for a worker once all of them are
+    busy; after that, requests are rejected with
+    :class:`~nihil.status.HTTPServiceUnavailable`, asking clients to retry
+    after `retry_after` seconds, instead of queueing without bounds.
+
+    Response bodies produced by iterators are consumed in the executor as
+    well, one chunk at a time, and sent as they arrive; those calls count
+    towards the capacity of the pool too. With processes, handlers must be
+    importable by name (for example module level functions, decorated or
+    not), and requests and responses must be picklable, so bodies must be
+    strings or sequences.
+    """
+    def __init__(self, max_workers=None, max_queue=0, processes=False,
+            executor=None, retry_after=1, loop=None):
+        if max_workers is None:
+            if executor is not None:
+                raise ValueError("max_workers is needed with an executor")
+            from multiprocessing import cpu_count
+            max_workers = cpu_count() if processes \
+                    else min(32, cpu_count() + 4)
+        if executor is None:
+            if processes:
+                from concurrent.futures import ProcessPoolExecutor
+                executor = ProcessPoolExecutor(max_workers)
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+                executor = ThreadPoolExecutor(max_workers)
+        self.executor = executor
+        self.capacity = max_workers + max_queue
+        self.retry_after = retry_after
+        self.processes = processes
+        self.pending = 0
+        self._loop = loop
+
+    def _call_done(self, future):
+        self.pending -= 1
+
+    def _run(self, func, *args):
+        loop = self._loop or asyncio.get_event_loop()
+        future = loop.run_in_executor(self.executor, func, *args)
+        self.pending += 1
+        future.add_done_callback(self._call_done)
+        return future
+
+    def submit(self, func, *args):
+        """
+        Calls ``func(*args)`` in the executor, returning a future for its
+        result. Raises :class:`~nihil.status.HTTPServiceUnavailable` if the
+        pool is saturated.
+        """
+        if self.pending >= self.capacity:
+            raise status.HTTPServiceUnavailable(
+                    headers=(H.RetryAfter(self.retry_after),))
+        return self._run(func, *args)
+
+    def _stream(self, response):
+        if isinstance(response, Response) and not self.processes:
+            content = response.content
+            if not (hasattr(content, "__len__") or _is_awaitable(content)
+                    or _is_async_iterable(content)):
+                response.content = _ExecutorIterator(iter(content), self)
+        return response
+
+    def blocking(self, handler):
+        """
+        Decorates a blocking `handler` to be run in the pool.
+        """
+        func = handler
+        if self.processes and isinstance(handler, FunctionType):
+            func = _HandlerRef(handler)
+
+        @wraps(handler)
+        def blocking_handler(request, *arg, **kw):
+            if arg or kw:
+                future = self.submit(partial(func, request, *arg, **kw))
+            else:
+                future = self.submit(func, request)
+            return then(future, self._stream)
+        blocking_handler.__wrapped__ = handler
+        return blocking_handler
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait)
+
+
+_default_pool = None
+
+
+def blocking(handler):
+    """
+    Decorates a blocking `handler` to be run in a default
+    :class:`HandlerPool` of threads, which is created on first use.
+    """
+    def blocking_handler(request, *arg, **kw):
+        global _default_pool
+        if _default_pool is None:
+            _default_pool = HandlerPool()
+        return _default_pool.blocking(handler)(request, *arg, **kw)
+    return wraps(handler)(blocking_handler)
@@ -0,0 +1,435 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Incremental HTTP request and response parsers.
+"""
+
+from six import PY3
+from . import headers as H
+from . import status
+from .request import Request, _persistent
+import sys
+
+
+if PY3:  # pragma: no cover
+    _decode = lambda view: str(view, "latin-1")
+else:  # pragma: no cover
+    _decode = lambda view: view.tobytes()
+
+
+def _release(view):
+    if hasattr(view, "release"):  # pragma: no cover
+        view.release()
+
+
+# Parser states.
+_START_LINE, _HEADERS, _BODY, \
+_CHUNK_SIZE, _CHUNK_DATA, _CHUNK_END, _TRAILERS = range(7)
+
+_DIGITS = frozenset("0123456789")
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+
+_LINE_STATES = frozenset((_START_LINE, _HEADERS, _CHUNK_SIZE, _CHUNK_END,
+    _TRAILERS))
+
+
+class Limits(object):
+    """
+    Size limits, in bytes, for the requests accepted by a
+    :class:`RequestParser`:
+
+    - `request_line`: length of the request line. Longer ones are answered
+      with 414 Request-URI Too Long.
+    - `header`: length of each header line. Longer lines, too many header
+      lines (over `headers`), or a request head larger than `header_bytes`
+      are answered with 431 Request Header Fields Too Large.
+    - `body`: size of the request body. Larger bodies are answered with
+      413 Request Entity Too Large, before reading them.
+
+    Any of them may be ``None`` to disable it. A :class:`ResponseParser`
+    applies the same limits to responses, raising
+    :class:`~nihil.status.HTTPBadGateway` instead.
+    """
+    def __init__(self, request_line=8190, header=8190, headers=100,
+            header_bytes=64 * 1024, body=8 * 1024 * 1024):
+        self.request_line = request_line
+        self.header = header
+        self.headers = headers
+        self.header_bytes = header_bytes
+        self.body = body
+
+default_limits = Limits()
+
+# Response bodies are not buffered by the parser, so their size is not
+# limited by default.
+default_response_limits = Limits(body=None)
+
+
+def _limit(value):
+    return sys.maxsize if value is None else value
+
+
+class _MessageParser(object):
+    """
+    Parsing of the parts of HTTP/1.x messages shared by requests and
+    responses. Subclasses handle the start line and completed messages.
+    """
+    def __init__(self, limits):
+        self._max_request_line = _limit(limits.request_line)
+        self._max_header = _limit(limits.header)
+        self._max_headers = _limit(limits.headers)
+        self._max_header_bytes = _limit(limits.header_bytes)
+        self._max_body = _limit(limits.body)
+        self._buffer = bytearray()
+        self._pos = 0
+        self._scan = 0
+        self._reset()
+
+    def _reset(self):
+        self._state = _START_LINE
+        self._headers = H.HeaderMap()
+        self._header_count = 0
+        self._header_bytes = 0
+        self._body = []
+        self._body_size = 0
+        self._remaining = 0
+
+    @property
+    def buffered(self):
+        """Amount of bytes buffered and not yet consumed."""
+        return len(self._buffer) - self._pos
+
+    @property
+    def idle(self):
+        """Whether no part of a message has been received."""
+        return self._state == _START_LINE and not self.buffered
+
+    @property
+    def reading_body(self):
+        """Whether the head of a message has been parsed, but not its body."""
+        return self._state not in (_START_LINE, _HEADERS)
+
+    def feed(self, data):
+        """
+        Appends `data` to the parser buffer.
+        """
+        if self._pos:
+            del self._buffer[:self._pos]
+            self._scan -= self._pos
+            self._pos = 0
+        self._buffer.extend(data)
+
+    def _parse(self, view):
+        buf = self._buffer
+        while True:
+            if self._state in _LINE_STATES:
+                end = buf.find(b"\r\n", self._scan)
+                if end < 0:
+                    self._scan = max(self._pos, len(buf) - 1)
+                    self._check_line(len(buf) - self._pos)
+                    return None
+                self._check_line(end - self._pos)
+                line = _decode(view[self._pos:end])
+                self._pos = self._scan = end + 2
+                if self._line_received(line):
+                    return self._complete()
+            else:
+                available = len(buf) - self._pos
+                if available == 0:
+                    return None
+                size = min(available, self._remaining)
+                self._body.append(view[self._pos:self._pos + size].tobytes())
+                self._pos = self._scan = self._pos + size
+                self._remaining -= size
+                if self._remaining == 0:
+                    if self._state == _BODY:
+                        return self._complete()
+                    self._state = _CHUNK_END
+
+    def _check_line(self, length):
+        state = self._state
+        if state == _START_LINE:
+            if length > self._max_request_line:
+                raise status.HTTPRequestURITooLong()
+        elif state == _HEADERS or state == _TRAILERS:
+            if length > self._max_header \
+                    or self._header_bytes + length > self._max_header_bytes:
+                raise status.HTTPRequestHeaderFieldsTooLarge()
+        elif length > self._max_header:
+            raise status.HTTPBadRequest()
+
+    def _line_received(self, line):
+        state = self._state
+        if state == _START_LINE:
+            if line:
+                self._start_line_received(line)
+        elif state == _HEADERS:
+            if line:
+                self._header_line_received(line)
+            else:
+                return self._headers_complete()
+        elif state == _CHUNK_SIZE:
+            size = line.partition(";")[0].strip()
+            if not size or not _HEX_DIGITS.issuperset(size):
+                raise status.HTTPBadRequest()
+            self._remaining = int(size, 16)
+            self._body_size += self._remaining
+            if self._body_size > self._max_body:
+                raise status.HTTPRequestEntityTooLarge()
+            self._state = _CHUNK_DATA if self._remaining else _TRAILERS
+        elif state == _CHUNK_END:
+            if line:
+                raise status.HTTPBadRequest()
+            self._state = _CHUNK_SIZE
+        elif state == _TRAILERS:
+            if not line:
+                return True
+            self._header_line_received(line)
+        return False
+
+    def _header_line_received(self, line):
+        if line[0] in " \t":
+            # Obsolete line folding is not supported (RFC 7230, 3.2.4).
+            raise status.HTTPBadRequest()
+        self._header_count += 1
+        self._header_bytes += len(line) + 2
+        if self._header_count > self._max_headers:
+            raise status.HTTPRequestHeaderFieldsTooLarge()
+        name, sep, value = line.partition(":")
+        if not sep or not name or name[-1] in " \t":
+            raise status.HTTPBadRequest()
+        header = H.parse_header(name, value.strip())
+        if isinstance(header, H.ContentLength):
+            # The map keeps only one of them, and picking either one when
+            # they differ allows smuggling requests.
+            previous = self._headers.get(H.ContentLength)
+            if previous is not None \
+                    and previous.string_value != header.string_value:
+                raise status.HTTPBadRequest()
+        self._headers.add(header)
+
+    def _headers_complete(self):
+        transfer_encoding = self._headers.get("Transfer-Encoding")
+        content_length = self._headers.get(H.ContentLength)
+
+        if transfer_encoding is not None:
+            codings = transfer_encoding.string_value.lower().split(",")
+            if codings[-1].strip() != "chunked":
+                raise status.HTTPBadRequest()
+            self._state = _CHUNK_SIZE
+        elif content_length is not None:
+            value = content_length.string_value
+            if not value or not _DIGITS.issuperset(value):
+                raise status.HTTPBadRequest()
+            self._remaining = int(value)
+            if self._remaining > self._max_body:
+                raise status.HTTPRequestEntityTooLarge()
+            self._state = _BODY if self._remaining else _START_LINE
+            return self._remaining == 0
+        else:
+            return True
+        return False
+
+
+class RequestParser(_MessageParser):
+    """
+    Incremental HTTP/1.x request parser.
+
+    Data is passed to :meth:`feed()` in fragments of any size as they
+    arrive (e.g. from ``Protocol.data_received()``), and complete requests
+    are retrieved with :meth:`next_request()`. The parser keeps track of
+    how far the buffered data has been scanned, so each fragment is only
+    looked at once, and lines are decoded straight from ``memoryview``
+    slices of the buffer without intermediate copies.
+
+    Malformed requests are reported by raising the corresponding
+    :class:`~nihil.status.HTTPException`; the parser must not be used
+    after that. This includes requests over the size `limits` (by default,
+    :data:`default_limits`), which are checked while data arrives, so an
+    oversized request line or header is rejected before it is buffered
+    completely.
+    """
+    def __init__(self, limits=None):
+        super(RequestParser, self).__init__(
+                default_limits if limits is None else limits)
+
+    def _reset(self):
+        super(RequestParser, self)._reset()
+        self._request = None
+
+    def next_request(self):
+        """
+        Returns the next complete :class:`~nihil.request.Request`, or
+        ``None`` if more data is needed.
+        """
+        view = memoryview(self._buffer)
+        try:
+            return self._parse(view)
+        finally:
+            _release(view)
+
+    def _start_line_received(self, line):
+        try:
+            method, uri, version = line.split(" ")
+        except ValueError:
+            raise status.HTTPBadRequest()
+        if not method or not uri:
+            raise status.HTTPBadRequest()
+        if not version.startswith("HTTP/1."):
+            raise status.HTTPVersionNotSupported()
+        self._request = Request(method, uri, version)
+        self._state = _HEADERS
+
+    def _complete(self):
+        request = self._request
+        request.headers = self._headers
+        request.body = b"".join(self._body)
+        self._reset()
+        return request
+
+
+class ResponseHead(object):
+    """
+    Status line and headers of a HTTP response received from a server.
+    """
+    __slots__ = ("version", "code", "reason", "headers")
+
+    def __init__(self, version, code, reason, headers=()):
+        self.version = version
+        self.code = code
+        self.reason = reason
+        if not isinstance(headers, H.HeaderMap):
+            headers = H.HeaderMap(headers)
+        self.headers = headers
+
+    def __repr__(self):  # pragma: no cover
+        return "<ResponseHead {} {} {}>".format(self.version, self.code,
+                self.reason)
+
+    def header(self, name, default=None):
+        return self.headers.get(name, default)
+
+    @property
+    def keep_alive(self):
+        """
+        Whether the server allows reusing the connection for more requests.
+        """
+        return _persistent(self.version, self.headers)
+
+
+class ResponseParser(_MessageParser):
+    """
+    Incremental HTTP/1.x response parser.
+
+    Data is passed to :meth:`feed()` as it arrives, like with
+    :class:`RequestParser`, but response bodies are not buffered: once
+    :meth:`next_response()` has returned the head of a response, its body
+    is retrieved in fragments with :meth:`read()` until :attr:`complete`
+    is true, and only then the next response can be parsed. Bodies which
+    are delimited by the end of the connection are completed by calling
+    :meth:`eof()`.
+
+    Malformed responses, and responses over the size `limits` (by default,
+    :data:`default_response_limits`) raise
+    :class:`~nihil.status.HTTPBadGateway`.
+    """
+    def __init__(self, limits=None):
+        super(ResponseParser, self).__init__(
+                default_response_limits if limits is None else limits)
+
+    def _reset(self):
+        super(ResponseParser, self)._reset()
+        self._head = None
+        self._method = None
+        self._complete_body = False
+        self.until_close = False
+
+    @property
+    def complete(self):
+        """Whether the whole body of the current response was parsed."""
+        return self._complete_body
+
+    def _run(self):
+        view = memoryview(self._buffer)
+        try:
+            return self._parse(view)
+        except status.HTTPException:
+            raise status.HTTPBadGateway()
+        finally:
+            _release(view)
+
+    def next_response(self, method="GET"):
+        """
+        Returns the :class:`ResponseHead` of the next response, to a request
+        made with the given `method`, or ``None`` if more data is needed.
+        Interim (1xx) responses are skipped.
+        """
+        if self._head is not None:
+            if not self._complete_body:
+                raise ValueError("Body of the previous response not read")
+            self._reset()
+        while True:
+            self._method = method
+            head = self._run()
+            if head is None or head.code >= 200:
+                return head
+            self._reset()
+
+    def read(self):
+        """
+        Returns a list with the fragments of the body of the current
+        response received since the last call.
+        """
+        if self._head is not None and not self._complete_body:
+            self._run()
+        body, self._body = self._body, []
+        return body
+
+    def eof(self):
+        """
+        Signals that the connection has been closed, which completes
+        bodies delimited by the end of the connection. Raises
+        :class:`~nihil.status.HTTPBadGateway` if a response was left
+        incomplete.
+        """
+        if self.until_close:
+            self._complete_body = True
+        elif not (self.idle or self._complete_body):
+            raise status.HTTPBadGateway()
+
+    def _start_line_received(self, line):
+        version, _, rest = line.partition(" ")
+        code, _, reason = rest.partition(" ")
+        if not version.startswith("HTTP/1.") or len(code) != 3 \
+                or not code.isdigit():
+            raise status.HTTPBadGateway()
+        self._head = ResponseHead(version, int(code), reason)
+        self._state = _HEADERS
+
+    def _headers_complete(self):
+        code = self._head.code
+        if self._method == "HEAD" or code < 200 or code in (204, 304):
+            self._state = _START_LINE
+        elif "Transfer-Encoding" in self._headers \
+                or H.ContentLength in self._headers:
+            super(ResponseParser, self)._headers_complete()
+        else:
+            self.until_close = True
+            self._state = _BODY
+            self._remaining = sys.maxsize
+        return True
+
+    def _complete(self):
+        if self._head.headers is not self._headers:
+            # Head received, the body (if any) follows.
+            self._head.headers = self._headers
+            self._complete_body = self._state == _START_LINE
+            return self._head
+        self._complete_body = True
+        return None
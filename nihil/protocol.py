@@ -0,0 +1,668 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+HTTP protocol implementation for asyncio.
+"""
+
+from trololio import asyncio
+from six import text_type
+from six.moves import builtins
+from collections import deque
+from . import headers as H
+from . import status
+from .parser import RequestParser
+from .response import to_buffer
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+
+_ensure_future = getattr(asyncio, "ensure_future", None) \
+        or getattr(asyncio, "async")
+_StopAsyncIteration = getattr(builtins, "StopAsyncIteration", StopIteration)
+
+# Maximum amount of pipelined requests handled at the same time on a
+# connection by default.
+PIPELINE_DEPTH = 8
+
+# Amount of body data collected from synchronous iterables before handing
+# it over to the transport.
+WRITE_BATCH_SIZE = 64 * 1024
+
+
+def _is_awaitable(obj):
+    # Generators are not checked with asyncio.iscoroutine() because they
+    # are valid response bodies; generator based coroutines must be wrapped
+    # with ensure_future() to be used as bodies.
+    return isinstance(obj, asyncio.Future) or hasattr(obj, "__await__")
+
+
+def _is_async_iterable(obj):
+    return hasattr(obj, "__aiter__")
+
+
+def _future_loop(future):
+    get_loop = getattr(future, "get_loop", None)
+    return future._loop if get_loop is None else get_loop()
+
+
+def _chain(future, outer):
+    # Copies the outcome of a future into another.
+    def done(f):
+        if outer.done():
+            return
+        if f.cancelled():
+            outer.cancel()
+        elif f.exception() is not None:
+            outer.set_exception(f.exception())
+        else:
+            outer.set_result(f.result())
+    future.add_done_callback(done)
+
+
+def then(result, func, loop=None):
+    """
+    Calls `func` with `result` and returns its return value. If `result`
+    is awaitable (e.g. it was returned by an asynchronous handler), `func`
+    is called once its value is available, and a future for the value
+    returned by `func` is returned instead. This allows wrapping handlers
+    regardless of whether they return responses or awaitables.
+    """
+    if not (_is_awaitable(result) or asyncio.iscoroutine(result)):
+        return func(result)
+
+    future = _ensure_future(result, loop=loop)
+    outer = asyncio.Future(loop=_future_loop(future))
+    def done(f):
+        if outer.done():
+            return
+        if f.cancelled():
+            outer.cancel()
+            return
+        try:
+            value = func(f.result())
+        except Exception as e:
+            outer.set_exception(e)
+            return
+        if _is_awaitable(value) or asyncio.iscoroutine(value):
+            _chain(_ensure_future(value, loop=_future_loop(outer)), outer)
+        else:
+            outer.set_result(value)
+    future.add_done_callback(done)
+    return outer
+
+
+def _buffer_size(b):
+    if isinstance(b, memoryview):
+        return len(b) * b.itemsize
+    return len(b)
+
+
+def _chunk_size_line(size):
+    return "{:x}\r\n".format(size).encode("ascii")
+
+
+def _map_iter(iterable, func, finish):
+    for chunk in iterable:
+        chunk = func(to_buffer(chunk))
+        if chunk:
+            yield chunk
+    if finish is not None:
+        chunk = finish()
+        if chunk:
+            yield chunk
+
+
+class _MappedAsyncIterator(object):
+    def __init__(self, iterable, func, finish):
+        self._iterator = iterable.__aiter__()
+        self._func = func
+        self._finish = finish
+        self._loop = None
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        if self._iterator is None:
+            future = asyncio.Future(loop=self._loop)
+            future.set_exception(_StopAsyncIteration())
+            return future
+        inner = _ensure_future(self._iterator.__anext__(), loop=self._loop)
+        self._loop = _future_loop(inner)
+        outer = asyncio.Future(loop=self._loop)
+        def done(f):
+            if f.cancelled():
+                outer.cancel()
+            elif isinstance(f.exception(), _StopAsyncIteration):
+                self._iterator = None
+                chunk = None if self._finish is None else self._finish()
+                if chunk:
+                    outer.set_result(chunk)
+                else:
+                    outer.set_exception(f.exception())
+            elif f.exception() is not None:
+                outer.set_exception(f.exception())
+            else:
+                outer.set_result(self._func(to_buffer(f.result())))
+        inner.add_done_callback(done)
+        return outer
+
+
+def map_chunks(iterable, func, finish=None):
+    """
+    Returns a body which passes each chunk produced by `iterable` (after
+    converting it with :func:`~nihil.response.to_buffer`) through `func`.
+    Once `iterable` is exhausted `finish` is called, if given, and the
+    buffer it returns (if any) is sent as the last chunk. Asynchronous
+    iterables result in an asynchronous iterable.
+    """
+    if _is_async_iterable(iterable):
+        return _MappedAsyncIterator(iterable, func, finish)
+    return _map_iter(iterable, func, finish)
+
+
+def _response_has_body(response):
+    return response.code >= 200 and response.code not in (204, 304)
+
+
+class HTTPProtocol(asyncio.Protocol):
+    """
+    Serves the HTTP/1.x requests arriving through a connection.
+
+    The `handler` is called with a :class:`~nihil.request.Request` and must
+    return a :class:`~nihil.response.Response` (or an awaitable which
+    results in one), or raise an :class:`~nihil.status.HTTPException`.
+    Connections are kept open after each response unless the client or the
+    response asks otherwise using the ``Connection`` header.
+
+    Response bodies are written as they are produced, and producing them
+    is suspended while the transport write buffer is above its high-water
+    mark, which may be set with `high_water`. Streamed bodies (iterators
+    and asynchronous iterables) without a ``Content-Length`` are sent using
+    chunked transfer encoding to HTTP/1.1 clients; small chunks produced
+    by synchronous iterators are coalesced into chunks of up to
+    :data:`WRITE_BATCH_SIZE` bytes. Bodies which have a
+    ``sendfile_parts()`` method (see :class:`~nihil.files.FileResponse`)
+    are sent using ``loop.sendfile()`` on plain socket transports.
+
+    If a `limiter` (see :class:`~nihil.ratelimit.RateLimiter`) is given,
+    a token is taken for the client address before parsing each request.
+    When the client is over the limit it gets a 429 Too Many Requests
+    reply, and the connection is closed without reading the request.
+
+    Connection `timeouts` may be given as a
+    :class:`~nihil.timeouts.Timeouts` object. A single timer is used for
+    each connection, and moved along as the connection goes through the
+    phases of idling, reading a request, and waiting for the handler.
+    Size `limits` for requests are passed to the
+    :class:`~nihil.parser.RequestParser`.
+
+    Pipelined requests are parsed as soon as they arrive, and up to
+    `pipeline` of them (by default, :data:`PIPELINE_DEPTH`) are passed to
+    the handler without waiting for the responses to the previous ones.
+    Responses are always written in the same order as the requests were
+    received. Reading from the transport is paused while the queue is
+    full.
+
+    Response status codes and the time spent parsing requests, in the
+    handler, and writing responses are recorded in `metrics`, if given
+    (see :class:`~nihil.metrics.Metrics`).
+    """
+    def __init__(self, handler, loop=None, high_water=None, limiter=None,
+            timeouts=None, limits=None, pipeline=PIPELINE_DEPTH,
+            metrics=None):
+        if pipeline < 1:
+            raise ValueError("pipeline must be at least 1")
+        self.handler = handler
+        self.transport = None
+        self._loop = loop
+        self._high_water = high_water
+        self._limiter = limiter
+        self._timeouts = timeouts
+        self._phase = None
+        self._timer = None
+        self._client = None
+        self._admitted = False
+        self._parser = RequestParser(limits)
+        self._closing = False
+        self._processing = False
+        self._depth = pipeline
+        self._queue = deque()
+        self._last = False
+        self._reading_paused = False
+        self._busy = False
+        self._keep_alive = False
+        self._chunked = False
+        self._response = None
+        self._paused = False
+        self._resume = None
+        self._pending = set()
+        self._metrics = metrics
+        self._parse_time = 0.0
+        self._started = None
+        self._write_started = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        peername = transport.get_extra_info("peername")
+        if isinstance(peername, tuple):
+            self._client = peername[0]
+        else:
+            self._client = peername
+        self._set_phase("idle")
+        if self._high_water is not None:
+            transport.set_write_buffer_limits(high=self._high_water)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self._closing = True
+        self._resume = None
+        self._set_phase(None)
+        self._queue.clear()
+        self._cancel_pending()
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+        resume, self._resume = self._resume, None
+        if resume is not None:
+            resume()
+
+    def data_received(self, data):
+        if self._closing or self._last:
+            return
+        self._parser.feed(data)
+        self._process()
+
+    def _set_phase(self, phase, restart=False):
+        timeouts = self._timeouts
+        if timeouts is None or (phase == self._phase and not restart):
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._phase = phase
+        delay = None if phase is None else getattr(timeouts, phase)
+        if delay is not None:
+            self._timer = timeouts.wheel.schedule(delay, self._timed_out)
+
+    def _reading(self):
+        # Waiting for the next request, or for more of the current one.
+        if self._parser.idle:
+            self._set_phase("idle")
+        elif self._parser.reading_body:
+            self._set_phase("body", restart=True)
+        else:
+            self._set_phase("header")
+
+    def _timed_out(self):
+        phase, self._phase, self._timer = self._phase, None, None
+        if self._closing or self.transport is None:
+            return
+        if phase == "idle":
+            self._abort()
+            return
+        self._closing = True
+        if phase == "handler":
+            self._queue.clear()
+            self._cancel_pending()
+            self.send_response(None, status.HTTPGatewayTimeout())
+        else:
+            self.send_response(None, status.HTTPRequestTimeout())
+
+    def _process(self):
+        if self._processing:
+            return
+        self._processing = True
+        try:
+            while not self._closing:
+                queue = self._queue
+                if not self._busy and queue and queue[0][1] is not None:
+                    request, response, self._started = queue.popleft()
+                    self.send_response(request, response)
+                    continue
+                if self._last or len(queue) >= self._depth:
+                    break
+                if self._limiter is not None and not self._admitted:
+                    if not self._parser.buffered:
+                        self._wait_request()
+                        break
+                    rejection = self._limiter.check(self._client)
+                    if rejection is not None:
+                        self._last = True
+                        queue.append((None, rejection, None))
+                        continue
+                    self._admitted = True
+                try:
+                    request = self._next_request()
+                except status.HTTPException as e:
+                    self._last = True
+                    queue.append((None, e, None))
+                    continue
+                if request is None:
+                    self._wait_request()
+                    break
+                self._admitted = False
+                if not request.keep_alive:
+                    # The connection is closed after this one.
+                    self._last = True
+                self.handle_request(request)
+            if not self._closing:
+                if self._queue and not self._busy:
+                    self._set_phase("handler")
+                self._pause_reading(len(self._queue) >= self._depth)
+        finally:
+            self._processing = False
+
+    def _next_request(self):
+        metrics = self._metrics
+        if metrics is None:
+            return self._parser.next_request()
+        # Requests may be parsed over several calls as data arrives.
+        start = metrics._clock()
+        try:
+            request = self._parser.next_request()
+        finally:
+            self._parse_time += metrics._clock() - start
+        if request is not None:
+            metrics.observe("parse", self._parse_time)
+            self._parse_time = 0.0
+        return request
+
+    def _wait_request(self):
+        # Request timeouts apply only while there are no responses pending.
+        if not self._busy and not self._queue:
+            self._reading()
+
+    def _pause_reading(self, pause):
+        if pause != self._reading_paused:
+            self._reading_paused = pause
+            if pause:
+                self.transport.pause_reading()
+            else:
+                self.transport.resume_reading()
+
+    def _wait(self, awaitable, callback):
+        future = _ensure_future(awaitable, loop=self._loop)
+        self._pending.add(future)
+        def done(f):
+            self._pending.discard(f)
+            if not f.cancelled() and not self._closing:
+                callback(f)
+        future.add_done_callback(done)
+
+    def _cancel_pending(self):
+        pending, self._pending = self._pending, set()
+        for future in pending:
+            future.cancel()
+
+    def _abort(self):
+        self._closing = True
+        if self.transport is not None:
+            self.transport.close()
+
+    def handle_request(self, request):
+        """
+        Passes a `request` to the handler, and queues its response to be
+        sent after the responses to the requests received before it.
+        """
+        metrics = self._metrics
+        start = None if metrics is None else metrics._clock()
+        try:
+            response = self.handler(request)
+        except status.HTTPException as e:
+            response = e
+        except Exception:
+            log.exception("Unhandled exception handling %r", request)
+            response = status.HTTPInternalServerError()
+        if _is_awaitable(response) or asyncio.iscoroutine(response):
+            entry = [request, None, start]
+            self._queue.append(entry)
+            self._wait(response, lambda f: self._response_ready(entry, f))
+        else:
+            if metrics is not None:
+                metrics.observe("handler", metrics._clock() - start)
+            self._queue.append((request, response, start))
+        self._process()
+
+    def _response_ready(self, entry, future):
+        request, _, start = entry
+        if start is not None:
+            metrics = self._metrics
+            metrics.observe("handler", metrics._clock() - start)
+        try:
+            response = future.result()
+        except status.HTTPException as e:
+            response = e
+        except Exception:
+            log.exception("Unhandled exception handling %r", request)
+            response = status.HTTPInternalServerError()
+        entry[1] = response
+        self._process()
+
+    def send_response(self, request, response):
+        """
+        Writes a `response` to the `request` (which may be ``None`` if the
+        request could not be parsed), and closes the connection afterwards
+        if it cannot be kept alive.
+        """
+        if self.transport is None:
+            return
+        self._busy = True
+        self._set_phase(None)
+        if self._metrics is not None:
+            self._write_started = self._metrics._clock()
+        content = response.content
+        if _is_awaitable(content) and _response_has_body(response):
+            self._wait(content, lambda f:
+                    self._content_ready(request, response, f))
+        else:
+            self._start_response(request, response, content)
+
+    def _content_ready(self, request, response, future):
+        try:
+            content = future.result()
+        except Exception:
+            log.exception("Unhandled exception producing body for %r",
+                    request)
+            self._start_response(request,
+                    status.HTTPInternalServerError(), None)
+            return
+        if isinstance(content, (text_type, bytes, bytearray, memoryview)) \
+                or not hasattr(content, "__iter__"):
+            content = (content,)
+        self._start_response(request, response, content)
+
+    def _start_response(self, request, response, content):
+        if content is None:
+            content = response.content
+
+        keep_alive = request is not None and request.keep_alive
+        # Responses may be sent more than once (e.g. prebuilt ones), so the
+        # headers added here go to a copy.
+        headers = response.headers.copy()
+        if headers.get(H.Connection) == H.Connection.CLOSE:
+            keep_alive = False
+
+        chunked = False
+        if not _response_has_body(response):
+            content = ()
+        elif H.ContentLength not in headers:
+            streaming = _is_async_iterable(content) \
+                    or not hasattr(content, "__len__")
+            if streaming and request is not None \
+                    and request.version == "HTTP/1.1":
+                chunked = True
+                headers.add(H.TransferEncoding.CHUNKED)
+            elif streaming:
+                # Without a length, the end of the body is signaled by
+                # closing the connection.
+                keep_alive = False
+            else:
+                try:
+                    content = [b for b in map(to_buffer, content) if b]
+                except Exception:
+                    log.exception("Unhandled exception producing body "
+                            "for %r", request)
+                    self._start_response(request,
+                            status.HTTPInternalServerError(), None)
+                    return
+                headers.add(H.ContentLength(sum(map(_buffer_size,
+                    content))))
+        if request is not None and request.method == "HEAD":
+            content = ()
+            chunked = False
+
+        if not keep_alive:
+            headers.add(H.Connection.CLOSE)
+        elif request.version != "HTTP/1.1":
+            headers.add(H.Connection.KEEP_ALIVE)
+        self._keep_alive = keep_alive
+        self._chunked = chunked
+        self._response = response
+        if self._metrics is not None:
+            self._metrics.count(response.code)
+
+        head = headers.to_bytes(response.status_line)
+        if _is_async_iterable(content):
+            self.transport.write(head)
+            self._write_async(content.__aiter__())
+        elif hasattr(content, "sendfile_parts") and self._can_sendfile():
+            self.transport.write(head)
+            self._write_parts(iter(content.sendfile_parts()))
+        else:
+            self._write_sync(iter(content), head)
+
+    def _write_body(self, buffers, size, head=None, last=False):
+        output = [] if head is None else [head]
+        if self._chunked:
+            if size:
+                output.append(_chunk_size_line(size))
+                output.extend(buffers)
+                output.append(b"\r\n")
+            if last:
+                trailers = self._response.trailers
+                output.append(b"0\r\n")
+                output.append(b"\r\n" if trailers is None
+                        else trailers.to_bytes())
+        else:
+            output.extend(buffers)
+        if output:
+            self.transport.writelines(output)
+
+    def _write_sync(self, iterator, head=None):
+        buffers, size = [], 0
+        try:
+            for chunk in iterator:
+                chunk = to_buffer(chunk)
+                if not chunk:
+                    continue
+                buffers.append(chunk)
+                size += _buffer_size(chunk)
+                if size >= WRITE_BATCH_SIZE:
+                    self._write_body(buffers, size, head)
+                    buffers, size, head = [], 0, None
+                    if self._paused:
+                        self._resume = lambda: self._write_sync(iterator)
+                        return
+        except Exception:
+            log.exception("Unhandled exception writing response body")
+            self._abort()
+            return
+        self._write_body(buffers, size, head, last=True)
+        self._response_done()
+
+    def _can_sendfile(self):
+        # The loop only uses sendfile() itself with plain sockets; other
+        # transports would be fed by reading the file from a thread.
+        transport = self.transport
+        return hasattr(os, "sendfile") \
+            and isinstance(transport, asyncio.Transport) \
+            and transport.get_extra_info("sslcontext") is None \
+            and hasattr(self._sendfile_loop(), "sendfile")
+
+    def _sendfile_loop(self):
+        return self._loop or asyncio.get_event_loop()
+
+    def _write_parts(self, parts):
+        for part in parts:
+            if isinstance(part, tuple):
+                file, offset, count = part
+                self._wait(self._sendfile_loop().sendfile(self.transport,
+                    file, offset, count, fallback=False),
+                    lambda f: self._part_sent(parts, f))
+                return
+            self.transport.write(part)
+        self._response_done()
+
+    def _part_sent(self, parts, future):
+        try:
+            future.result()
+        except Exception:
+            log.exception("Unhandled exception sending file")
+            self._abort()
+            return
+        self._write_parts(parts)
+
+    def _write_async(self, iterator):
+        if self._paused:
+            self._resume = lambda: self._write_async(iterator)
+        else:
+            self._wait(iterator.__anext__(), lambda f:
+                    self._async_chunk_ready(iterator, f))
+
+    def _async_chunk_ready(self, iterator, future):
+        try:
+            chunk = to_buffer(future.result())
+        except _StopAsyncIteration:
+            self._write_body((), 0, last=True)
+            self._response_done()
+            return
+        except Exception:
+            log.exception("Unhandled exception writing response body")
+            self._abort()
+            return
+        if chunk:
+            self._write_body((chunk,), _buffer_size(chunk))
+        self._write_async(iterator)
+
+    def _response_done(self):
+        metrics = self._metrics
+        if metrics is not None:
+            now = metrics._clock()
+            metrics.observe("write", now - self._write_started)
+            if self._started is not None:
+                metrics.observe("total", now - self._started)
+                self._started = None
+        self._busy = False
+        self._response = None
+        if not self._keep_alive:
+            self._abort()
+        else:
+            self._process()
+
+
+def create_server(handler, host=None, port=None, loop=None, limiter=None,
+        timeouts=None, limits=None, pipeline=PIPELINE_DEPTH, metrics=None,
+        **kw):
+    """
+    Creates a server which handles connections with :class:`HTTPProtocol`
+    using the given `handler`, rate `limiter`, `timeouts`, request size
+    `limits`, `pipeline` depth and `metrics`. Additional keyword arguments are passed to
+    ``loop.create_server()``, which returns a coroutine.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    return loop.create_server(lambda: HTTPProtocol(handler, loop,
+        limiter=limiter, timeouts=timeouts, limits=limits,
+        pipeline=pipeline, metrics=metrics), host, port, **kw)
@@ -0,0 +1,157 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Rate limiting.
+"""
+
+from . import headers as H
+from . import status
+from array import array
+import time
+
+
+_clock = getattr(time, "monotonic", time.time)
+
+
+def too_many_requests(delay):
+    """
+    Creates a :class:`~nihil.status.HTTPTooManyRequests` response which
+    asks the client to retry after `delay` seconds.
+    """
+    return status.HTTPTooManyRequests(headers=(H.RetryAfter(delay),))
+
+
+class RateLimiter(object):
+    """
+    Token bucket rate limiter: each key (e.g. a client address) may make
+    up to `burst` requests at once, and gets `rate` more per second.
+
+    The state of each key is kept in slots of two arrays (token count and
+    time of the last update), so tracking a key costs a few dozen bytes
+    plus the key itself. Keys whose bucket would be full again are idle
+    and their slots are reclaimed: `sweep_step` slots are checked on each
+    call to :meth:`acquire()`, so idle keys are swept continuously without
+    pauses. At most `max_keys` keys are tracked; when all slots are in
+    use, new keys share a single bucket until slots are reclaimed.
+    """
+    _clock = staticmethod(_clock)
+
+    def __init__(self, rate, burst=None, max_keys=1000000, sweep_step=2):
+        self.rate = float(rate)
+        self.burst = float(rate if burst is None else burst)
+        self.max_keys = max_keys
+        self.sweep_step = sweep_step
+        self._idle = self.burst / self.rate
+        self._slots = {}
+        # Slot 0 is the bucket shared by keys which cannot be tracked.
+        self._keys = [None]
+        self._tokens = array("d", [self.burst])
+        self._stamps = array("d", [0.0])
+        self._free = []
+        self._cursor = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def _allocate(self, key, now):
+        if self._free:
+            slot = self._free.pop()
+            self._keys[slot] = key
+            self._tokens[slot] = self.burst
+            self._stamps[slot] = now
+        elif len(self._keys) <= self.max_keys:
+            slot = len(self._keys)
+            self._keys.append(key)
+            self._tokens.append(self.burst)
+            self._stamps.append(now)
+        else:
+            return None
+        self._slots[key] = slot
+        return slot
+
+    def _reclaim(self, slot, now):
+        key = self._keys[slot]
+        if key is not None and now - self._stamps[slot] >= self._idle:
+            del self._slots[key]
+            self._keys[slot] = None
+            self._free.append(slot)
+
+    def _sweep_some(self, now):
+        count = len(self._keys)
+        cursor = self._cursor
+        for _ in range(min(self.sweep_step, count)):
+            if cursor >= count:
+                cursor = 0
+            self._reclaim(cursor, now)
+            cursor += 1
+        self._cursor = cursor
+
+    def sweep(self, now=None):
+        """
+        Reclaims the slots of all idle keys.
+        """
+        if now is None:
+            now = self._clock()
+        for slot in range(len(self._keys)):
+            self._reclaim(slot, now)
+
+    def acquire(self, key, cost=1, now=None):
+        """
+        Takes `cost` tokens from the bucket of a `key`. Returns zero if
+        there were enough tokens, or otherwise the amount of seconds until
+        there will be.
+        """
+        if now is None:
+            now = self._clock()
+        self._sweep_some(now)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._allocate(key, now) or 0
+        tokens = self._tokens[slot] + (now - self._stamps[slot]) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self._stamps[slot] = now
+        if tokens >= cost:
+            self._tokens[slot] = tokens - cost
+            return 0
+        self._tokens[slot] = tokens
+        return (cost - tokens) / self.rate
+
+    def check(self, key):
+        """
+        Takes a token for a `key`, returning ``None`` if allowed, or an
+        :class:`~nihil.status.HTTPTooManyRequests` response otherwise.
+        """
+        delay = self.acquire(key)
+        return too_many_requests(delay) if delay else None
+
+
+class RateLimit(object):
+    """
+    Wraps a `handler`, rejecting requests when the `limiter` has no tokens
+    for the key returned by ``key(request)`` (e.g. an API token). Requests
+    for which the key is ``None`` are not limited. To limit requests per
+    client address before they are parsed, pass the limiter to
+    :class:`~nihil.protocol.HTTPProtocol` instead.
+    """
+    def __init__(self, handler, limiter, key):
+        self.handler = handler
+        self.limiter = limiter
+        self.key = key
+
+    def __call__(self, request):
+        key = self.key(request)
+        if key is not None:
+            rejection = self.limiter.check(key)
+            if rejection is not None:
+                raise rejection
+        return self.handler(request)
@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+The Request object.
+"""
+
+from .headers import HeaderMap
+
+
+def _persistent(version, headers):
+    # Whether a connection is kept open after a message with the given
+    # HTTP `version` and `headers`, which applies to both directions.
+    connection = headers.get("Connection")
+    if connection is None:
+        return version == "HTTP/1.1"
+    tokens = [t.strip().lower() for t in connection.string_value.split(",")]
+    if "close" in tokens:
+        return False
+    return version == "HTTP/1.1" or "keep-alive" in tokens
+
+
+class Request(object):
+    """
+    Represents a HTTP request received from a client.
+    """
+    __slots__ = ("method", "uri", "version", "headers", "body")
+
+    def __init__(self, method, uri, version="HTTP/1.1", headers=(),
+            body=b""):
+        self.method = method
+        self.uri = uri
+        self.version = version
+        if not isinstance(headers, HeaderMap):
+            headers = HeaderMap(headers)
+        self.headers = headers
+        self.body = body
+
+    def __repr__(self):  # pragma: no cover
+        return "<Request {} {} {}>".format(self.method, self.uri,
+                self.version)
+
+    @property
+    def path(self):
+        return self.uri.partition("?")[0]
+
+    @property
+    def query(self):
+        return self.uri.partition("?")[2]
+
+    def header(self, name, default=None):
+        """
+        Returns the header named `name` (compared case-insensitively), or
+        `default` if the request does not contain such header.
+        """
+        return self.headers.get(name, default)
+
+    @property
+    def keep_alive(self):
+        """
+        Whether the client expects the connection to be kept open after
+        the response is sent. HTTP/1.1 connections are persistent unless
+        the client asks otherwise, HTTP/1.0 ones are not unless the client
+        sends ``Connection: keep-alive``.
+        """
+        return _persistent(self.version, self.headers)
@@ -11,20 +11,86 @@ The Response object.
 """
 
 from six import text_type
+from .headers import HeaderMap
+
+
+def to_buffer(chunk):
+    """
+    Converts a body `chunk` into a buffer which can be written to a
+    transport: text is encoded as UTF-8, and other objects (``bytes``,
+    ``bytearray``, ``memoryview``) are returned unmodified.
+    """
+    if isinstance(chunk, text_type):
+        return chunk.encode("utf-8")
+    return chunk
+
+
+# Encoded status lines of known status codes, indexed by code. Filled in
+# by nihil.status as status classes are defined.
+_status_lines = {200: b"HTTP/1.1 200 OK\r\n"}
+
+
+class _StatusLine(object):
+    """
+    Encoded status line of a response, derived from its `code`. Known codes
+    use the line computed in advance for their status class, and other
+    codes are formatted with the `reason` of the response. A `line` may be
+    given to be used instead for responses with the given `code`.
+    """
+    __slots__ = ("code", "line")
+
+    def __init__(self, code=None, line=None):
+        self.code = code
+        self.line = line
+
+    def __get__(self, response, cls):
+        owner = cls if response is None else response
+        if owner.code == self.code:
+            return self.line
+        line = _status_lines.get(owner.code)
+        if line is None:
+            line = "HTTP/1.1 {} {}\r\n".format(owner.code,
+                    owner.reason).encode("latin-1")
+        return line
 
 
 class Response(object):
     """
     Represents a HTTP response given to a client.
+
+    The `body` may be a string, an iterable which produces the body in
+    chunks, an asynchronous iterable (an object with an ``__aiter__()``
+    method), or an awaitable which results in any of the former. The last
+    two can only be sent by :class:`~nihil.protocol.HTTPProtocol`.
+
+    Headers sent after a chunked body may be given as `trailers`, which
+    can be modified while the body is being produced. The status line
+    follows the `code` of the response, which may be changed.
     """
+    code = 200
+    title = reason = "OK"
+    status_line = _StatusLine()
+    trailers = None
+
     def __init__(self, body=(), headers=()):
-        if isinstance(body, text_type):
-            def f():
-                yield body
-            body = f()
+        self.content = body
+        if not isinstance(headers, HeaderMap):
+            headers = HeaderMap(headers)
+        self.headers = headers
+
+    @property
+    def content(self):
+        """
+        The object from which the body is produced, as passed when creating
+        the response. Strings are wrapped in a tuple.
+        """
+        return self.__body_iter
 
+    @content.setter
+    def content(self, body):
+        if isinstance(body, (text_type, bytes, bytearray, memoryview)):
+            body = (body,)
         self.__body_iter = body
-        self.headers = headers
 
     def __iter__(self):
         for x in self.headers:
@@ -32,3 +98,35 @@ class Response(object):
         yield "\r\n"
         for x in self.__body_iter:
             yield x
+
+    def header_bytes(self, status_line=b""):
+        """
+        Returns the header block (including the empty line which ends it)
+        as a single bytes object, optionally preceded by a `status_line`.
+        """
+        return self.headers.to_bytes(status_line)
+
+    def body_buffers(self):
+        """
+        Consumes the body and returns its chunks as a list of buffers.
+        Chunks which are ``bytes``, ``bytearray`` or ``memoryview`` objects
+        are passed along as-is, without copying; text chunks are encoded
+        as UTF-8.
+        """
+        result = []
+        for chunk in self.__body_iter:
+            chunk = to_buffer(chunk)
+            if chunk:
+                result.append(chunk)
+        return result
+
+    def buffers(self, status_line=b""):
+        """
+        Returns a list of buffers suitable to be written in one go using
+        ``transport.writelines()`` or ``socket.sendmsg()``.
+
+        The first item is the complete header block, followed by the body
+        chunks as returned by :meth:`body_buffers()`. Like iterating over
+        the response, this consumes the body.
+        """
+        return [self.header_bytes(status_line)] + self.body_buffers()
@@ -0,0 +1,190 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Request routing.
+"""
+
+from . import status
+from .headers import Allow
+
+
+def _convert_int(value):
+    if not value.isdigit():
+        raise ValueError(value)
+    return int(value)
+
+
+def _convert_str(value):
+    if not value:
+        raise ValueError(value)
+    return value
+
+
+# Converters for typed parameters, e.g. "{id:int}". A converter returns
+# the value passed to the handler, or raises ValueError to reject it.
+converters = {
+    "int": _convert_int,
+    "str": _convert_str,
+}
+
+
+def _split(path):
+    return path[1:].split("/") if path.startswith("/") else path.split("/")
+
+
+class _Node(object):
+    """
+    Node of the routing tree. Each node corresponds to a path segment;
+    its children are indexed by literal segment in `static`, and otherwise
+    tried in order from `params` (typed parameters) and then `wildcard`
+    (a parameter which takes the rest of the path).
+    """
+    __slots__ = ("static", "params", "wildcard", "handlers", "allow")
+
+    def __init__(self):
+        self.static = {}
+        self.params = []
+        self.wildcard = None
+        self.handlers = None
+        self.allow = None
+
+    def child(self, segment):
+        if not (segment.startswith("{") and segment.endswith("}")):
+            node = self.static.get(segment)
+            if node is None:
+                node = self.static[segment] = _Node()
+            return node, False
+
+        name, _, kind = segment[1:-1].partition(":")
+        kind = kind or "str"
+        if not name:
+            raise ValueError("Unnamed parameter: {}".format(segment))
+        if kind == "path":
+            if self.wildcard is None:
+                self.wildcard = (name, _Node())
+            elif self.wildcard[0] != name:
+                raise ValueError("Conflicting wildcard: {}".format(segment))
+            return self.wildcard[1], True
+
+        convert = converters[kind]
+        for param_name, param_convert, node in self.params:
+            if param_name == name and param_convert is convert:
+                return node, False
+        node = _Node()
+        self.params.append((name, convert, node))
+        return node, False
+
+    def match(self, segments, index, params):
+        if index == len(segments):
+            if self.handlers is not None:
+                return self
+        else:
+            segment = segments[index]
+            node = self.static.get(segment)
+            if node is not None:
+                node = node.match(segments, index + 1, params)
+                if node is not None:
+                    return node
+            for name, convert, node in self.params:
+                try:
+                    value = convert(segment)
+                except ValueError:
+                    continue
+                node = node.match(segments, index + 1, params)
+                if node is not None:
+                    params[name] = value
+                    return node
+        if self.wildcard is not None:
+            name, node = self.wildcard
+            if node.handlers is not None:
+                params[name] = "/".join(segments[index:])
+                return node
+        return None
+
+
+class Router(object):
+    """
+    Dispatches requests to handlers depending on their path and method.
+
+    Path patterns are made of segments separated by slashes, which may be
+    either literal text or parameters enclosed in braces: ``{name}``
+    matches a non-empty segment, ``{name:int}`` matches a segment made of
+    digits (other types can be added to :data:`converters`), and
+    ``{name:path}`` matches the rest of the path and must be the last
+    segment. Literal segments take precedence over parameters, which are
+    tried in the order they were added.
+
+    Patterns are compiled into a tree with one level per path segment, so
+    the cost of dispatching a request depends on the length of its path,
+    not on the amount of routes. A router can be used directly as the
+    handler for :class:`~nihil.protocol.HTTPProtocol`; handlers are called
+    with the request and the matched parameters as keyword arguments.
+
+    The time taken to find the handler for each request is recorded in
+    `metrics`, if given (see :class:`~nihil.metrics.Metrics`).
+    """
+    def __init__(self, metrics=None):
+        self._root = _Node()
+        self._metrics = metrics
+
+    def add(self, pattern, handler, methods=("GET",)):
+        node = self._root
+        segments = _split(pattern)
+        for i, segment in enumerate(segments):
+            node, wildcard = node.child(segment)
+            if wildcard and i != len(segments) - 1:
+                raise ValueError("Wildcard must be the last segment: {}"
+                        .format(pattern))
+        if node.handlers is None:
+            node.handlers = {}
+        for method in methods:
+            if method in node.handlers:
+                raise ValueError("Route already defined: {} {}"
+                        .format(method, pattern))
+            node.handlers[method] = handler
+        if "GET" in node.handlers and "HEAD" not in node.handlers:
+            node.handlers["HEAD"] = node.handlers["GET"]
+        node.allow = Allow(", ".join(sorted(node.handlers)))
+
+    def route(self, pattern, methods=("GET",)):
+        """
+        Decorator which adds the decorated function as a handler.
+        """
+        def decorator(handler):
+            self.add(pattern, handler, methods)
+            return handler
+        return decorator
+
+    def match(self, method, path):
+        """
+        Returns a ``(handler, params)`` tuple for a request `method` and
+        `path`. Raises :class:`~nihil.status.HTTPNotFound` if no route
+        matches the path, and :class:`~nihil.status.HTTPMethodNotAllowed`
+        (with an ``Allow`` header) if no handler exists for the method.
+        """
+        params = {}
+        node = self._root.match(_split(path), 0, params)
+        if node is None:
+            raise status.HTTPNotFound()
+        handler = node.handlers.get(method)
+        if handler is None:
+            raise status.HTTPMethodNotAllowed(headers=(node.allow,))
+        return handler, params
+
+    def __call__(self, request):
+        metrics = self._metrics
+        if metrics is None:
+            handler, params = self.match(request.method, request.path)
+        else:
+            start = metrics._clock()
+            try:
+                handler, params = self.match(request.method, request.path)
+            finally:
+                metrics.observe("route", metrics._clock() - start)
+        return handler(request, **params)
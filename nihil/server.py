@@ -0,0 +1,247 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Multi-process server launcher.
+"""
+
+from trololio import asyncio
+from .protocol import create_server
+import logging
+import signal
+import socket
+import errno
+import time
+import os
+
+log = logging.getLogger(__name__)
+
+
+def load_handler(spec):
+    """
+    Imports a handler given as ``module:attribute``, where the attribute
+    may be a dotted path (e.g. ``myapp.web:app.router``).
+    """
+    from importlib import import_module
+    module_name, sep, attrs = spec.partition(":")
+    if not sep or not module_name or not attrs:
+        raise ValueError("Handler must be given as module:attribute: {!r}"
+                .format(spec))
+    obj = import_module(module_name)
+    for attr in attrs.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def bind_socket(host, port, reuse_port=True):
+    """
+    Creates a TCP socket bound to `host` and `port`. With `reuse_port`,
+    ``SO_REUSEPORT`` is set so other sockets can bind to the same address,
+    letting the kernel spread incoming connections among them.
+    """
+    family, kind, proto, _, address = socket.getaddrinfo(host, port,
+            socket.AF_UNSPEC, socket.SOCK_STREAM, 0, socket.AI_PASSIVE)[0]
+    sock = socket.socket(family, kind, proto)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(address)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def run_worker(handler, sock, backlog=1024, **kw):
+    """
+    Serves connections arriving to `sock` using `handler` in a new event
+    loop, until the process gets ``SIGTERM`` or ``SIGINT``. Additional
+    keyword arguments are passed to
+    :func:`~nihil.protocol.create_server()`.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    sock.listen(backlog)
+    sock.setblocking(False)
+    server = loop.run_until_complete(create_server(handler, loop=loop,
+        sock=sock, **kw))
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, loop.stop)
+    try:
+        loop.run_forever()
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+class _Shutdown(Exception):
+    pass
+
+
+def _shutdown(signum, frame):
+    raise _Shutdown()
+
+
+class Supervisor(object):
+    """
+    Serves a `handler` from `workers` processes (by default, one per CPU)
+    forked from the current one. Each worker binds its own socket to the
+    address using ``SO_REUSEPORT`` and runs its own event loop, sharing
+    nothing with the others, so objects created before forking (caches,
+    rate limiters...) end up with one independent copy per worker. Where
+    ``SO_REUSEPORT`` is not available, a socket bound before forking is
+    shared by the workers instead.
+
+    Workers which exit are restarted. Those which exit within
+    `min_uptime` seconds of being started are restarted after
+    `restart_delay` seconds, to avoid spinning when they fail to start.
+    Additional keyword arguments are passed to :func:`run_worker()`.
+    """
+    min_uptime = 1.0
+    restart_delay = 1.0
+    stop_timeout = 10.0
+
+    def __init__(self, handler, host="0.0.0.0", port=8080, workers=None,
+            **kw):
+        if workers is None:
+            from multiprocessing import cpu_count
+            workers = cpu_count()
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.options = kw
+        self.reuse_port = hasattr(socket, "SO_REUSEPORT")
+        self.pids = {}
+        self._socket = None
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = time.time()
+            return pid
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            sock = self._socket
+            if self.reuse_port:
+                sock.close()
+                sock = bind_socket(self.host, self.port)
+            run_worker(self.handler, sock, **self.options)
+        except Exception:
+            log.exception("Worker %d failed", os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+
+    def run(self):
+        """
+        Starts the workers and supervises them until the process gets
+        ``SIGTERM`` or ``SIGINT``, then stops them.
+        """
+        # The socket bound here reserves the address (and resolves the
+        # port, if it is zero) for the workers. With SO_REUSEPORT it never
+        # listens, so it does not get any connections.
+        self._socket = bind_socket(self.host, self.port, self.reuse_port)
+        self.port = self._socket.getsockname()[1]
+        previous = [signal.signal(signum, _shutdown)
+                for signum in (signal.SIGTERM, signal.SIGINT)]
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            log.info("Serving on %s:%d with %d workers", self.host,
+                    self.port, self.workers)
+            self._supervise()
+        except _Shutdown:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, previous[0])
+            signal.signal(signal.SIGINT, previous[1])
+            self._stop()
+            self._socket.close()
+
+    def _supervise(self):
+        while True:
+            try:
+                pid, status = os.wait()
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            started = self.pids.pop(pid, None)
+            if started is None:
+                continue
+            log.warning("Worker %d exited with status %d", pid, status)
+            if time.time() - started < self.min_uptime:
+                time.sleep(self.restart_delay)
+            self._spawn()
+
+    def _stop(self):
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        deadline = time.time() + self.stop_timeout
+        while self.pids and time.time() < deadline:
+            for pid in list(self.pids):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except OSError:
+                    done = pid
+                if done:
+                    del self.pids[pid]
+            time.sleep(0.05)
+        for pid in self.pids:
+            log.warning("Killing worker %d", pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.pids.clear()
+
+
+def serve(handler, host="0.0.0.0", port=8080, workers=None, **kw):
+    """
+    Serves a `handler` from multiple processes using a
+    :class:`Supervisor`. In platforms without ``fork()``, or when a single
+    worker is requested, the current process serves requests itself.
+    """
+    if workers == 1 or not hasattr(os, "fork"):
+        run_worker(handler, bind_socket(host, port, False), **kw)
+    else:
+        Supervisor(handler, host, port, workers, **kw).run()
+
+
+def main(argv=None):
+    """
+    Entry point of the ``nihil-serve`` command.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog="nihil-serve",
+            description="Serves a nihil handler from multiple processes.")
+    parser.add_argument("handler",
+            help="handler to serve, as module:attribute")
+    parser.add_argument("-H", "--host", default="0.0.0.0",
+            help="address to listen on (default: %(default)s)")
+    parser.add_argument("-p", "--port", type=int, default=8080,
+            help="port to listen on (default: %(default)s)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+            help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--backlog", type=int, default=1024,
+            help="listen backlog of each worker (default: %(default)s)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO,
+            format="%(asctime)s [%(process)d] %(levelname)s %(message)s")
+    serve(load_handler(args.handler), args.host, args.port, args.workers,
+            backlog=args.backlog)
+
+
+if __name__ == "__main__":
+    main()
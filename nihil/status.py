@@ -10,79 +10,207 @@
 HTTP status codes.
 """
 
-from .response import Response
-from .headers import ContentType, Location
-from textwrap import dedent
-from string import Template
-from six import iteritems, class_types, PY3
-import re
-
-if PY3:  # pragma: no cover
-    from html import escape as html_escape
-else:  # pragma: no cover
-    from cgi import escape as html_escape
-
-_title_subn = re.compile(r"([^A-Z])([A-Z])").subn
-_title_subn_callback = lambda m: m.group(1) + " " + m.group(2)
-
-
-class cached_result(object):
-    __slots__ = ("value", "__name__", "__doc__")
-    def __init__(self, func):
-        self.value = func
-        self.__name__ = func.__name__
-        self.__doc__ = func.__doc__
-    def __call__(self, obj):
-        if callable(self.value):
-            self.value = self.value(obj)
-        return self.value
+from .response import Response, _status_lines, _StatusLine
+from .headers import ContentType, ContentLength, Location, HeaderMap
+from six import iteritems, add_metaclass, PY3
 
 
+# Modules which are only needed to render bodies are imported on first use,
+# to keep importing this module (which happens at worker startup) cheap.
+
+def html_escape(text):
+    global html_escape
+    if PY3:  # pragma: no cover
+        from html import escape
+    else:  # pragma: no cover
+        from cgi import escape
+    html_escape = escape
+    return escape(text)
+
+
+class _Template(object):
+    """
+    A ``string.Template`` which is created the first time it is used.
+    """
+    __slots__ = ("text", "template")
+
+    def __init__(self, text):
+        self.text = text
+        self.template = None
+
+    def safe_substitute(self, *arg, **kw):
+        if self.template is None:
+            from string import Template
+            self.template = Template(self.text)
+        return self.template.safe_substitute(*arg, **kw)
+
+
+def _title_from_name(name):
+    # Splits words in a class name, e.g. "HTTPNotFound" -> "Not Found".
+    if name.startswith("HTTP"):
+        name = name[4:]
+    chars = []
+    previous_upper = True
+    for c in name:
+        upper = "A" <= c <= "Z"
+        if upper and not previous_upper:
+            chars.append(" ")
+        chars.append(c)
+        previous_upper = upper
+    return "".join(chars)
+
+
+__all__ = []
+
+# Status classes indexed by their status code, e.g. by_code[404].
+by_code = [None] * 600
+
+
+def _status_line(cls):
+    return "HTTP/1.1 {} {}\r\n".format(cls.code,
+            cls.reason).encode("latin-1")
+
+
+class _HTTPExceptionMeta(type):
+    """
+    Computes the `title`, `reason` and encoded status line of status
+    classes once, when they are created, and registers in :data:`by_code`
+    the classes from this module which define a `code`. Classes which do
+    not define a code inherit the title and reason of their base class.
+    Public classes from this module are added to ``__all__``.
+    """
+    def __init__(cls, name, bases, namespace):
+        super(_HTTPExceptionMeta, cls).__init__(name, bases, namespace)
+        builtin = cls.__module__ == __name__
+        if builtin and not name.startswith("_"):
+            __all__.append(name)
+        if "code" in namespace and "title" not in namespace:
+            cls.title = _title_from_name(name)
+        if "reason" not in namespace \
+                and ("code" in namespace or "title" in namespace):
+            cls.reason = cls.title
+        if cls.code is None:
+            return
+        if builtin and "code" in namespace:
+            by_code[cls.code] = cls
+            _status_lines[cls.code] = _status_line(cls)
+        elif not builtin and ("code" in namespace
+                or "title" in namespace or "reason" in namespace):
+            # Subclasses elsewhere keep their own line, without replacing
+            # the one used by other responses with the same code.
+            cls.status_line = _StatusLine(cls.code, _status_line(cls))
+
+
+# Stands for the message while pre-rendering bodies, see _RenderedBody.
+_MESSAGE_MARK = "\0message\0"
+
+
+class _RenderedBody(object):
+    """
+    Body template of a status class rendered ahead of time, with the text
+    split around the places where the message goes. Also keeps the encoded
+    body for the default (empty) message, and the headers which go with it,
+    which are not used when the class has its own rendering methods.
+    """
+    __slots__ = ("pieces", "text", "data", "headers", "custom")
+
+    def __init__(self, template, data, escape, content_type):
+        if template is None:
+            self.pieces = None
+            self.text = ""
+            self.data = b""
+            self.headers = HeaderMap()
+            return
+        data = dict(data, message=_MESSAGE_MARK)
+        if escape:
+            for k, v in iteritems(data):
+                if k != "code":
+                    data[k] = html_escape(v)
+        self.pieces = template.safe_substitute(data).split(_MESSAGE_MARK)
+        self.text = "".join(self.pieces)
+        self.data = self.text.encode("utf-8")
+        self.headers = HeaderMap((content_type, ContentLength(len(self.data))))
+
+    def render(self, message):
+        if self.pieces is None:
+            return ""
+        return message.join(self.pieces)
+
+
+# Pre-rendered bodies, indexed by (class, plaintext).
+_rendered_bodies = {}
+
+_RENDER_METHODS = ("render_data", "render_html", "render_plain")
+
+
+def _overrides_render(cls):
+    for klass in cls.__mro__:
+        if klass is HTTPException:
+            return False
+        if any(name in vars(klass) for name in _RENDER_METHODS):
+            return True
+    return False
+
+
+@add_metaclass(_HTTPExceptionMeta)
 class HTTPException(Exception, Response):
     # Those are to be set in subclasses, e.g:
     #   code = 200
     #   explanation = "why this happens"
     code = None
     explanation = ""
-    body = Template(dedent("""\
-            <html>
-             <head>
-              <title>${title}</title>
-             </head>
-             <body>
-              <h1>${code} - ${title}</h1>
-              <pre>${message}
-              ${explanation}</pre>
-             </body>
-            </html>"""))
-    plain_body = Template(dedent("""\
-            ${code} - ${title}
-
-            ${message}
-            ${explanation}
-            """))
+    body = _Template(
+            "<html>\n"
+            " <head>\n"
+            "  <title>${title}</title>\n"
+            " </head>\n"
+            " <body>\n"
+            "  <h1>${code} - ${title}</h1>\n"
+            "  <pre>${message}\n"
+            "  ${explanation}</pre>\n"
+            " </body>\n"
+            "</html>")
+    plain_body = _Template(
+            "${code} - ${title}\n"
+            "\n"
+            "${message}\n"
+            "${explanation}\n")
 
     def __init__(self, message=None, comment=None, plaintext=False,
             headers=()):
-        if plaintext:
-            def render_body():
-                yield self.render_plain()
-            content_type = ContentType.TEXT_PLAIN
-        else:
-            def render_body():
-                yield self.render_html()
-            content_type = ContentType.TEXT_HTML
         Exception.__init__(self, message)
-        Response.__init__(self, render_body(), headers + (content_type,))
+        self.message = message
         self.comment = comment
-
-    @property
-    @cached_result
-    def title(self):
-        title = self.__class__.__name__
-        if title.startswith("HTTP"):
-            title = title[4:]
-        return _title_subn(_title_subn_callback, title)[0]
+        rendered = self._rendered_body(plaintext)
+        if message is None and comment is None and not rendered.custom:
+            body, header_map = rendered.data, rendered.headers
+        else:
+            body = (self.render_plain() if plaintext
+                    else self.render_html()).encode("utf-8")
+            header_map = rendered.headers.copy()
+            if rendered.pieces is not None:
+                header_map.add(ContentLength(len(body)))
+        Response.__init__(self, body, header_map.derive(*headers))
+
+    def _rendered_body(self, plaintext):
+        key = (self.__class__, plaintext)
+        rendered = _rendered_bodies.get(key)
+        if rendered is None:
+            data = {
+                "code"        : self.code,
+                "title"       : self.title,
+                "comment"     : "",
+                "explanation" : self.explanation,
+            }
+            if plaintext:
+                rendered = _RenderedBody(self.body and self.plain_body,
+                        data, False, ContentType.TEXT_PLAIN)
+            else:
+                rendered = _RenderedBody(self.body, data, True,
+                        ContentType.TEXT_HTML)
+            rendered.custom = _overrides_render(self.__class__)
+            _rendered_bodies[key] = rendered
+        return rendered
 
     @property
     def render_data(self):
@@ -95,6 +223,9 @@ class HTTPException(Exception, Response):
         }
 
     def render_html(self):
+        rendered = self._rendered_body(False)
+        if self.comment is None and not rendered.custom:
+            return rendered.render(html_escape(self.message or ""))
         if self.body is None:
             return ""
         data = self.render_data
@@ -104,6 +235,9 @@ class HTTPException(Exception, Response):
         return self.body.safe_substitute(data)
 
     def render_plain(self):
+        rendered = self._rendered_body(True)
+        if self.comment is None and not rendered.custom:
+            return rendered.render(self.message or "")
         if self.body is None:
             return ""
         return self.plain_body.safe_substitute(self.render_data)
@@ -189,8 +323,8 @@ class HTTPPartialContent(HTTPOk):
 class _HTTPMove(HTTPRedirect):
     def __init__(self, message=None, comment=None, location=None,
             plaintext=False, headers=()):
-        super(_HTTPMove, self).__init__(message, comment, plaintext, headers
-                + (Location(location),))
+        super(_HTTPMove, self).__init__(message, comment, plaintext, headers)
+        self.headers.add(Location(location))
         self.location = location
 
 
@@ -235,7 +369,7 @@ class HTTPClientError(HTTPError):
 
 
 class HTTPBadRequest(HTTPClientError):
-    pass
+    code = 400
 
 
 class HTTPUnauthorized(HTTPClientError):
@@ -326,7 +460,7 @@ class HTTPRequestEntityTooLarge(HTTPClientError):
 
 class HTTPRequestURITooLong(HTTPClientError):
     code = 414
-    #title = "Request URI Too Long"
+    title = "Request-URI Too Long"
     explanation = "The request URI was too long for this server"
 
 
@@ -338,6 +472,7 @@ class HTTPUnsupportedMediaType(HTTPClientError):
 
 class HTTPRequestRangeNotSatisfiable(HTTPClientError):
     code = 416
+    reason = "Requested Range Not Satisfiable"
     explanation = "The range requested is not available"
 
 
@@ -393,7 +528,7 @@ class HTTPServerError(HTTPError):
 
 
 class HTTPInternalServerError(HTTPServerError):
-    pass
+    code = 500
 
 
 class HTTPNotImplemented(HTTPServerError):
@@ -420,6 +555,7 @@ class HTTPGatewayTimeout(HTTPServerError):
 
 class HTTPVersionNotSupported(HTTPServerError):
     code = 505
+    reason = "HTTP Version Not Supported"
     explanation = "The HTTP version is not supported"
 
 
@@ -432,9 +568,3 @@ class HTTPNetworkAuthenticationRequired(HTTPServerError):
     code = 511
     explanation = "Network authentication is required"
 
-
-__all__ = [name for (name, value) in list(iteritems(globals())) if
-        isinstance(value, (type, class_types))
-        and issubclass(value, HTTPException)
-        and not name.startswith("_")]
-del name, value
@@ -0,0 +1,170 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from trololio import asyncio
+from .. import headers as H
+from .. import status
+from ..cache import ResponseCache, CachedResponse
+from ..protocol import HTTPProtocol
+from ..response import Response
+from .test_protocol import FakeTransport, make_request, run_pending
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.now = 1000.0
+        self.headers = ()
+
+    def make_cache(self, **kw):
+        cache = ResponseCache(self.handler, **kw)
+        cache._clock = lambda: self.now
+        return cache
+
+    def handler(self, request):
+        self.calls += 1
+        def body():
+            yield u"call "
+            yield str(self.calls)
+        return Response(body(), (H.ContentType.TEXT_PLAIN,) + self.headers)
+
+    def body(self, response):
+        return b"".join(response.body_buffers())
+
+    def test_hit(self):
+        cache = self.make_cache()
+        first = cache(make_request())
+        self.assertIsInstance(first, CachedResponse)
+        self.assertEqual(b"call 1", self.body(first))
+        second = cache(make_request())
+        self.assertEqual(b"call 1", self.body(second))
+        self.assertEqual(1, self.calls)
+        self.assertEqual(6, second.headers[H.ContentLength].value)
+
+    def test_serialized_once(self):
+        cache = self.make_cache()
+        cache(make_request())
+        a, b = cache(make_request()), cache(make_request())
+        self.assertIs(a.header_bytes(a.status_line),
+                b.header_bytes(b.status_line))
+        a.headers.add(H.Connection.CLOSE)
+        self.assertIn(b"Connection: close\r\n", a.header_bytes(a.status_line))
+        self.assertNotIn(b"Connection", b.header_bytes(b.status_line))
+
+    def test_key(self):
+        cache = self.make_cache(vary=("Accept-Language",))
+        cache(make_request(path=b"/a?x=1"))
+        cache(make_request(path=b"/a?x=2"))
+        cache(make_request(b"Accept-Language: es", path=b"/a?x=1"))
+        cache(make_request(b"Accept-Language: es", path=b"/a?x=1"))
+        cache(make_request(path=b"/a?x=1", method=b"HEAD"))
+        self.assertEqual(4, self.calls)
+
+    def test_not_cached(self):
+        cache = self.make_cache()
+        cache(make_request(method=b"POST"))
+        cache(make_request(method=b"POST"))
+        cache(make_request(b"Authorization: Basic Zm9vOmJhcg=="))
+        cache(make_request(b"Authorization: Basic Zm9vOmJhcg=="))
+        self.assertEqual(4, self.calls)
+        self.assertEqual(0, len(cache))
+
+    def test_uncacheable_responses(self):
+        for header in (H.CustomHeader("Cache-Control", "no-store"),
+                H.CustomHeader("Cache-Control", "private, max-age=10"),
+                H.CustomHeader("Set-Cookie", "a=b"),
+                H.Vary("Cookie")):
+            self.headers = (header,)
+            cache = self.make_cache()
+            response = cache(make_request())
+            self.assertEqual(0, len(cache), header)
+            self.assertEqual(Response, response.__class__)
+
+    def test_ttl(self):
+        cache = self.make_cache(ttl=10)
+        cache(make_request())
+        self.now += 9
+        cache(make_request())
+        self.assertEqual(1, self.calls)
+        self.now += 1
+        cache(make_request())
+        self.assertEqual(2, self.calls)
+
+    def test_max_age(self):
+        self.headers = (H.CustomHeader("Cache-Control", "max-age=100"),)
+        cache = self.make_cache(ttl=10)
+        cache(make_request())
+        self.now += 50
+        cache(make_request())
+        self.assertEqual(1, self.calls)
+
+    def test_eviction_by_size(self):
+        cache = self.make_cache()
+        cache(make_request(path=b"/a"))
+        size = cache.size
+        cache.max_size = size * 2
+        cache(make_request(path=b"/b"))
+        cache(make_request(path=b"/a"))
+        cache(make_request(path=b"/c"))
+        self.assertEqual(3, self.calls)
+        self.assertEqual(size * 2, cache.size)
+        cache(make_request(path=b"/b"))
+        self.assertEqual(4, self.calls)
+
+    def test_exception_propagates(self):
+        def handler(request):
+            raise status.HTTPNotFound()
+        cache = ResponseCache(handler)
+        with self.assertRaises(status.HTTPNotFound):
+            cache(make_request())
+
+
+class TestResponseCacheCoalescing(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.calls = 0
+        self.fail = False
+        self.cache = ResponseCache(self.handler)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def handler(self, request):
+        self.calls += 1
+        future = asyncio.Future(loop=self.loop)
+        if self.fail:
+            self.loop.call_soon(future.set_exception, status.HTTPNotFound())
+        else:
+            self.loop.call_soon(future.set_result, Response(b"data"))
+        return future
+
+    def serve(self):
+        transports = []
+        for _ in range(3):
+            transport = FakeTransport()
+            protocol = HTTPProtocol(self.cache, self.loop)
+            protocol.connection_made(transport)
+            protocol.data_received(b"GET / HTTP/1.1\r\n\r\n")
+            transports.append(transport)
+        run_pending(self.loop)
+        return transports
+
+    def test_coalesced(self):
+        for transport in self.serve():
+            self.assertTrue(transport.data.startswith(b"HTTP/1.1 200 OK"))
+            self.assertTrue(transport.data.endswith(b"\r\n\r\ndata"))
+        self.assertEqual(1, self.calls)
+        self.assertEqual(1, len(self.cache))
+
+    def test_failure_not_shared(self):
+        self.fail = True
+        for transport in self.serve():
+            self.assertTrue(transport.data.startswith(
+                b"HTTP/1.1 404 Not Found"))
+        self.assertEqual(3, self.calls)
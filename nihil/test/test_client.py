@@ -0,0 +1,192 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from trololio import asyncio
+from .. import headers as H
+from ..client import Client, ConnectionPool
+from ..protocol import HTTPProtocol, _StopAsyncIteration
+from ..response import Response
+from ..routing import Router
+from .test_protocol import run_pending
+
+
+class TestClient(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.connections = 0
+        self.requests = []
+        router = Router()
+        router.add("/", self.hello, ("GET", "POST"))
+        router.add("/stream", self.stream)
+        router.add("/close", self.close)
+        router.add("/empty", self.empty)
+        def protocol():
+            self.connections += 1
+            return HTTPProtocol(router, self.loop)
+        self.server = self.wait(self.loop.create_server(protocol,
+            "127.0.0.1", 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.url = "http://127.0.0.1:{}".format(self.port)
+        self.pool = ConnectionPool(max_size=2, idle_timeout=5,
+                loop=self.loop)
+        self.client = Client(self.pool, loop=self.loop)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        self.wait(self.server.wait_closed())
+        run_pending(self.loop)
+        self.loop.close()
+
+    def wait(self, future):
+        return self.loop.run_until_complete(future)
+
+    def hello(self, request):
+        self.requests.append(request)
+        return Response(b"Hello " + (request.body or b"world"))
+
+    def stream(self, request):
+        return Response(b"%d," % i for i in range(1000))
+
+    def close(self, request):
+        return Response(b"bye", (H.Connection.CLOSE,))
+
+    def empty(self, request):
+        future = asyncio.Future(loop=self.loop)
+        self.loop.call_later(0.02, future.set_result, Response(b"late"))
+        return future
+
+    def fetch(self, path, method="GET", **kw):
+        response = self.wait(self.client.request(method, self.url + path,
+            **kw))
+        return response, self.wait(response.read())
+
+    def test_get(self):
+        response, body = self.fetch("/?q=1")
+        self.assertEqual(200, response.code)
+        self.assertEqual(b"Hello world", body)
+        request = self.requests[0]
+        self.assertEqual("/?q=1", request.uri)
+        self.assertEqual("127.0.0.1:{}".format(self.port),
+                request.header(H.Host).string_value)
+        self.assertEqual("nihil", request.header(H.UserAgent).string_value)
+
+    def test_post(self):
+        response, body = self.fetch("/", "POST", body=b"body",
+                headers=(H.Authorization("Bearer", "t"),))
+        self.assertEqual(b"Hello body", body)
+        self.assertEqual("Bearer t",
+                self.requests[0].header(H.Authorization).string_value)
+
+    def test_connection_reused(self):
+        for _ in range(3):
+            self.assertEqual(b"Hello world", self.fetch("/")[1])
+        self.assertEqual(1, self.connections)
+        key = ("http", "127.0.0.1", self.port)
+        self.assertEqual(1, self.pool.idle(key))
+
+    def test_head(self):
+        response, body = self.fetch("/", "HEAD")
+        self.assertEqual(b"", body)
+        self.assertEqual(b"Hello world", self.fetch("/")[1])
+        self.assertEqual(1, self.connections)
+
+    def test_stream(self):
+        response = self.wait(self.client.get(self.url + "/stream"))
+        self.assertEqual("chunked",
+                response.header("Transfer-Encoding").string_value)
+        chunks = []
+        while True:
+            try:
+                chunks.append(self.wait(response.__anext__()))
+            except _StopAsyncIteration:
+                break
+        self.assertEqual(b"".join(b"%d," % i for i in range(1000)),
+                b"".join(chunks))
+
+    def test_connection_close(self):
+        self.assertEqual(b"bye", self.fetch("/close")[1])
+        run_pending(self.loop)
+        self.assertEqual(0, self.pool.connections())
+        self.assertEqual(b"Hello world", self.fetch("/")[1])
+        self.assertEqual(2, self.connections)
+
+    def test_max_size(self):
+        futures = [self.client.get(self.url + "/empty") for _ in range(5)]
+        responses = [self.wait(future) for future in futures]
+        bodies = [self.wait(response.read()) for response in responses]
+        self.assertEqual([b"late"] * 5, bodies)
+        self.assertEqual(2, self.connections)
+        self.assertEqual(2, self.pool.connections())
+
+    def test_idle_timeout(self):
+        self.pool.idle_timeout = 0.01
+        self.fetch("/")
+        run_pending(self.loop, 0.05)
+        self.assertEqual(0, self.pool.connections())
+
+    def test_close_response(self):
+        response = self.wait(self.client.get(self.url + "/empty"))
+        response.close()
+        run_pending(self.loop)
+        self.assertEqual(b"Hello world", self.fetch("/")[1])
+
+    def test_unsupported_url(self):
+        with self.assertRaises(ValueError):
+            self.client.get("ftp://example.com/")
+
+
+class StaleServer(asyncio.Protocol):
+    # Answers the first request on each connection, and then closes the
+    # connection without answering, as servers closing idle connections
+    # may do while a request is in flight.
+    def connection_made(self, transport):
+        self.transport = transport
+        self.answered = False
+
+    def data_received(self, data):
+        if self.answered:
+            self.transport.close()
+        else:
+            self.answered = True
+            self.transport.write(b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Length: 2\r\n\r\nok")
+
+
+class TestClientRetry(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.server = self.wait(self.loop.create_server(StaleServer,
+            "127.0.0.1", 0))
+        self.url = "http://127.0.0.1:{}/".format(
+                self.server.sockets[0].getsockname()[1])
+        self.client = Client(ConnectionPool(loop=self.loop), loop=self.loop)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        run_pending(self.loop)
+        self.loop.close()
+
+    def wait(self, future):
+        return self.loop.run_until_complete(future)
+
+    def request(self, method):
+        response = self.wait(self.client.request(method, self.url))
+        return self.wait(response.read())
+
+    def test_idempotent_retried(self):
+        self.assertEqual(b"ok", self.request("GET"))
+        self.assertEqual(b"ok", self.request("GET"))
+
+    def test_post_not_retried(self):
+        from .. import status
+        self.assertEqual(b"ok", self.request("GET"))
+        with self.assertRaises(status.HTTPBadGateway):
+            self.request("POST")
@@ -0,0 +1,217 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from trololio import asyncio
+from .. import headers as H
+from ..compression import compress_response, compressible, negotiate, \
+        Compressor
+from ..protocol import HTTPProtocol
+from ..response import Response
+from .test_protocol import FakeTransport, AsyncChunks, make_request, \
+        run_pending
+import zlib
+
+
+BODY = b"Compress me, please! " * 100
+ACCEPT_GZIP = b"Accept-Encoding: gzip"
+ACCEPT_DEFLATE = b"Accept-Encoding: deflate"
+SHARED = Response(BODY, (H.ContentType.TEXT_HTML,))
+
+
+def gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class TestNegotiation(unittest.TestCase):
+    def test_compressible(self):
+        self.assertTrue(compressible(H.ContentType.TEXT_HTML))
+        self.assertTrue(compressible(
+            H.ContentType("application/json; charset=utf-8")))
+        self.assertTrue(compressible(H.ContentType("application/ld+json")))
+        self.assertFalse(compressible(H.ContentType("image/png")))
+        self.assertFalse(compressible(None))
+
+    def test_negotiate(self):
+        self.assertIsNone(negotiate(None))
+        self.assertEqual("gzip", negotiate(H.AcceptEncoding("gzip, deflate")))
+        self.assertEqual("deflate",
+                negotiate(H.AcceptEncoding("gzip;q=0.5, deflate")))
+        self.assertEqual("gzip", negotiate(H.AcceptEncoding("*")))
+        self.assertIsNone(negotiate(H.AcceptEncoding("gzip;q=0, br")))
+        self.assertIsNone(negotiate(H.AcceptEncoding("identity")))
+
+
+class TestCompressResponse(unittest.TestCase):
+    def response(self, body=BODY, content_type=H.ContentType.TEXT_PLAIN):
+        return Response(body, (content_type,))
+
+    def test_sized_body(self):
+        response = compress_response(make_request(ACCEPT_GZIP),
+                self.response())
+        data = b"".join(response.body_buffers())
+        self.assertEqual(BODY, gunzip(data))
+        self.assertEqual(len(data), response.headers[H.ContentLength].value)
+        self.assertEqual("gzip", response.headers[H.ContentEncoding])
+        self.assertEqual("Accept-Encoding", response.headers[H.Vary])
+
+    def test_deflate(self):
+        response = compress_response(make_request(ACCEPT_DEFLATE),
+                self.response())
+        self.assertEqual(BODY, zlib.decompress(
+            b"".join(response.body_buffers())))
+        self.assertEqual("deflate", response.headers[H.ContentEncoding])
+
+    def test_not_accepted(self):
+        response = compress_response(make_request(), self.response())
+        self.assertEqual([BODY], response.body_buffers())
+        self.assertNotIn(H.ContentEncoding, response.headers)
+        self.assertEqual("Accept-Encoding", response.headers[H.Vary])
+
+    def test_small_body(self):
+        response = compress_response(make_request(ACCEPT_GZIP),
+                self.response(b"tiny"))
+        self.assertEqual([b"tiny"], response.body_buffers())
+        self.assertNotIn(H.ContentEncoding, response.headers)
+
+    def test_not_compressible(self):
+        response = compress_response(make_request(ACCEPT_GZIP),
+                self.response(content_type=H.ContentType("image/png")))
+        self.assertEqual([BODY], response.body_buffers())
+        self.assertNotIn(H.Vary, response.headers)
+
+    def test_already_encoded(self):
+        response = self.response()
+        response.headers.add(H.ContentEncoding("br"))
+        compress_response(make_request(ACCEPT_GZIP), response)
+        self.assertEqual([BODY], response.body_buffers())
+
+    def test_existing_vary(self):
+        response = self.response()
+        response.headers.add(H.Vary("Cookie"))
+        response = compress_response(make_request(ACCEPT_GZIP), response)
+        self.assertEqual("Cookie, Accept-Encoding", response.headers[H.Vary])
+
+    def test_awaitable_body(self):
+        loop = asyncio.new_event_loop()
+        future = asyncio.Future(loop=loop)
+        response = compress_response(make_request(ACCEPT_GZIP),
+                self.response(future))
+        self.assertIs(future, response.content)
+        self.assertNotIn(H.ContentEncoding, response.headers)
+        loop.close()
+
+    def test_weakens_etag(self):
+        response = self.response()
+        response.headers.add(H.ETag("abc"))
+        response = compress_response(make_request(ACCEPT_GZIP), response)
+        self.assertEqual('W/"abc"', response.headers[H.ETag])
+
+    def test_streamed_body(self):
+        response = self.response(iter([BODY[:500], BODY[500:]]))
+        response.headers.add(H.ContentLength(len(BODY)))
+        response = compress_response(make_request(ACCEPT_GZIP), response)
+        self.assertNotIn(H.ContentLength, response.headers)
+        self.assertEqual(BODY, gunzip(b"".join(response.body_buffers())))
+
+    def test_response_not_modified(self):
+        response = self.response()
+        compressed = compress_response(make_request(ACCEPT_GZIP), response)
+        self.assertIsNot(response, compressed)
+        self.assertEqual((BODY,), response.content)
+        self.assertNotIn(H.ContentEncoding, response.headers)
+        self.assertNotIn(H.Vary, response.headers)
+
+    def test_keeps_status(self):
+        response = self.response()
+        response.code = 404
+        response.title = response.reason = "Not Found"
+        compressed = compress_response(make_request(ACCEPT_GZIP), response)
+        self.assertEqual(b"HTTP/1.1 404 Not Found\r\n",
+                compressed.status_line)
+
+    def test_partial_content(self):
+        response = self.response()
+        response.code = 206
+        response = compress_response(make_request(ACCEPT_GZIP), response)
+        self.assertNotIn(H.ContentEncoding, response.headers)
+        response = self.response()
+        response.headers.add(H.ContentRange(0, 100, len(BODY)))
+        response = compress_response(make_request(ACCEPT_GZIP), response)
+        self.assertNotIn(H.ContentEncoding, response.headers)
+        self.assertEqual([BODY], response.body_buffers())
+
+    def test_drops_accept_ranges(self):
+        response = self.response()
+        response.headers.add(H.AcceptRanges("bytes"))
+        compressed = compress_response(make_request(ACCEPT_GZIP), response)
+        self.assertNotIn(H.AcceptRanges, compressed.headers)
+        compressed = compress_response(make_request(), response)
+        self.assertEqual("bytes", compressed.headers[H.AcceptRanges])
+
+
+class TestCompressorProtocol(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.transport = FakeTransport()
+        self.protocol = HTTPProtocol(Compressor(self.handler), self.loop)
+        self.protocol.connection_made(self.transport)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def handler(self, request):
+        if request.path == "/shared":
+            return SHARED
+        if request.path == "/stream":
+            body = AsyncChunks(self.loop, [BODY[:500], BODY[500:]])
+        else:
+            body = BODY
+        future = asyncio.Future(loop=self.loop)
+        self.loop.call_soon(future.set_result,
+                Response(body, (H.ContentType.TEXT_PLAIN,)))
+        return future
+
+    def split(self):
+        head, _, body = self.transport.data.partition(b"\r\n\r\n")
+        return head + b"\r\n", body
+
+    def test_awaitable_response(self):
+        self.protocol.data_received(b"GET / HTTP/1.1\r\n"
+                b"Accept-Encoding: gzip\r\n\r\n")
+        run_pending(self.loop)
+        head, body = self.split()
+        self.assertIn(b"Content-Encoding: gzip\r\n", head)
+        self.assertEqual(BODY, gunzip(body))
+
+    def test_async_stream(self):
+        self.protocol.data_received(b"GET /stream HTTP/1.1\r\n"
+                b"Accept-Encoding: gzip\r\n\r\n")
+        run_pending(self.loop)
+        head, body = self.split()
+        self.assertIn(b"Transfer-Encoding: chunked\r\n", head)
+        data = b""
+        while True:
+            size, _, body = body.partition(b"\r\n")
+            size = int(size, 16)
+            if not size:
+                break
+            data, body = data + body[:size], body[size + 2:]
+        self.assertEqual(BODY, gunzip(data))
+
+    def test_shared_response(self):
+        self.protocol.data_received(b"GET /shared HTTP/1.1\r\n"
+                b"Accept-Encoding: gzip\r\n\r\n")
+        head, body = self.split()
+        self.assertIn(b"Content-Encoding: gzip\r\n", head)
+        self.assertEqual(BODY, gunzip(body))
+        self.transport.drain()
+        self.protocol.data_received(b"GET /shared HTTP/1.1\r\n\r\n")
+        head, body = self.split()
+        self.assertNotIn(b"Content-Encoding", head)
+        self.assertEqual(BODY, body)
@@ -0,0 +1,194 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from trololio import asyncio
+from .. import headers as H
+from ..conditional import ConditionalGet, ETagCache, compute_etag, \
+        not_modified
+from ..protocol import HTTPProtocol
+from ..response import Response
+from .test_protocol import FakeTransport, AsyncChunks, make_request, \
+        run_pending
+
+
+class TestDateHeaders(unittest.TestCase):
+    def test_format(self):
+        self.assertEqual("Sun, 06 Nov 1994 08:49:37 GMT",
+                H.LastModified(784111777).string_value)
+
+    def test_parse(self):
+        for value in ("Sun, 06 Nov 1994 08:49:37 GMT",
+                "Sunday, 06-Nov-94 08:49:37 GMT",
+                "Sun Nov  6 08:49:37 1994"):
+            header = H.parse_header("If-Modified-Since", value)
+            self.assertIsInstance(header, H.IfModifiedSince)
+            self.assertEqual(value, header.string_value)
+            self.assertEqual(784111777, header.value, value)
+
+    def test_invalid(self):
+        header = H.IfModifiedSince.from_string("yesterday")
+        self.assertIsNone(header.value)
+        self.assertEqual("yesterday", header.string_value)
+
+
+class TestETagHeaders(unittest.TestCase):
+    def test_etag(self):
+        self.assertEqual('"abc"', H.ETag("abc").string_value)
+        weak = H.ETag("abc", weak=True)
+        self.assertEqual('W/"abc"', weak.string_value)
+        self.assertTrue(weak.weak)
+        self.assertEqual('"abc"', weak.opaque_tag)
+        self.assertIs(weak, weak.weaken())
+        self.assertEqual(weak, H.ETag("abc").weaken())
+
+    def test_if_none_match(self):
+        header = H.IfNoneMatch('"a", W/"b,c"')
+        self.assertTrue(header.matches(H.ETag("a")))
+        self.assertTrue(header.matches(H.ETag("a", weak=True)))
+        self.assertTrue(header.matches(H.ETag("b,c")))
+        self.assertFalse(header.matches(H.ETag("b")))
+        self.assertFalse(header.matches(None))
+        self.assertTrue(H.IfNoneMatch("*").matches(None))
+
+
+class TestNotModified(unittest.TestCase):
+    def response(self):
+        return Response(b"body", (H.ETag("v1"), H.LastModified(1000)))
+
+    def test_etag(self):
+        self.assertTrue(not_modified(make_request(b'If-None-Match: "v1"'),
+            self.response()))
+        self.assertFalse(not_modified(make_request(b'If-None-Match: "v2"'),
+            self.response()))
+
+    def test_if_none_match_takes_precedence(self):
+        request = make_request(b'If-None-Match: "v2"',
+                b"If-Modified-Since: " + H.http_date(2000).encode("ascii"))
+        self.assertFalse(not_modified(request, self.response()))
+
+    def test_modified_since(self):
+        for date, expected in ((999, False), (1000, True), (2000, True)):
+            request = make_request(b"If-Modified-Since: "
+                    + H.http_date(date).encode("ascii"))
+            self.assertEqual(expected,
+                    not_modified(request, self.response()), date)
+
+    def test_only_get_and_head(self):
+        request = make_request(b'If-None-Match: "v1"', method=b"POST")
+        self.assertFalse(not_modified(request, self.response()))
+
+
+class TestConditionalGet(unittest.TestCase):
+    def setUp(self):
+        self.produced = 0
+        self.cache = ETagCache()
+
+    def body(self):
+        self.produced += 1
+        yield b"streamed "
+        yield b"body"
+
+    def stream_handler(self, request):
+        return Response(self.body(), (H.LastModified(1000),))
+
+    def test_handler_validators(self):
+        def handler(request):
+            return Response(self.body(), (H.ETag("v1"),
+                H.CustomHeader("Cache-Control", "max-age=60")))
+        response = ConditionalGet(handler)(
+                make_request(b'If-None-Match: "v1"'))
+        self.assertEqual(304, response.code)
+        self.assertEqual('"v1"', response.headers[H.ETag])
+        self.assertEqual("max-age=60", response.headers["Cache-Control"])
+        self.assertNotIn(H.ContentType, response.headers)
+        self.assertEqual(0, self.produced)
+
+    def test_sized_body(self):
+        wrapped = ConditionalGet(lambda request: Response(u"hello"))
+        response = wrapped(make_request())
+        etag = response.headers[H.ETag]
+        self.assertEqual(compute_etag([b"hello"]), etag)
+        response = wrapped(make_request(b"If-None-Match: " +
+            etag.string_value.encode("ascii")))
+        self.assertEqual(304, response.code)
+
+    def test_sized_body_not_from_cache(self):
+        bodies = [u"v1", u"v2"]
+        wrapped = ConditionalGet(lambda request: Response(bodies[0]),
+                self.cache)
+        etag = wrapped(make_request()).headers[H.ETag]
+        bodies.pop(0)
+        response = wrapped(make_request(b"If-None-Match: " +
+            etag.string_value.encode("ascii")))
+        self.assertEqual(200, response.code)
+        self.assertEqual(compute_etag([b"v2"]), response.headers[H.ETag])
+        self.assertEqual([b"v2"], response.body_buffers())
+
+    def test_streamed_body_uncached(self):
+        response = ConditionalGet(self.stream_handler)(make_request())
+        self.assertNotIn(H.ETag, response.headers)
+
+    def test_streamed_body_cached(self):
+        wrapped = ConditionalGet(self.stream_handler, self.cache)
+        response = wrapped(make_request())
+        self.assertNotIn(H.ETag, response.headers)
+        self.assertEqual(b"streamed body",
+                b"".join(response.body_buffers()))
+        self.assertEqual(1, self.produced)
+
+        etag = compute_etag([b"streamed body"])
+        response = wrapped(make_request())
+        self.assertEqual(etag, response.headers[H.ETag])
+        response = wrapped(make_request(b"If-None-Match: " +
+            etag.string_value.encode("ascii")))
+        self.assertEqual(304, response.code)
+        self.assertEqual(1, self.produced)
+
+    def test_cached_tag_needs_same_version(self):
+        wrapped = ConditionalGet(self.stream_handler, self.cache)
+        wrapped(make_request()).body_buffers()
+        self.cache.set("/", H.ETag("other"),
+                H.LastModified(5).string_value)
+        self.assertNotIn(H.ETag, wrapped(make_request()).headers)
+
+    def test_invalidate(self):
+        wrapped = ConditionalGet(self.stream_handler, self.cache)
+        wrapped(make_request()).body_buffers()
+        self.cache.invalidate("/")
+        self.assertNotIn(H.ETag, wrapped(make_request()).headers)
+
+
+class TestConditionalGetAsync(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.cache = ETagCache()
+        self.transport = FakeTransport()
+        self.protocol = HTTPProtocol(ConditionalGet(self.handler,
+            self.cache), self.loop)
+        self.protocol.connection_made(self.transport)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def handler(self, request):
+        future = asyncio.Future(loop=self.loop)
+        self.loop.call_soon(future.set_result,
+                Response(AsyncChunks(self.loop, [b"a", b"b"])))
+        return future
+
+    def test_async_stream(self):
+        self.protocol.data_received(b"GET /res HTTP/1.1\r\n\r\n")
+        run_pending(self.loop)
+        etag = compute_etag([b"ab"]).string_value.encode("ascii")
+        self.transport.drain()
+        self.protocol.data_received(b"GET /res HTTP/1.1\r\n"
+                b"If-None-Match: " + etag + b"\r\n\r\n")
+        run_pending(self.loop)
+        self.assertEqual(b"HTTP/1.1 304 Not Modified\r\n"
+                b"ETag: " + etag + b"\r\n\r\n", self.transport.data)
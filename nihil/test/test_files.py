@@ -0,0 +1,247 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from trololio import asyncio
+from .. import headers as H
+from .. import status
+from ..files import FileCache, FileResponse, FILE_CHUNK_SIZE
+from ..protocol import HTTPProtocol
+from .test_protocol import FakeTransport, make_request, run_pending
+import tempfile
+import shutil
+import socket
+import os
+
+
+DATA = bytes(bytearray(range(256))) * 1200
+
+
+class TestRangeHeader(unittest.TestCase):
+    def ranges(self, value, size=1000):
+        return H.Range(value).ranges(size)
+
+    def test_ranges(self):
+        self.assertEqual([(0, 500)], self.ranges("bytes=0-499"))
+        self.assertEqual([(500, 1000)], self.ranges("bytes=500-"))
+        self.assertEqual([(900, 1000)], self.ranges("bytes=-100"))
+        self.assertEqual([(0, 1000)], self.ranges("bytes=-2000"))
+        self.assertEqual([(990, 1000)], self.ranges("bytes=990-5000"))
+        self.assertEqual([(0, 10), (20, 30)],
+                self.ranges("bytes=20-29, 0-9"))
+
+    def test_merge(self):
+        self.assertEqual([(0, 30)], self.ranges("bytes=0-9,5-19,20-29"))
+
+    def test_unsatisfiable(self):
+        self.assertEqual([], self.ranges("bytes=1000-"))
+        self.assertEqual([], self.ranges("bytes=-0"))
+
+    def test_invalid(self):
+        for value in ("items=0-1", "bytes=", "bytes=5", "bytes=9-1",
+                "bytes=a-b", "bytes=--5", "bytes=-"):
+            self.assertIsNone(self.ranges(value), value)
+
+    def test_content_range(self):
+        self.assertEqual("bytes 0-499/1000",
+                H.ContentRange(0, 500, 1000).string_value)
+        self.assertEqual("bytes */1000", H.ContentRange(1000).string_value)
+
+
+class _TempFileMixin(object):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "data.bin")
+        with open(self.path, "wb") as f:
+            f.write(DATA)
+        self.cache = FileCache()
+
+    def tearDown(self):
+        self.cache.clear()
+        shutil.rmtree(self.tempdir)
+
+
+class TestFileResponse(_TempFileMixin, unittest.TestCase):
+    def response(self, range_value=None, **kw):
+        lines = () if range_value is None else (b"Range: " + range_value,)
+        return FileResponse(self.path, make_request(*lines),
+                cache=self.cache, **kw)
+
+    def body(self, response):
+        return b"".join(bytes(b) for b in response.body_buffers())
+
+    def test_whole_file(self):
+        response = self.response()
+        self.assertEqual(200, response.code)
+        self.assertEqual(len(DATA), response.headers[H.ContentLength].value)
+        self.assertEqual("bytes", response.headers[H.AcceptRanges])
+        st = os.stat(self.path)
+        self.assertEqual(int(st.st_mtime),
+                response.headers[H.LastModified].value)
+        self.assertIn(H.ETag, response.headers)
+        self.assertEqual("application/octet-stream",
+                response.headers[H.ContentType])
+        buffers = response.body_buffers()
+        self.assertTrue(all(len(b) <= FILE_CHUNK_SIZE for b in buffers))
+        self.assertEqual(DATA, b"".join(bytes(b) for b in buffers))
+
+    def test_content_type(self):
+        path = os.path.join(self.tempdir, "index.html")
+        with open(path, "wb") as f:
+            f.write(b"<html></html>")
+        response = FileResponse(path, cache=self.cache)
+        self.assertEqual("text/html", response.headers[H.ContentType])
+        response = FileResponse(path, content_type="text/plain",
+                cache=self.cache)
+        self.assertEqual("text/plain", response.headers[H.ContentType])
+
+    def test_empty_file(self):
+        path = os.path.join(self.tempdir, "empty")
+        open(path, "wb").close()
+        response = FileResponse(path, cache=self.cache)
+        self.assertEqual(0, response.headers[H.ContentLength].value)
+        self.assertEqual([], response.body_buffers())
+
+    def test_single_range(self):
+        response = self.response(b"bytes=100-199")
+        self.assertEqual(206, response.code)
+        self.assertEqual(b"HTTP/1.1 206 Partial Content\r\n",
+                response.status_line)
+        self.assertEqual("bytes 100-199/{}".format(len(DATA)),
+                response.headers[H.ContentRange])
+        self.assertEqual(100, response.headers[H.ContentLength].value)
+        self.assertEqual(DATA[100:200], self.body(response))
+
+    def test_multiple_ranges(self):
+        response = self.response(b"bytes=0-9,-10")
+        self.assertEqual(206, response.code)
+        content_type = response.headers[H.ContentType].string_value
+        self.assertTrue(content_type.startswith(
+            "multipart/byteranges; boundary="))
+        boundary = content_type.partition("boundary=")[2].encode("ascii")
+        body = self.body(response)
+        self.assertEqual(len(body), response.headers[H.ContentLength].value)
+        self.assertTrue(body.endswith(b"\r\n--" + boundary + b"--\r\n"))
+        parts = body.split(b"\r\n--" + boundary)[1:-1]
+        self.assertEqual(2, len(parts))
+        head, _, data = parts[1].partition(b"\r\n\r\n")
+        self.assertIn("Content-Range: bytes {0}-{1}/{2}".format(
+            len(DATA) - 10, len(DATA) - 1, len(DATA)).encode("ascii"), head)
+        self.assertEqual(DATA[-10:], data)
+
+    def test_unsatisfiable_range(self):
+        with self.assertRaises(status.HTTPRequestRangeNotSatisfiable) as cm:
+            self.response(b"bytes=99999999-")
+        self.assertEqual("bytes */{}".format(len(DATA)),
+                cm.exception.headers[H.ContentRange])
+
+    def test_invalid_range_ignored(self):
+        response = self.response(b"bytes=z-")
+        self.assertEqual(200, response.code)
+        self.assertEqual(len(DATA), response.headers[H.ContentLength].value)
+
+    def test_if_range(self):
+        etag, last_modified = self.cache.open(self.path).validators
+        for validator, code in ((etag.string_value, 206),
+                (last_modified.string_value, 206),
+                ('"other"', 200), (etag.weaken().string_value, 200),
+                ("Sun, 06 Nov 1994 08:49:37 GMT", 200)):
+            request = make_request(b"Range: bytes=0-9",
+                    b"If-Range: " + validator.encode("ascii"))
+            response = FileResponse(self.path, request, cache=self.cache)
+            self.assertEqual(code, response.code, validator)
+        self.assertEqual(DATA, self.body(response))
+
+    def test_not_found(self):
+        with self.assertRaises(status.HTTPNotFound):
+            FileResponse(os.path.join(self.tempdir, "missing"),
+                    cache=self.cache)
+        with self.assertRaises(status.HTTPNotFound):
+            FileResponse(self.tempdir, cache=self.cache)
+
+
+class TestFileCache(_TempFileMixin, unittest.TestCase):
+    def test_reuses_open_file(self):
+        self.assertIs(self.cache.open(self.path), self.cache.open(self.path))
+
+    def test_eviction(self):
+        cache = FileCache(max_entries=2)
+        paths = [os.path.join(self.tempdir, str(i)) for i in range(3)]
+        for path in paths:
+            open(path, "wb").close()
+        first = cache.open(paths[0])
+        cache.open(paths[1])
+        cache.open(paths[0])
+        cache.open(paths[2])
+        self.assertEqual(2, len(cache))
+        self.assertNotIn(paths[1], cache)
+        self.assertIs(first, cache.open(paths[0]))
+
+    def test_revalidation(self):
+        cache = FileCache(ttl=0)
+        entry = cache.open(self.path)
+        self.assertIs(entry, cache.open(self.path))
+        os.unlink(self.path)
+        with open(self.path, "wb") as f:
+            f.write(b"new contents")
+        entry = cache.open(self.path)
+        self.assertEqual(12, entry.stat.st_size)
+
+
+class TestFileProtocol(_TempFileMixin, unittest.TestCase):
+    def handler(self, request):
+        return FileResponse(self.path, request, cache=self.cache)
+
+    def test_fake_transport(self):
+        transport = FakeTransport()
+        protocol = HTTPProtocol(self.handler)
+        protocol.connection_made(transport)
+        protocol.data_received(b"GET / HTTP/1.1\r\nRange: bytes=5-9\r\n\r\n")
+        self.assertTrue(transport.data.startswith(
+            b"HTTP/1.1 206 Partial Content\r\n"))
+        self.assertTrue(transport.data.endswith(b"\r\n\r\n" + DATA[5:10]))
+
+    @unittest.skipUnless(hasattr(os, "sendfile")
+            and hasattr(socket, "socketpair"), "sendfile() not available")
+    def test_sendfile(self):
+        loop = asyncio.new_event_loop()
+        server, client = socket.socketpair()
+        try:
+            transport, _ = loop.run_until_complete(loop.create_connection(
+                lambda: HTTPProtocol(self.handler, loop), sock=server))
+            client.sendall(b"GET / HTTP/1.1\r\n\r\n"
+                    b"GET / HTTP/1.1\r\nRange: bytes=-3\r\n\r\n")
+            expected = len(DATA) + 3
+            received = []
+            client.setblocking(False)
+            def read():
+                try:
+                    received.append(client.recv(1 << 20))
+                except socket.error:
+                    pass
+                data = b"".join(received)
+                if data.count(b"\r\n\r\n") >= 2 and len(data) > expected:
+                    if data.endswith(DATA[-3:]):
+                        loop.stop()
+            loop.add_reader(client.fileno(), read)
+            loop.call_later(5, loop.stop)
+            loop.run_forever()
+            loop.remove_reader(client.fileno())
+            transport.close()
+            run_pending(loop)
+        finally:
+            client.close()
+            loop.close()
+        data = b"".join(received)
+        head, _, rest = data.partition(b"\r\n\r\n")
+        self.assertIn(b"Content-Length: {}\r\n".replace(b"{}",
+            str(len(DATA)).encode("ascii")), head + b"\r\n")
+        self.assertEqual(DATA, rest[:len(DATA)])
+        self.assertTrue(rest[len(DATA):].startswith(
+            b"HTTP/1.1 206 Partial Content\r\n"))
+        self.assertTrue(rest.endswith(b"\r\n\r\n" + DATA[-3:]))
@@ -42,6 +42,8 @@ header_data = (
         "Proxy-Authenticate: Basic realm=realm name\r\n"),
     (H.ProxyAuthorization("Basic", "payload"),
         "Proxy-Authorization: Basic payload\r\n"),
+    (H.TransferEncoding.CHUNKED,
+        "Transfer-Encoding: chunked\r\n"),
     (H.Server("python-foo/1.4.2"),
         "Server: python-foo/1.4.2\r\n"),
     (H.UserAgent("Mozilla/4.5 (FooBar)"),
@@ -171,3 +173,160 @@ class TestEnumHeader(unittest.TestCase):
             h = H.Connection("blergh")
         with self.assertRaises(ValueError):
             h = H.Connection(len(H.Connection.values))
+
+
+class TestHeaderToBytes(unittest.TestCase):
+    def test_matches_string_representation(self):
+        for header, representation in header_data:
+            self.assertEqual(representation.encode("latin-1"),
+                    header.to_bytes())
+
+    def test_encoded_value_is_cached(self):
+        h = H.ContentType("text/plain")
+        self.assertIs(h.to_bytes(), h.to_bytes())
+
+    def test_append_invalidates_cache(self):
+        h = H.Accept("text/plain")
+        self.assertEqual(b"Accept: text/plain\r\n", h.to_bytes())
+        h += "text/html"
+        self.assertEqual(b"Accept: text/plain, text/html\r\n", h.to_bytes())
+
+    def test_authorization_setters_invalidate_cache(self):
+        h = H.Authorization("Basic", "xyzpayload")
+        self.assertEqual(b"Authorization: Basic xyzpayload\r\n",
+                h.to_bytes())
+        h.method = "Digest"
+        self.assertEqual(b"Authorization: Digest xyzpayload\r\n",
+                h.to_bytes())
+        h.payload = "foo"
+        self.assertEqual(b"Authorization: Digest foo\r\n", h.to_bytes())
+
+    def test_authenticate_setters_invalidate_cache(self):
+        h = H.WWWAuthenticate("Basic", "foorealm")
+        self.assertEqual(b"WWW-Authenticate: Basic realm=foorealm\r\n",
+                h.to_bytes())
+        h.realm = "bar"
+        self.assertEqual(b"WWW-Authenticate: Basic realm=bar\r\n",
+                h.to_bytes())
+        h.method = "Digest"
+        self.assertEqual(b"WWW-Authenticate: Digest realm=bar\r\n",
+                h.to_bytes())
+
+
+class TestHeaderRegistry(unittest.TestCase):
+    def test_lookup(self):
+        self.assertIs(H.ContentType, H.lookup("Content-Type"))
+        self.assertIs(H.ContentType, H.lookup("content-type"))
+        self.assertIs(H.WWWAuthenticate, H.lookup("WWW-AUTHENTICATE"))
+        self.assertIsNone(H.lookup("X-Unknown"))
+
+    def test_base_classes_not_registered(self):
+        self.assertNotIn(None, H.registry.values())
+        for cls in (H.Header, H.CustomHeader, H._NumericHeader):
+            self.assertNotIn(cls, H.registry.values())
+
+    def test_user_subclass_registered(self):
+        class XRequestId(H._StringHeader):
+            name = "X-Test-Registry-Request-Id"
+        self.assertIs(XRequestId, H.lookup("x-test-registry-request-id"))
+
+    def test_parse_header(self):
+        h = H.parse_header("host", "example.com:8080")
+        self.assertIsInstance(h, H.Host)
+        self.assertEqual("Host: example.com:8080\r\n", str(h))
+        h = H.parse_header("X-Foo", "bar")
+        self.assertIsInstance(h, H.CustomHeader)
+        self.assertEqual("X-Foo: bar\r\n", str(h))
+
+    def test_parse_enum_header(self):
+        self.assertEqual(H.Connection.KEEP_ALIVE,
+                H.parse_header("Connection", "Keep-Alive"))
+        h = H.parse_header("Connection", "Upgrade")
+        self.assertIsInstance(h, H.CustomHeader)
+
+    def test_parse_authorization(self):
+        h = H.parse_header("Authorization", "Bearer  token")
+        self.assertEqual("Bearer", h.method)
+        self.assertEqual("token", h.payload)
+        h = H.parse_header("WWW-Authenticate", "Basic realm=foo")
+        self.assertEqual("Basic", h.method)
+        self.assertEqual("foo", h.realm)
+
+    def test_numeric_conversion_is_lazy(self):
+        h = H.parse_header("Content-Length", "1234")
+        self.assertIsInstance(h, H.ContentLength)
+        self.assertEqual("1234", h._value)
+        self.assertEqual(b"Content-Length: 1234\r\n", h.to_bytes())
+        self.assertEqual(1234, h.value)
+        self.assertEqual(H.ContentLength(1234), h)
+
+    def test_numeric_conversion_error(self):
+        h = H.parse_header("Content-Length", "foo")
+        with self.assertRaises(ValueError):
+            h.value
+
+
+class TestHeaderMap(unittest.TestCase):
+    def test_lookup(self):
+        m = H.HeaderMap((H.ContentType.TEXT_HTML, H.ContentLength(42)))
+        self.assertEqual(2, len(m))
+        self.assertIs(H.ContentType.TEXT_HTML, m["content-type"])
+        self.assertIs(H.ContentType.TEXT_HTML, m[H.ContentType])
+        self.assertEqual(H.ContentLength(42), m.get("Content-Length"))
+        self.assertIsNone(m.get("Location"))
+        self.assertIn(H.ContentType, m)
+        self.assertNotIn("Location", m)
+        with self.assertRaises(KeyError):
+            m["Location"]
+
+    def test_single_value_replaces(self):
+        m = H.HeaderMap((H.ContentType.TEXT_HTML, H.Server("foo")))
+        m.add(H.ContentType.TEXT_PLAIN)
+        self.assertEqual([H.ContentType.TEXT_PLAIN, H.Server("foo")],
+                list(m))
+
+    def test_multiple_values_combine(self):
+        accept = H.Accept("text/plain")
+        m = H.HeaderMap((accept,))
+        m.add(H.Accept("text/html"))
+        m.add(H.CustomHeader("x-foo", "a"))
+        m.add(H.CustomHeader("X-Foo", "b"))
+        self.assertEqual(2, len(m))
+        self.assertEqual("text/plain, text/html", m["Accept"].string_value)
+        self.assertEqual("a, b", m["X-Foo"].string_value)
+        # The original header object is left untouched.
+        self.assertEqual("text/plain", accept.string_value)
+
+    def test_set_replaces(self):
+        m = H.HeaderMap((H.Accept("text/plain"),))
+        m.set(H.Accept("text/html"))
+        self.assertEqual("text/html", m["Accept"].string_value)
+
+    def test_delete(self):
+        m = H.HeaderMap((H.Server("foo"), H.ContentLength(1),
+            H.Location("/")))
+        del m["server"]
+        self.assertEqual([H.ContentLength(1), H.Location("/")], list(m))
+        self.assertEqual(H.Location("/"), m.pop("Location"))
+        self.assertIsNone(m.pop("Location"))
+        self.assertEqual(H.ContentLength(1), m[H.ContentLength])
+
+    def test_copy_on_write(self):
+        base = H.HeaderMap((H.ContentType.TEXT_HTML,))
+        derived = base.derive(H.Location("/foo"))
+        other = base.copy()
+        other.add(H.ContentType.TEXT_PLAIN)
+        self.assertEqual([H.ContentType.TEXT_HTML], list(base))
+        self.assertEqual([H.ContentType.TEXT_HTML, H.Location("/foo")],
+                list(derived))
+        self.assertEqual([H.ContentType.TEXT_PLAIN], list(other))
+        base.add(H.Server("bar"))
+        self.assertEqual(1, len(other))
+        self.assertEqual(2, len(derived))
+
+    def test_to_bytes(self):
+        m = H.HeaderMap((H.ContentType.TEXT_PLAIN, H.ContentLength(5)))
+        self.assertEqual(b"Content-Type: text/plain\r\n"
+                b"Content-Length: 5\r\n\r\n", m.to_bytes())
+        self.assertEqual(b"HTTP/1.1 200 OK\r\n\r\n",
+                H.HeaderMap().to_bytes(b"HTTP/1.1 200 OK\r\n"))
@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from os import path, environ
+import subprocess
+import platform
+import sys
+
+# Time allowed for importing nihil.status, in seconds. Only time spent in
+# the nihil modules themselves counts, dependencies like six are excluded.
+IMPORT_TIME_BUDGET = 0.010
+
+# Modules which must not be imported as a side effect of importing
+# nihil.status, because they are only needed later on (if at all).
+LAZY_MODULES = ("copy", "email", "html", "string", "textwrap")
+
+TOP_DIR = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
+
+
+def run_python(*args):
+    env = dict(environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPATH"] = TOP_DIR
+    return subprocess.check_output((sys.executable,) + args, env=env,
+            stderr=subprocess.STDOUT, cwd=TOP_DIR).decode("utf-8")
+
+
+def nihil_import_time(module):
+    total = 0
+    for line in run_python("-X", "importtime", "-c",
+            "import " + module).splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if fields[2].strip().split(".")[0] == "nihil":
+            total += int(fields[0])
+    return total / 1e6
+
+
+@unittest.skipIf(platform.python_implementation() != "CPython"
+        or sys.version_info < (3, 7), "needs CPython 3.7 or newer")
+class TestImportTime(unittest.TestCase):
+    def setUp(self):
+        # Make sure that byte-compiled files are available.
+        run_python("-c", "import nihil.status")
+
+    def test_status_import_time(self):
+        elapsed = min(nihil_import_time("nihil.status") for _ in range(3))
+        self.assertLess(elapsed, IMPORT_TIME_BUDGET)
+
+    def test_status_lazy_modules(self):
+        output = run_python("-c", "import sys, nihil.status; "
+                "print(' '.join(sorted(sys.modules)))")
+        imported = set(output.split())
+        for name in LAZY_MODULES:
+            self.assertNotIn(name, imported)
+
+    def test_package_import_is_lazy(self):
+        output = run_python("-c", "import sys, nihil; "
+                "print(' '.join(sorted(sys.modules)))")
+        self.assertNotIn("nihil.status", output.split())
+        self.assertIn("nihil.status", run_python("-c", "import sys, nihil; "
+                "nihil.status; print(' '.join(sorted(sys.modules)))").split())
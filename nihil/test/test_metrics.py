@@ -0,0 +1,131 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from trololio import asyncio
+from ..metrics import Histogram, Metrics
+from ..protocol import HTTPProtocol
+from ..response import Response
+from ..routing import Router
+from .test_protocol import FakeTransport, run_pending
+
+
+class TickingMetrics(Metrics):
+    # Each reading of the clock advances it one millisecond.
+    def __init__(self, *arg, **kw):
+        super(TickingMetrics, self).__init__(*arg, **kw)
+        self.now = 0.0
+
+    def _clock(self):
+        self.now += 0.001
+        return self.now
+
+
+class TestHistogram(unittest.TestCase):
+    def test_buckets(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0, 3.0):
+            histogram.observe(value)
+        self.assertEqual([2, 1, 2], list(histogram.counts))
+        self.assertEqual(5, histogram.count)
+        self.assertAlmostEqual(5.65, histogram.total)
+        self.assertEqual([(0.1, 2), (1.0, 3), (float("inf"), 5)],
+                histogram.cumulative())
+
+    def test_reset(self):
+        histogram = Histogram((1,))
+        histogram.observe(2)
+        histogram.reset()
+        self.assertEqual(0, histogram.count)
+        self.assertEqual(0.0, histogram.total)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counts(self):
+        metrics = Metrics()
+        for code in (200, 200, 404, 410, 503, 999):
+            metrics.count(code)
+        self.assertEqual({0: 1, 200: 2, 404: 1, 410: 1, 503: 1},
+                metrics.status_counts())
+        counts = metrics.class_counts()
+        self.assertEqual(2, counts["success"])
+        self.assertEqual(2, counts["client_error"])
+        self.assertEqual(1, counts["server_error"])
+        self.assertEqual(0, counts["redirect"])
+
+    def test_render(self):
+        metrics = Metrics(buckets=(0.5,))
+        metrics.count(404)
+        metrics.observe("handler", 0.25)
+        text = metrics.render()
+        self.assertIn('nihil_responses_total{code="404"} 1\n', text)
+        self.assertIn('nihil_responses_class_total{class="client_error"} 1\n',
+                text)
+        self.assertIn('nihil_latency_seconds_bucket{stage="handler",'
+                'le="0.5"} 1\n', text)
+        self.assertIn('nihil_latency_seconds_bucket{stage="write",'
+                'le="+Inf"} 0\n', text)
+        self.assertIn('nihil_latency_seconds_count{stage="handler"} 1\n',
+                text)
+
+    def test_handler(self):
+        metrics = Metrics()
+        response = metrics(None)
+        self.assertTrue(b"".join(response.body_buffers()).startswith(
+            b"# TYPE nihil_responses_total counter\n"))
+
+    def test_reset(self):
+        metrics = Metrics()
+        metrics.count(200)
+        metrics.observe("total", 1)
+        metrics.reset()
+        self.assertEqual({}, metrics.status_counts())
+        self.assertEqual(0, metrics.histograms["total"].count)
+
+
+class TestProtocolMetrics(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.metrics = TickingMetrics()
+        self.router = Router(self.metrics)
+        self.router.add("/", lambda request: Response(b"ok"))
+        self.router.add("/later", self.later)
+        self.router.add("/metrics", self.metrics)
+        self.transport = FakeTransport()
+        self.protocol = HTTPProtocol(self.router, self.loop,
+                metrics=self.metrics)
+        self.protocol.connection_made(self.transport)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def later(self, request):
+        future = asyncio.Future(loop=self.loop)
+        self.loop.call_soon(future.set_result, Response(b"later"))
+        return future
+
+    def test_stages(self):
+        self.protocol.data_received(b"GET / HTTP/1.1\r\n\r\n"
+                b"GET /missing HTTP/1.1\r\n\r\nGET /later HTTP/1.1\r\n\r\n")
+        run_pending(self.loop)
+        self.assertEqual({200: 2, 404: 1}, self.metrics.status_counts())
+        for stage in ("parse", "route", "handler", "write", "total"):
+            self.assertEqual(3, self.metrics.histograms[stage].count, stage)
+
+    def test_bad_request(self):
+        self.protocol.data_received(b"bogus\r\n\r\n")
+        self.assertEqual({400: 1}, self.metrics.status_counts())
+        self.assertEqual(1, self.metrics.histograms["write"].count)
+        self.assertEqual(0, self.metrics.histograms["total"].count)
+
+    def test_endpoint(self):
+        self.protocol.data_received(b"GET / HTTP/1.1\r\n\r\n"
+                b"GET /metrics HTTP/1.1\r\n\r\n")
+        self.assertIn(b'\nnihil_responses_total{code="200"} 1\n',
+                self.transport.data)
+        self.assertIn(b"\r\nContent-Type: text/plain", self.transport.data)
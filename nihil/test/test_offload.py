@@ -0,0 +1,140 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from trololio import asyncio
+from ..offload import HandlerPool, _ExecutorIterator
+from ..protocol import HTTPProtocol
+from ..response import Response
+from .test_protocol import FakeTransport, run_pending
+import threading
+import os
+
+
+process_pool = HandlerPool(max_workers=1, processes=True)
+
+
+@process_pool.blocking
+def process_handler(request):
+    return Response(u"pid {}".format(os.getpid()))
+
+
+class TestHandlerPool(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.pool = HandlerPool(max_workers=1, loop=self.loop)
+        self.release = threading.Event()
+        self.threads = []
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.shutdown()
+        self.loop.close()
+
+    def handler(self, request):
+        self.threads.append(threading.current_thread())
+        if request.path == "/stream":
+            def chunks():
+                self.threads.append(threading.current_thread())
+                yield b"a"
+                yield b"b"
+            return Response(chunks())
+        if request.path == "/wait":
+            self.release.wait(5)
+        return Response(u"done")
+
+    def serve(self, data):
+        transport = FakeTransport()
+        protocol = HTTPProtocol(self.pool.blocking(self.handler), self.loop)
+        protocol.connection_made(transport)
+        protocol.data_received(data)
+        return transport
+
+    def wait(self, transport, suffix, timeout=5):
+        for _ in range(int(timeout / 0.01)):
+            if transport.data.endswith(suffix):
+                break
+            run_pending(self.loop)
+        return transport.data
+
+    def test_runs_in_executor(self):
+        transport = self.serve(b"GET / HTTP/1.1\r\n\r\n")
+        data = self.wait(transport, b"done")
+        self.assertTrue(data.startswith(b"HTTP/1.1 200 OK\r\n"))
+        self.assertNotEqual(threading.current_thread(), self.threads[0])
+        self.assertEqual(0, self.pool.pending)
+
+    def test_streams_iterator_body(self):
+        transport = self.serve(b"GET /stream HTTP/1.1\r\n\r\n")
+        data = self.wait(transport, b"0\r\n\r\n")
+        self.assertTrue(data.endswith(b"\r\n\r\n"
+            b"1\r\na\r\n1\r\nb\r\n0\r\n\r\n"))
+        self.assertNotEqual(threading.current_thread(), self.threads[1])
+
+    def test_saturation(self):
+        busy = self.serve(b"GET /wait HTTP/1.1\r\n\r\n")
+        rejected = self.serve(b"GET / HTTP/1.1\r\n\r\n")
+        self.assertTrue(rejected.data.startswith(
+            b"HTTP/1.1 503 Service Unavailable\r\n"))
+        self.assertIn(b"\r\nRetry-After: 1\r\n", rejected.data)
+        self.release.set()
+        self.assertTrue(self.wait(busy, b"done").endswith(b"done"))
+        accepted = self.serve(b"GET / HTTP/1.1\r\n\r\n")
+        self.assertTrue(self.wait(accepted, b"done").startswith(
+            b"HTTP/1.1 200 OK\r\n"))
+
+    def test_queue(self):
+        self.pool.capacity = 2
+        busy = self.serve(b"GET /wait HTTP/1.1\r\n\r\n")
+        queued = self.serve(b"GET / HTTP/1.1\r\n\r\n")
+        self.assertEqual(b"", queued.data)
+        self.release.set()
+        self.assertTrue(self.wait(queued, b"done").startswith(
+            b"HTTP/1.1 200 OK\r\n"))
+
+    def test_stream_counts_towards_capacity(self):
+        iterator = _ExecutorIterator(iter([b"a"]), self.pool)
+        future = iterator.__anext__()
+        self.assertEqual(1, self.pool.pending)
+        rejected = self.serve(b"GET / HTTP/1.1\r\n\r\n")
+        self.assertTrue(rejected.data.startswith(
+            b"HTTP/1.1 503 Service Unavailable\r\n"))
+        self.assertEqual(b"a", self.loop.run_until_complete(future))
+        self.assertEqual(0, self.pool.pending)
+
+    def test_executor_needs_max_workers(self):
+        with self.assertRaises(ValueError):
+            HandlerPool(executor=object())
+
+
+class TestProcessPool(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        process_pool._loop = self.loop
+
+    def tearDown(self):
+        process_pool._loop = None
+        self.loop.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        process_pool.shutdown()
+
+    def test_decorated_handler(self):
+        transport = FakeTransport()
+        protocol = HTTPProtocol(process_handler, self.loop)
+        protocol.connection_made(transport)
+        protocol.data_received(b"GET / HTTP/1.1\r\n\r\n")
+        for _ in range(500):
+            if b"pid" in transport.data:
+                break
+            run_pending(self.loop)
+        head, _, body = transport.data.partition(b"\r\n\r\n")
+        self.assertTrue(head.startswith(b"HTTP/1.1 200 OK\r\n"))
+        self.assertNotEqual(u"pid {}".format(os.getpid()).encode(), body)
+        self.assertEqual(0, process_pool.pending)
@@ -0,0 +1,296 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from .. import headers as H
+from .. import status
+from ..parser import RequestParser, ResponseParser, Limits
+
+
+BROWSER_REQUEST = \
+        b"GET /index.html?lang=en HTTP/1.1\r\n" \
+        b"Host: www.example.com\r\n" \
+        b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:34.0)\r\n" \
+        b"Accept: text/html,application/xhtml+xml\r\n" \
+        b"Connection: keep-alive\r\n" \
+        b"Authorization: Basic dXNlcjpwYXNz\r\n" \
+        b"X-Requested-With: XMLHttpRequest\r\n" \
+        b"\r\n"
+
+
+class TestRequestParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = RequestParser()
+
+    def parse(self, *fragments):
+        requests = []
+        for fragment in fragments:
+            self.parser.feed(fragment)
+            while True:
+                request = self.parser.next_request()
+                if request is None:
+                    break
+                requests.append(request)
+        return requests
+
+    def test_request_line(self):
+        request, = self.parse(BROWSER_REQUEST)
+        self.assertEqual("GET", request.method)
+        self.assertEqual("/index.html?lang=en", request.uri)
+        self.assertEqual("/index.html", request.path)
+        self.assertEqual("lang=en", request.query)
+        self.assertEqual("HTTP/1.1", request.version)
+        self.assertEqual(b"", request.body)
+
+    def test_typed_headers(self):
+        request, = self.parse(BROWSER_REQUEST)
+        self.assertEqual(H.Host("www.example.com"), request.header("host"))
+        self.assertIs(H.Connection, request.header("Connection").__class__)
+        self.assertEqual(H.Connection.KEEP_ALIVE,
+                request.header("Connection"))
+        self.assertEqual("Basic", request.header("Authorization").method)
+        self.assertEqual("dXNlcjpwYXNz",
+                request.header("Authorization").payload)
+        self.assertIsInstance(request.header("X-Requested-With"),
+                H.CustomHeader)
+        self.assertEqual("XMLHttpRequest", request.header("x-requested-with"))
+
+    def test_unknown_enum_value(self):
+        request, = self.parse(b"GET / HTTP/1.1\r\n"
+                b"Connection: Upgrade\r\n\r\n")
+        self.assertIsInstance(request.header("Connection"), H.CustomHeader)
+        self.assertEqual("Upgrade", request.header("Connection"))
+
+    def test_byte_by_byte(self):
+        data = BROWSER_REQUEST
+        fragments = [data[i:i+1] for i in range(len(data))]
+        request, = self.parse(*fragments)
+        self.assertEqual("/index.html?lang=en", request.uri)
+        self.assertEqual(6, len(request.headers))
+
+    def test_multiple_requests(self):
+        requests = self.parse(BROWSER_REQUEST * 3)
+        self.assertEqual(3, len(requests))
+        self.assertEqual(0, self.parser.buffered)
+
+    def test_leading_empty_lines(self):
+        request, = self.parse(b"\r\n" + BROWSER_REQUEST)
+        self.assertEqual("GET", request.method)
+
+    def test_content_length_body(self):
+        request, = self.parse(b"POST /form HTTP/1.1\r\n"
+                b"Content-Length: 11\r\n\r\nhello", b" world")
+        self.assertEqual(b"hello world", request.body)
+        self.assertEqual(11, request.header("content-length").value)
+
+    def test_chunked_body(self):
+        requests = self.parse(b"POST / HTTP/1.1\r\n"
+                b"Transfer-Encoding: chunked\r\n\r\n"
+                b"5\r\nhello\r\n", b"6;ext=1\r\n worl", b"d\r\n0\r\n",
+                b"X-Trailer: yes\r\n\r\nGET / HTTP/1.1\r\n\r\n")
+        self.assertEqual(2, len(requests))
+        self.assertEqual(b"hello world", requests[0].body)
+        self.assertEqual("yes", requests[0].header("X-Trailer"))
+
+    def test_incomplete(self):
+        self.assertEqual([], self.parse(BROWSER_REQUEST[:-1]))
+        self.assertEqual(1, len(self.parse(BROWSER_REQUEST[-1:])))
+
+
+class TestRequestParserErrors(unittest.TestCase):
+    def assertParseError(self, data, cls=status.HTTPBadRequest):
+        parser = RequestParser()
+        parser.feed(data)
+        with self.assertRaises(cls):
+            parser.next_request()
+
+    def test_bad_request_line(self):
+        self.assertParseError(b"GET /\r\n\r\n")
+        self.assertParseError(b"GET  / HTTP/1.1\r\n\r\n")
+
+    def test_bad_version(self):
+        self.assertParseError(b"GET / HTTP/2.0\r\n\r\n",
+                status.HTTPVersionNotSupported)
+
+    def test_bad_header(self):
+        self.assertParseError(b"GET / HTTP/1.1\r\nFoo\r\n\r\n")
+        self.assertParseError(b"GET / HTTP/1.1\r\nFoo : bar\r\n\r\n")
+
+    def test_obsolete_line_folding(self):
+        self.assertParseError(b"GET / HTTP/1.1\r\nFoo: bar\r\n baz\r\n\r\n")
+
+    def test_bad_content_length(self):
+        self.assertParseError(b"POST / HTTP/1.1\r\n"
+                b"Content-Length: foo\r\n\r\n")
+        self.assertParseError(b"POST / HTTP/1.1\r\n"
+                b"Content-Length: -1\r\n\r\n")
+        self.assertParseError(b"POST / HTTP/1.1\r\n"
+                b"Content-Length: +3\r\n\r\nabc")
+        self.assertParseError(b"POST / HTTP/1.1\r\n"
+                b"Content-Length: 1_0\r\n\r\n0123456789")
+
+    def test_conflicting_content_length(self):
+        self.assertParseError(b"POST / HTTP/1.1\r\n"
+                b"Content-Length: 3\r\nContent-Length: 4\r\n\r\nabcd")
+
+    def test_repeated_content_length(self):
+        parser = RequestParser()
+        parser.feed(b"POST / HTTP/1.1\r\n"
+                b"Content-Length: 3\r\nContent-Length: 3\r\n\r\nabc")
+        request = parser.next_request()
+        self.assertEqual(b"abc", request.body)
+
+    def test_bad_chunk_size(self):
+        self.assertParseError(b"POST / HTTP/1.1\r\n"
+                b"Transfer-Encoding: chunked\r\n\r\nxyz\r\n")
+        self.assertParseError(b"POST / HTTP/1.1\r\n"
+                b"Transfer-Encoding: chunked\r\n\r\n0x3\r\nabc\r\n")
+        self.assertParseError(b"POST / HTTP/1.1\r\n"
+                b"Transfer-Encoding: chunked\r\n\r\n-3\r\nabc\r\n")
+
+    def test_bad_transfer_encoding(self):
+        self.assertParseError(b"POST / HTTP/1.1\r\n"
+                b"Transfer-Encoding: gzip\r\n\r\n")
+
+
+class TestRequestParserLimits(unittest.TestCase):
+    def setUp(self):
+        self.parser = RequestParser(Limits(request_line=64, header=64,
+            headers=4, header_bytes=160, body=100))
+
+    def feed(self, data):
+        self.parser.feed(data)
+        return self.parser.next_request()
+
+    def test_request_line(self):
+        with self.assertRaises(status.HTTPRequestURITooLong):
+            self.feed(b"GET /" + b"a" * 100)
+
+    def test_header_line(self):
+        self.feed(b"GET / HTTP/1.1\r\n")
+        self.assertIsNone(self.feed(b"X-Long: " + b"a" * 50))
+        with self.assertRaises(status.HTTPRequestHeaderFieldsTooLarge):
+            self.feed(b"a" * 10)
+
+    def test_header_count(self):
+        self.feed(b"GET / HTTP/1.1\r\n" + b"X-A: b\r\n" * 4)
+        with self.assertRaises(status.HTTPRequestHeaderFieldsTooLarge):
+            self.feed(b"X-A: b\r\n")
+
+    def test_header_bytes(self):
+        self.feed(b"GET / HTTP/1.1\r\n"
+                + (b"X-A: " + b"b" * 45 + b"\r\n") * 3)
+        with self.assertRaises(status.HTTPRequestHeaderFieldsTooLarge):
+            self.feed(b"X-A: bbbbbbbbbbbb")
+
+    def test_limits_per_request(self):
+        data = b"GET / HTTP/1.1\r\n" + b"X-A: b\r\n" * 4 + b"\r\n"
+        self.assertIsNotNone(self.feed(data))
+        self.assertIsNotNone(self.feed(data))
+
+    def test_content_length(self):
+        self.assertIsNotNone(self.feed(b"POST / HTTP/1.1\r\n"
+            b"Content-Length: 100\r\n\r\n" + b"x" * 100))
+        with self.assertRaises(status.HTTPRequestEntityTooLarge):
+            self.feed(b"POST / HTTP/1.1\r\nContent-Length: 101\r\n\r\n")
+
+    def test_chunked_body(self):
+        self.feed(b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+                b"40\r\n" + b"x" * 64 + b"\r\n")
+        with self.assertRaises(status.HTTPRequestEntityTooLarge):
+            self.feed(b"40\r\n")
+
+    def test_unlimited(self):
+        parser = RequestParser(Limits(request_line=None, body=None))
+        parser.feed(b"GET /" + b"a" * 100000 + b" HTTP/1.1\r\n\r\n")
+        self.assertEqual(100001, len(parser.next_request().uri))
+
+
+class TestResponseParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = ResponseParser()
+
+    def body(self):
+        return b"".join(self.parser.read())
+
+    def test_content_length(self):
+        self.parser.feed(b"HTTP/1.1 200 OK\r\nContent-Length: 6\r\n\r\nfoo")
+        head = self.parser.next_response()
+        self.assertEqual(("HTTP/1.1", 200, "OK"),
+                (head.version, head.code, head.reason))
+        self.assertEqual(6, head.headers[H.ContentLength].value)
+        self.assertTrue(head.keep_alive)
+        self.assertEqual(b"foo", self.body())
+        self.assertFalse(self.parser.complete)
+        self.parser.feed(b"bar")
+        self.assertEqual(b"bar", self.body())
+        self.assertTrue(self.parser.complete)
+
+    def test_chunked(self):
+        self.parser.feed(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n"
+                b"\r\n3\r\nfoo\r\n3\r\nba")
+        self.assertIsNotNone(self.parser.next_response())
+        self.assertEqual(b"fooba", self.body())
+        self.parser.feed(b"r\r\n0\r\n\r\n")
+        self.assertEqual(b"r", self.body())
+        self.assertTrue(self.parser.complete)
+
+    def test_until_close(self):
+        self.parser.feed(b"HTTP/1.0 200 OK\r\n\r\nfoo")
+        head = self.parser.next_response()
+        self.assertFalse(head.keep_alive)
+        self.assertEqual(b"foo", self.body())
+        self.assertFalse(self.parser.complete)
+        self.parser.eof()
+        self.assertTrue(self.parser.complete)
+        self.assertTrue(self.parser.until_close)
+
+    def test_no_body(self):
+        self.parser.feed(b"HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\n"
+                b"HTTP/1.1 304 Not Modified\r\nContent-Length: 3\r\n\r\n"
+                b"HTTP/1.1 204 No Content\r\n\r\n")
+        for method in ("HEAD", "GET", "GET"):
+            self.assertIsNotNone(self.parser.next_response(method))
+            self.assertEqual(b"", self.body())
+            self.assertTrue(self.parser.complete)
+        self.assertTrue(self.parser.idle)
+
+    def test_interim_skipped(self):
+        self.parser.feed(b"HTTP/1.1 100 Continue\r\n\r\n"
+                b"HTTP/1.1 201 Created\r\nContent-Length: 0\r\n\r\n")
+        self.assertEqual(201, self.parser.next_response().code)
+
+    def test_pipelined(self):
+        self.parser.feed(b"HTTP/1.1 200 OK\r\nContent-Length: 1\r\n\r\na"
+                b"HTTP/1.1 404 Not Found\r\nContent-Length: 1\r\n\r\nb")
+        self.assertEqual(200, self.parser.next_response().code)
+        with self.assertRaises(ValueError):
+            self.parser.next_response()
+        self.assertEqual(b"a", self.body())
+        self.assertEqual(404, self.parser.next_response().code)
+        self.assertEqual(b"b", self.body())
+
+    def test_malformed(self):
+        for data in (b"HTTP/2 200 OK\r\n", b"HTTP/1.1 2x0 OK\r\n",
+                b"HTTP/1.1 200 OK\r\nBad header\r\n"):
+            parser = ResponseParser()
+            parser.feed(data)
+            with self.assertRaises(status.HTTPBadGateway):
+                parser.next_response()
+
+    def test_incomplete(self):
+        self.parser.feed(b"HTTP/1.1 200 OK\r\nContent-Length: 6\r\n\r\nfoo")
+        self.parser.next_response()
+        with self.assertRaises(status.HTTPBadGateway):
+            self.parser.eof()
+
+    def test_limits(self):
+        parser = ResponseParser(Limits(body=2))
+        parser.feed(b"HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\n")
+        with self.assertRaises(status.HTTPBadGateway):
+            parser.next_response()
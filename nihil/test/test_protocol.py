@@ -0,0 +1,543 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from trololio import asyncio
+from .. import headers as H
+from .. import status
+from ..parser import RequestParser
+from ..response import Response
+from ..protocol import HTTPProtocol, _StopAsyncIteration
+
+
+class FakeTransport(object):
+    def __init__(self, protocol=None, high_water=None, peername=None):
+        self.written = []
+        self.closed = False
+        self.protocol = protocol
+        self.high_water = high_water
+        self.paused = False
+        self.reading = True
+        self.extra = {"peername": peername}
+
+    def get_extra_info(self, name, default=None):
+        return self.extra.get(name, default)
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        if self.high_water is not None and not self.paused \
+                and len(self.data) > self.high_water:
+            self.paused = True
+            self.protocol.pause_writing()
+
+    def drain(self):
+        data = self.data
+        self.written = []
+        if self.paused:
+            self.paused = False
+            self.protocol.resume_writing()
+        return data
+
+    def writelines(self, buffers):
+        for b in buffers:
+            self.write(b)
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+    def close(self):
+        self.closed = True
+
+    @property
+    def data(self):
+        return b"".join(self.written)
+
+
+def hello_handler(request):
+    return Response(u"Hello, " + request.path,
+            (H.ContentType.TEXT_PLAIN,))
+
+
+class _TestProtocolBase(object):
+    handler = staticmethod(hello_handler)
+
+    def setUp(self):
+        self.transport = FakeTransport()
+        self.protocol = HTTPProtocol(self.handler)
+        self.protocol.connection_made(self.transport)
+
+
+class TestProtocolKeepAlive(_TestProtocolBase, unittest.TestCase):
+    def test_http11_keeps_connection(self):
+        self.protocol.data_received(b"GET /foo HTTP/1.1\r\n"
+                b"Host: localhost\r\n\r\n")
+        self.assertEqual(b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain\r\n"
+                b"Content-Length: 11\r\n\r\n"
+                b"Hello, /foo", self.transport.data)
+        self.assertFalse(self.transport.closed)
+
+    def test_multiple_requests(self):
+        self.protocol.data_received(b"GET /a HTTP/1.1\r\n\r\n")
+        self.protocol.data_received(b"GET /b HTTP/1.1\r\n\r\n")
+        self.assertTrue(self.transport.data.endswith(b"Hello, /b"))
+        self.assertEqual(2, self.transport.data.count(b"HTTP/1.1 200 OK"))
+        self.assertFalse(self.transport.closed)
+
+    def test_client_requests_close(self):
+        self.protocol.data_received(b"GET / HTTP/1.1\r\n"
+                b"Connection: close\r\n\r\n")
+        self.assertIn(b"\r\nConnection: close\r\n", self.transport.data)
+        self.assertTrue(self.transport.closed)
+
+    def test_http10_closes_connection(self):
+        self.protocol.data_received(b"GET / HTTP/1.0\r\n\r\n")
+        self.assertIn(b"\r\nConnection: close\r\n", self.transport.data)
+        self.assertTrue(self.transport.closed)
+
+    def test_http10_keep_alive(self):
+        self.protocol.data_received(b"GET / HTTP/1.0\r\n"
+                b"Connection: Keep-Alive\r\n\r\n")
+        self.assertIn(b"\r\nConnection: keep-alive\r\n", self.transport.data)
+        self.assertFalse(self.transport.closed)
+
+    def test_split_request(self):
+        self.protocol.data_received(b"GET /split HT")
+        self.assertEqual(b"", self.transport.data)
+        self.protocol.data_received(b"TP/1.1\r\nHost: x\r\n")
+        self.assertEqual(b"", self.transport.data)
+        self.protocol.data_received(b"\r\n")
+        self.assertTrue(self.transport.data.endswith(b"Hello, /split"))
+
+    def test_head_has_no_body(self):
+        self.protocol.data_received(b"HEAD / HTTP/1.1\r\n\r\n")
+        self.assertTrue(self.transport.data.endswith(
+            b"Content-Length: 8\r\n\r\n"))
+
+
+HELLO = Response(u"hello")
+NOT_FOUND = status.HTTPNotFound()
+
+
+def shared_handler(request):
+    if request.path == "/missing":
+        raise NOT_FOUND
+    return HELLO
+
+
+class TestProtocolSharedResponses(unittest.TestCase):
+    def serve(self, data):
+        transport = FakeTransport()
+        protocol = HTTPProtocol(shared_handler)
+        protocol.connection_made(transport)
+        protocol.data_received(data)
+        return transport
+
+    def test_headers_not_modified(self):
+        for path in (b"/", b"/missing"):
+            closed = self.serve(b"GET " + path + b" HTTP/1.0\r\n\r\n")
+            self.assertIn(b"\r\nConnection: close\r\n", closed.data)
+            kept = self.serve(b"GET " + path + b" HTTP/1.1\r\n\r\n")
+            self.assertNotIn(b"Connection", kept.data)
+            self.assertFalse(kept.closed)
+        self.assertNotIn(H.Connection, HELLO.headers)
+        self.assertNotIn(H.Connection, NOT_FOUND.headers)
+
+def echo_handler(request):
+    return Response(request.body)
+
+
+class TestProtocolRequestBody(_TestProtocolBase, unittest.TestCase):
+    handler = staticmethod(echo_handler)
+
+    def test_body(self):
+        self.protocol.data_received(b"POST / HTTP/1.1\r\n"
+                b"Content-Length: 6\r\n\r\nfoo")
+        self.assertEqual(b"", self.transport.data)
+        self.protocol.data_received(b"barGET")
+        self.assertTrue(self.transport.data.endswith(b"\r\n\r\nfoobar"))
+
+    def test_bad_content_length(self):
+        self.protocol.data_received(b"POST / HTTP/1.1\r\n"
+                b"Content-Length: foo\r\n\r\n")
+        self.assertTrue(self.transport.data.startswith(
+            b"HTTP/1.1 400 Bad Request\r\n"))
+        self.assertTrue(self.transport.closed)
+
+    def test_oversized_request(self):
+        self.protocol.data_received(b"GET /" + b"a" * 10000)
+        self.assertTrue(self.transport.data.startswith(
+            b"HTTP/1.1 414 Request-URI Too Long\r\n"))
+        self.assertTrue(self.transport.closed)
+
+
+def error_handler(request):
+    if request.path == "/notfound":
+        raise status.HTTPNotFound()
+    elif request.path == "/close":
+        return Response(u"bye", (H.Connection.CLOSE,))
+    raise RuntimeError(request.path)
+
+
+class TestProtocolErrors(_TestProtocolBase, unittest.TestCase):
+    handler = staticmethod(error_handler)
+
+    def test_http_exception(self):
+        self.protocol.data_received(b"GET /notfound HTTP/1.1\r\n\r\n")
+        self.assertTrue(self.transport.data.startswith(
+            b"HTTP/1.1 404 Not Found\r\n"))
+        self.assertIn(b"\r\nContent-Type: text/html\r\n",
+                self.transport.data)
+        self.assertFalse(self.transport.closed)
+
+    def test_unhandled_exception(self):
+        self.protocol.data_received(b"GET /crash HTTP/1.1\r\n\r\n")
+        self.assertTrue(self.transport.data.startswith(
+            b"HTTP/1.1 500 "))
+
+    def test_response_closes_connection(self):
+        self.protocol.data_received(b"GET /close HTTP/1.1\r\n\r\n"
+                b"GET /notfound HTTP/1.1\r\n\r\n")
+        self.assertEqual(1, self.transport.data.count(b"HTTP/1.1"))
+        self.assertIn(b"\r\nConnection: close\r\n", self.transport.data)
+        self.assertTrue(self.transport.closed)
+
+    def test_response_code(self):
+        def handler(request):
+            response = Response(u"made")
+            response.code = 201
+            return response
+        self.protocol.handler = handler
+        self.protocol.data_received(b"GET / HTTP/1.1\r\n\r\n")
+        self.assertTrue(self.transport.data.startswith(
+            b"HTTP/1.1 201 Created\r\n"))
+
+    def test_malformed_request(self):
+        self.protocol.data_received(b"GARBAGE\r\n\r\n")
+        self.assertTrue(self.transport.data.startswith(
+            b"HTTP/1.1 400 Bad Request\r\n"))
+        self.assertTrue(self.transport.closed)
+
+
+def run_pending(loop, delay=0.01):
+    f = asyncio.Future(loop=loop)
+    loop.call_later(delay, f.set_result, None)
+    loop.run_until_complete(f)
+
+
+def make_request(*lines, **kw):
+    parser = RequestParser()
+    parser.feed(kw.get("method", b"GET") + b" " + kw.get("path", b"/")
+            + b" HTTP/1.1\r\n")
+    for line in lines:
+        parser.feed(line + b"\r\n")
+    parser.feed(b"\r\n")
+    return parser.next_request()
+
+
+class AsyncChunks(object):
+    def __init__(self, loop, chunks):
+        self.loop = loop
+        self.chunks = list(chunks)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        f = asyncio.Future(loop=self.loop)
+        if self.chunks:
+            self.loop.call_soon(f.set_result, self.chunks.pop(0))
+        else:
+            self.loop.call_soon(f.set_exception, _StopAsyncIteration())
+        return f
+
+
+class TestProtocolAsync(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.transport = FakeTransport()
+        self.protocol = HTTPProtocol(self.handler, self.loop)
+        self.protocol.connection_made(self.transport)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def handler(self, request):
+        future = asyncio.Future(loop=self.loop)
+        if request.path == "/future":
+            self.loop.call_soon(future.set_result, Response(u"future"))
+        elif request.path == "/error":
+            self.loop.call_soon(future.set_exception, status.HTTPGone())
+        elif request.path == "/stream":
+            return Response(AsyncChunks(self.loop, [b"a", u"b", b"c"]))
+        elif request.path == "/stream-length":
+            return Response(AsyncChunks(self.loop, [b"ab", b"c"]),
+                    (H.ContentLength(3),))
+        elif request.path == "/awaitable-body":
+            self.loop.call_soon(future.set_result, b"body")
+            return Response(future)
+        elif request.path == "/awaitable-text":
+            self.loop.call_soon(future.set_result, u"t\u00e9xt")
+            return Response(future)
+        return future
+
+    def test_awaitable_response(self):
+        self.protocol.data_received(b"GET /future HTTP/1.1\r\n\r\n")
+        self.assertEqual(b"", self.transport.data)
+        run_pending(self.loop)
+        self.assertTrue(self.transport.data.endswith(b"\r\n\r\nfuture"))
+        self.assertFalse(self.transport.closed)
+
+    def test_awaitable_raises(self):
+        self.protocol.data_received(b"GET /error HTTP/1.1\r\n\r\n")
+        run_pending(self.loop)
+        self.assertTrue(self.transport.data.startswith(
+            b"HTTP/1.1 410 Gone\r\n"))
+
+    def test_requests_wait_for_pending_response(self):
+        self.protocol.data_received(b"GET /future HTTP/1.1\r\n\r\n"
+                b"GET /stream-length HTTP/1.1\r\n\r\n")
+        run_pending(self.loop)
+        data = self.transport.data
+        self.assertLess(data.index(b"future"), data.index(b"abc"))
+        self.assertFalse(self.transport.closed)
+
+    def test_async_iterable_body(self):
+        self.protocol.data_received(b"GET /stream HTTP/1.1\r\n\r\n")
+        run_pending(self.loop)
+        self.assertIn(b"\r\nTransfer-Encoding: chunked\r\n",
+                self.transport.data)
+        self.assertTrue(self.transport.data.endswith(b"\r\n\r\n"
+            b"1\r\na\r\n1\r\nb\r\n1\r\nc\r\n0\r\n\r\n"))
+        self.assertFalse(self.transport.closed)
+
+    def test_async_iterable_body_http10(self):
+        self.protocol.data_received(b"GET /stream HTTP/1.0\r\n"
+                b"Connection: keep-alive\r\n\r\n")
+        run_pending(self.loop)
+        self.assertIn(b"\r\nConnection: close\r\n", self.transport.data)
+        self.assertNotIn(b"Transfer-Encoding", self.transport.data)
+        self.assertTrue(self.transport.data.endswith(b"\r\n\r\nabc"))
+        self.assertTrue(self.transport.closed)
+
+    def test_async_iterable_body_with_length(self):
+        self.protocol.data_received(b"GET /stream-length HTTP/1.1\r\n\r\n")
+        run_pending(self.loop)
+        self.assertTrue(self.transport.data.endswith(b"\r\n\r\nabc"))
+        self.assertFalse(self.transport.closed)
+
+    def test_awaitable_body(self):
+        self.protocol.data_received(
+                b"GET /awaitable-body HTTP/1.1\r\n\r\n")
+        run_pending(self.loop)
+        self.assertIn(b"\r\nContent-Length: 4\r\n", self.transport.data)
+        self.assertTrue(self.transport.data.endswith(b"\r\n\r\nbody"))
+
+    def test_awaitable_text_body(self):
+        self.protocol.data_received(
+                b"GET /awaitable-text HTTP/1.1\r\n\r\n")
+        run_pending(self.loop)
+        self.assertIn(b"\r\nContent-Length: 5\r\n", self.transport.data)
+        # The text is written as a whole, not character by character.
+        self.assertEqual(u"t\u00e9xt".encode("utf-8"),
+                self.transport.written[-1])
+
+
+
+class TestProtocolPipelining(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.transport = FakeTransport()
+        self.protocol = HTTPProtocol(self.handler, self.loop, pipeline=3)
+        self.protocol.connection_made(self.transport)
+        self.futures = []
+        self.handled = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    def handler(self, request):
+        self.handled.append(request.path)
+        if request.path.startswith("/sync"):
+            return Response(request.path)
+        future = asyncio.Future(loop=self.loop)
+        self.futures.append((future, request.path))
+        return future
+
+    def finish(self, index):
+        future, path = self.futures[index]
+        future.set_result(Response(path))
+        run_pending(self.loop)
+
+    def bodies(self):
+        return [part.partition(b"\r\n\r\n")[2] for part in
+                self.transport.data.split(b"HTTP/1.1 ")[1:]]
+
+    def test_dispatched_at_once(self):
+        self.protocol.data_received(b"GET /a HTTP/1.1\r\n\r\n"
+                b"GET /b HTTP/1.1\r\n\r\n")
+        self.assertEqual(["/a", "/b"], self.handled)
+
+    def test_ordered_responses(self):
+        self.protocol.data_received(b"GET /a HTTP/1.1\r\n\r\n"
+                b"GET /sync HTTP/1.1\r\n\r\nGET /c HTTP/1.1\r\n\r\n")
+        self.finish(1)
+        self.assertEqual(b"", self.transport.data)
+        self.finish(0)
+        self.assertEqual([b"/a", b"/sync", b"/c"], self.bodies())
+        self.assertFalse(self.transport.closed)
+
+    def test_bounded_depth(self):
+        self.protocol.data_received(b"".join(b"GET /%d HTTP/1.1\r\n\r\n"
+            % i for i in range(5)))
+        self.assertEqual(["/0", "/1", "/2"], self.handled)
+        self.assertFalse(self.transport.reading)
+        self.finish(0)
+        self.assertEqual(["/0", "/1", "/2", "/3"], self.handled)
+        self.assertFalse(self.transport.reading)
+        for i in range(1, 4):
+            self.finish(i)
+        self.finish(4)
+        self.assertTrue(self.transport.reading)
+        self.assertEqual([("/%d" % i).encode() for i in range(5)],
+                self.bodies())
+
+    def test_stops_after_close(self):
+        self.protocol.data_received(b"GET /a HTTP/1.1\r\n"
+                b"Connection: close\r\n\r\nGET /b HTTP/1.1\r\n\r\n")
+        self.assertEqual(["/a"], self.handled)
+        self.finish(0)
+        self.assertEqual([b"/a"], self.bodies())
+        self.assertTrue(self.transport.closed)
+
+    def test_error_after_pending(self):
+        self.protocol.data_received(b"GET /a HTTP/1.1\r\n\r\nbogus\r\n\r\n")
+        self.assertEqual(b"", self.transport.data)
+        self.finish(0)
+        self.assertEqual([b"/a"], self.bodies()[:1])
+        self.assertIn(b"/aHTTP/1.1 400 Bad Request\r\n", self.transport.data)
+        self.assertTrue(self.transport.closed)
+
+    def test_connection_lost(self):
+        self.protocol.data_received(b"GET /a HTTP/1.1\r\n\r\n"
+                b"GET /b HTTP/1.1\r\n\r\n")
+        self.protocol.connection_lost(None)
+        self.assertTrue(all(f.cancelled() for f, _ in self.futures))
+
+    def test_invalid_depth(self):
+        with self.assertRaises(ValueError):
+            HTTPProtocol(self.handler, pipeline=0)
+
+
+class TestProtocolBackpressure(unittest.TestCase):
+    def setUp(self):
+        self.produced = 0
+        self.protocol = HTTPProtocol(self.handler)
+        self.transport = FakeTransport(self.protocol, 100 * 1024)
+        self.protocol.connection_made(self.transport)
+
+    def handler(self, request):
+        def body():
+            for i in range(64):
+                self.produced += 1
+                yield b"x" * 16 * 1024
+        return Response(body(), (H.ContentLength(64 * 16 * 1024),))
+
+    def test_producer_paused(self):
+        self.protocol.data_received(b"GET / HTTP/1.1\r\n\r\n")
+        self.assertLess(self.produced, 16)
+        received = 0
+        while self.transport.paused:
+            received += len(self.transport.drain())
+            self.assertLess(self.produced, 64 + 1)
+        received += len(self.transport.drain())
+        self.assertEqual(64, self.produced)
+        self.assertGreater(received, 64 * 16 * 1024)
+        self.assertFalse(self.transport.closed)
+
+
+def streaming_handler(request):
+    def body():
+        for i in range(1000):
+            yield b"0123456789"
+    if request.path == "/list":
+        return Response([b"foo", u"bar"])
+    response = Response(body())
+    if request.path == "/trailers":
+        response.trailers = H.HeaderMap((H.CustomHeader("X-Digest", "x"),))
+    return response
+
+
+class TestProtocolChunked(_TestProtocolBase, unittest.TestCase):
+    handler = staticmethod(streaming_handler)
+
+    def test_generator_body_is_chunked(self):
+        self.protocol.data_received(b"GET / HTTP/1.1\r\n\r\n")
+        head, _, body = self.transport.data.partition(b"\r\n\r\n")
+        self.assertIn(b"\r\nTransfer-Encoding: chunked", head)
+        self.assertNotIn(b"Content-Length", head)
+        # Small yields are coalesced into a single chunk.
+        self.assertEqual(b"2710\r\n" + b"0123456789" * 1000
+                + b"\r\n0\r\n\r\n", body)
+        self.assertFalse(self.transport.closed)
+
+    def test_large_body_split_in_chunks(self):
+        from ..protocol import WRITE_BATCH_SIZE
+        self.protocol.handler = lambda request: Response(
+                b"x" * 1024 for _ in range(100))
+        self.protocol.data_received(b"GET / HTTP/1.1\r\n\r\n")
+        body = self.transport.data.partition(b"\r\n\r\n")[2]
+        size = WRITE_BATCH_SIZE
+        self.assertTrue(body.startswith("{:x}\r\n".format(size).encode()))
+        self.assertTrue(body.endswith(b"\r\n0\r\n\r\n"))
+        self.assertEqual(100 * 1024, body.count(b"x"))
+
+    def test_trailers(self):
+        self.protocol.data_received(b"GET /trailers HTTP/1.1\r\n\r\n")
+        self.assertTrue(self.transport.data.endswith(
+            b"\r\n0\r\nX-Digest: x\r\n\r\n"))
+
+    def test_sized_body_has_length(self):
+        self.protocol.data_received(b"GET /list HTTP/1.1\r\n\r\n")
+        self.assertIn(b"\r\nContent-Length: 6\r\n", self.transport.data)
+        self.assertTrue(self.transport.data.endswith(b"\r\n\r\nfoobar"))
+
+    def test_http10_body_until_close(self):
+        self.protocol.data_received(b"GET / HTTP/1.0\r\n"
+                b"Connection: keep-alive\r\n\r\n")
+        head, _, body = self.transport.data.partition(b"\r\n\r\n")
+        self.assertIn(b"\r\nConnection: close", head)
+        self.assertNotIn(b"Content-Length", head)
+        self.assertNotIn(b"Transfer-Encoding", head)
+        self.assertEqual(b"0123456789" * 1000, body)
+        self.assertTrue(self.transport.closed)
+
+    def test_http10_sized_body_has_length(self):
+        self.protocol.data_received(b"GET /list HTTP/1.0\r\n\r\n")
+        self.assertIn(b"\r\nContent-Length: 6\r\n", self.transport.data)
+        self.assertTrue(self.transport.data.endswith(b"\r\n\r\nfoobar"))
+
+    def test_http10_head_not_consumed(self):
+        consumed = []
+        def body():
+            consumed.append(True)
+            yield b"foo"
+        self.protocol.handler = lambda request: Response(body())
+        self.protocol.data_received(b"HEAD / HTTP/1.0\r\n\r\n")
+        self.assertTrue(self.transport.data.endswith(b"\r\n\r\n"))
+        self.assertNotIn(b"Content-Length", self.transport.data)
+        self.assertEqual([], consumed)
+
+    def test_head(self):
+        self.protocol.data_received(b"HEAD / HTTP/1.1\r\n\r\n")
+        self.assertTrue(self.transport.data.endswith(
+            b"Transfer-Encoding: chunked\r\n\r\n"))
+        self.assertFalse(self.transport.closed)
@@ -0,0 +1,123 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from .. import headers as H
+from .. import status
+from ..parser import RequestParser
+from ..protocol import HTTPProtocol
+from ..ratelimit import RateLimiter, RateLimit
+from ..response import Response
+from .test_protocol import FakeTransport, hello_handler
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_burst_and_refill(self):
+        limiter = RateLimiter(2, burst=3)
+        self.assertEqual([0, 0, 0], [limiter.acquire("a", now=0)
+            for _ in range(3)])
+        self.assertEqual(0.5, limiter.acquire("a", now=0))
+        self.assertEqual(0, limiter.acquire("a", now=0.5))
+        self.assertEqual(0, limiter.acquire("b", now=0.5))
+
+    def test_refill_is_capped(self):
+        limiter = RateLimiter(1, burst=2)
+        limiter.acquire("a", now=0)
+        self.assertEqual([0, 0, 1], [limiter.acquire("a", now=100)
+            for _ in range(3)])
+
+    def test_sweep(self):
+        limiter = RateLimiter(1, burst=2, sweep_step=0)
+        limiter.acquire("a", now=0)
+        limiter.acquire("b", now=1)
+        limiter.sweep(now=2)
+        self.assertNotIn("a", limiter)
+        self.assertIn("b", limiter)
+        limiter.acquire("c", now=2)
+        self.assertEqual(2, len(limiter))
+        self.assertEqual(3, len(limiter._keys))  # Slot reused.
+
+    def test_incremental_sweep(self):
+        limiter = RateLimiter(1, burst=1)
+        for i in range(10):
+            limiter.acquire(i, now=0)
+        for i in range(10):
+            limiter.acquire("x", now=5)
+        self.assertEqual(1, len(limiter))
+
+    def test_max_keys(self):
+        limiter = RateLimiter(1, burst=1, max_keys=2, sweep_step=0)
+        limiter.acquire("a", now=0)
+        limiter.acquire("b", now=0)
+        # Untracked keys share a bucket.
+        self.assertEqual(0, limiter.acquire("c", now=0))
+        self.assertEqual(1, limiter.acquire("d", now=0))
+        self.assertEqual(2, len(limiter))
+
+    def test_check(self):
+        limiter = RateLimiter(0.5, burst=1)
+        self.assertIsNone(limiter.check("a"))
+        rejection = limiter.check("a")
+        self.assertIsInstance(rejection, status.HTTPTooManyRequests)
+        self.assertIn(rejection.headers[H.RetryAfter].string_value,
+                ("1", "2"))
+
+
+class TestRetryAfter(unittest.TestCase):
+    def test_rounds_up(self):
+        self.assertEqual("3", H.RetryAfter(2.1).string_value)
+        self.assertEqual("2", H.RetryAfter(2).string_value)
+
+    def test_date(self):
+        header = H.parse_header("Retry-After", "Fri, 31 Dec 1999 23:59:59 GMT")
+        self.assertEqual("Fri, 31 Dec 1999 23:59:59 GMT", header.string_value)
+
+
+class TestRateLimit(unittest.TestCase):
+    def test_wrapper(self):
+        def api_key(request):
+            header = request.header("X-Api-Key")
+            return None if header is None else header.string_value
+        limiter = RateLimiter(1, burst=1)
+        wrapped = RateLimit(lambda request: Response(b"ok"), limiter,
+                api_key)
+        parser = RequestParser()
+        parser.feed(b"GET / HTTP/1.1\r\nX-Api-Key: k\r\n\r\n" * 2
+                + b"GET / HTTP/1.1\r\n\r\n")
+        wrapped(parser.next_request())
+        with self.assertRaises(status.HTTPTooManyRequests):
+            wrapped(parser.next_request())
+        wrapped(parser.next_request())
+
+
+class TestProtocolRateLimit(unittest.TestCase):
+    def setUp(self):
+        self.limiter = RateLimiter(0.001, burst=2)
+        self.transport = FakeTransport(peername=("10.0.0.1", 5555))
+        self.protocol = HTTPProtocol(hello_handler, limiter=self.limiter)
+        self.protocol.connection_made(self.transport)
+
+    def test_rejects_before_parsing(self):
+        self.protocol.data_received(b"GET /a HTTP/1.1\r\n\r\n")
+        self.protocol.data_received(b"GET /b HTTP/1.1\r\n\r\n"
+                b"POST /c HTTP/1.1\r\nContent-Length: 100\r\n\r\n")
+        data = self.transport.data
+        self.assertEqual(2, data.count(b"HTTP/1.1 200 OK"))
+        self.assertIn(b"HTTP/1.1 429 Too Many Requests\r\n", data)
+        self.assertIn(b"Retry-After: ", data)
+        self.assertIn(b"Connection: close\r\n", data)
+        self.assertTrue(self.transport.closed)
+        self.assertIn("10.0.0.1", self.limiter)
+
+    def test_one_token_per_request(self):
+        self.protocol.data_received(b"GET /a HT")
+        self.protocol.data_received(b"TP/1.1\r\n")
+        self.protocol.data_received(b"\r\n")
+        self.protocol.data_received(b"GET /b HTTP/1.1\r\n\r\n")
+        self.assertEqual(2, self.transport.data.count(b"HTTP/1.1 200 OK"))
+        self.assertFalse(self.transport.closed)
@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from .. import headers as H
+from .. import status
+from ..response import Response
+
+
+class TestResponseBuffers(unittest.TestCase):
+    def test_header_block_is_single_buffer(self):
+        r = Response(u"Hello", (H.ContentType.TEXT_PLAIN,
+            H.ContentLength(5)))
+        buffers = r.buffers()
+        self.assertEqual(2, len(buffers))
+        self.assertEqual(b"Content-Type: text/plain\r\n"
+                b"Content-Length: 5\r\n\r\n", buffers[0])
+        self.assertEqual(b"Hello", buffers[1])
+
+    def test_no_headers(self):
+        self.assertEqual([b"\r\n"], Response().buffers())
+
+    def test_text_chunks_are_encoded(self):
+        r = Response(iter([u"café"]))
+        self.assertEqual(b"caf\xc3\xa9", r.buffers()[1])
+
+    def test_binary_chunks_are_not_copied(self):
+        data = b"binary data"
+        view = memoryview(bytearray(b"some view"))
+        buffers = Response(iter([data, view])).buffers()
+        self.assertIs(data, buffers[1])
+        self.assertIs(view, buffers[2])
+
+    def test_empty_chunks_are_skipped(self):
+        r = Response(iter([b"", b"a", u"", b"b"]))
+        self.assertEqual([b"\r\n", b"a", b"b"], r.buffers())
+
+    def test_matches_iteration(self):
+        headers = (H.ContentType.TEXT_HTML, H.Connection.KEEP_ALIVE)
+        expected = "".join(Response(u"<p>Hi</p>", headers))
+        got = b"".join(Response(u"<p>Hi</p>", headers).buffers())
+        self.assertEqual(expected.encode("utf-8"), got)
+
+
+class TestResponseStatusLine(unittest.TestCase):
+    def test_default(self):
+        self.assertEqual(b"HTTP/1.1 200 OK\r\n", Response().status_line)
+
+    def test_follows_code(self):
+        r = Response(b"")
+        r.code = 201
+        self.assertEqual(b"HTTP/1.1 201 Created\r\n", r.status_line)
+        self.assertIs(status.HTTPCreated.status_line, r.status_line)
+
+    def test_subclass_code(self):
+        class Accepted(Response):
+            code = 202
+        self.assertEqual(b"HTTP/1.1 202 Accepted\r\n", Accepted.status_line)
+        self.assertEqual(b"HTTP/1.1 202 Accepted\r\n",
+                Accepted().status_line)
+
+    def test_unknown_code(self):
+        class Custom(Response):
+            code = 299
+            reason = "Custom"
+        self.assertEqual(b"HTTP/1.1 299 Custom\r\n", Custom().status_line)
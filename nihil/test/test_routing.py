@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from .. import headers as H
+from .. import status
+from ..request import Request
+from ..routing import Router
+
+
+def handler(name):
+    def f(request, **params):
+        return name, params
+    f.__name__ = name
+    return f
+
+
+class TestRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = Router()
+        self.router.add("/", handler("index"))
+        self.router.add("/users", handler("users"))
+        self.router.add("/users", handler("create_user"), ("POST",))
+        self.router.add("/users/me", handler("me"))
+        self.router.add("/users/{id:int}", handler("user"))
+        self.router.add("/users/{name}", handler("user_by_name"))
+        self.router.add("/users/{id:int}/posts/{slug}", handler("post"),
+                ("GET", "PUT"))
+        self.router.add("/static/{path:path}", handler("static"))
+        self.router.add("/files/{name}/", handler("files"))
+
+    def dispatch(self, method, uri):
+        return self.router(Request(method, uri))
+
+    def test_static(self):
+        self.assertEqual(("index", {}), self.dispatch("GET", "/"))
+        self.assertEqual(("users", {}), self.dispatch("GET", "/users"))
+        self.assertEqual(("me", {}), self.dispatch("GET", "/users/me"))
+
+    def test_methods(self):
+        self.assertEqual(("create_user", {}),
+                self.dispatch("POST", "/users?x=1"))
+        self.assertEqual(("users", {}), self.dispatch("HEAD", "/users"))
+
+    def test_typed_parameters(self):
+        self.assertEqual(("user", {"id": 42}),
+                self.dispatch("GET", "/users/42"))
+        self.assertEqual(("user_by_name", {"name": "bob"}),
+                self.dispatch("GET", "/users/bob"))
+        self.assertEqual(("post", {"id": 3, "slug": "hello"}),
+                self.dispatch("PUT", "/users/3/posts/hello"))
+
+    def test_backtracking(self):
+        # "/users/bob/posts/x" cannot match {id:int}, nor {name} (which
+        # has no children), and there is no other route.
+        with self.assertRaises(status.HTTPNotFound):
+            self.dispatch("GET", "/users/bob/posts/x")
+
+    def test_wildcard(self):
+        self.assertEqual(("static", {"path": "css/site.css"}),
+                self.dispatch("GET", "/static/css/site.css"))
+        self.assertEqual(("static", {"path": ""}),
+                self.dispatch("GET", "/static/"))
+
+    def test_trailing_slash(self):
+        self.assertEqual(("files", {"name": "foo"}),
+                self.dispatch("GET", "/files/foo/"))
+        with self.assertRaises(status.HTTPNotFound):
+            self.dispatch("GET", "/files/foo")
+
+    def test_not_found(self):
+        for path in ("/nope", "/users/", "/users/1/posts", "//"):
+            with self.assertRaises(status.HTTPNotFound):
+                self.dispatch("GET", path)
+
+    def test_method_not_allowed(self):
+        with self.assertRaises(status.HTTPMethodNotAllowed) as cm:
+            self.dispatch("DELETE", "/users")
+        self.assertEqual(H.Allow("GET, HEAD, POST"),
+                cm.exception.headers["Allow"])
+        with self.assertRaises(status.HTTPMethodNotAllowed) as cm:
+            self.dispatch("POST", "/users/3/posts/foo")
+        self.assertEqual(H.Allow("GET, HEAD, PUT"),
+                cm.exception.headers["Allow"])
+
+    def test_decorator(self):
+        @self.router.route("/hello/{who}", methods=("GET", "POST"))
+        def hello(request, who):
+            return who
+        self.assertEqual("world", self.dispatch("POST", "/hello/world"))
+
+    def test_bad_patterns(self):
+        with self.assertRaises(ValueError):
+            self.router.add("/", handler("again"))
+        with self.assertRaises(ValueError):
+            self.router.add("/a/{rest:path}/b", handler("bad"))
+        with self.assertRaises(ValueError):
+            self.router.add("/a/{}", handler("bad"))
+        with self.assertRaises(KeyError):
+            self.router.add("/a/{x:nosuchtype}", handler("bad"))
+
+    def test_many_routes(self):
+        router = Router()
+        for i in range(500):
+            router.add("/api/v1/resource{}/{{id:int}}".format(i),
+                    handler(str(i)))
+        self.assertEqual(("321", {"id": 7}),
+                router(Request("GET", "/api/v1/resource321/7")))
@@ -0,0 +1,112 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from ..response import Response
+from ..server import load_handler, bind_socket
+from os import path, environ
+import subprocess
+import signal
+import socket
+import time
+import sys
+import os
+
+TOP_DIR = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
+
+
+def pid_handler(request):
+    return Response(str(os.getpid()))
+
+
+def fetch(port, timeout=10):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            sock = socket.create_connection(("127.0.0.1", port), timeout=2)
+            try:
+                sock.sendall(b"GET / HTTP/1.1\r\nConnection: close\r\n\r\n")
+                data = b""
+                while True:
+                    chunk = sock.recv(4096)
+                    if not chunk:
+                        break
+                    data += chunk
+            finally:
+                sock.close()
+            if data:
+                return data.partition(b"\r\n\r\n")[2].decode("ascii")
+        except socket.error:
+            pass
+        if time.time() > deadline:
+            raise AssertionError("No response from server")
+        time.sleep(0.05)
+
+
+class TestLoadHandler(unittest.TestCase):
+    def test_load(self):
+        self.assertIs(pid_handler,
+                load_handler("nihil.test.test_server:pid_handler"))
+        self.assertIs(Response.__init__,
+                load_handler("nihil.response:Response.__init__"))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            load_handler("nihil.test.test_server")
+
+
+@unittest.skipUnless(hasattr(socket, "SO_REUSEPORT"), "no SO_REUSEPORT")
+class TestBindSocket(unittest.TestCase):
+    def test_reuse_port(self):
+        a = bind_socket("127.0.0.1", 0)
+        try:
+            b = bind_socket("127.0.0.1", a.getsockname()[1])
+            b.close()
+        finally:
+            a.close()
+
+
+@unittest.skipUnless(hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT"),
+        "needs fork() and SO_REUSEPORT")
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        sock = bind_socket("127.0.0.1", 0, False)
+        self.port = sock.getsockname()[1]
+        sock.close()
+        env = dict(environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None,
+            (TOP_DIR, env.get("PYTHONPATH"))))
+        self.process = subprocess.Popen((sys.executable, "-m",
+            "nihil.server", "nihil.test.test_server:pid_handler",
+            "-H", "127.0.0.1", "-p", str(self.port), "-w", "2"),
+            env=env, cwd=TOP_DIR, stderr=subprocess.PIPE)
+
+    def tearDown(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.process.stderr.close()
+
+    def test_restarts_workers(self):
+        pids = set(fetch(self.port) for _ in range(20))
+        self.assertNotIn(str(self.process.pid), pids)
+        for pid in pids:
+            os.kill(int(pid), signal.SIGKILL)
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if fetch(self.port) not in pids:
+                break
+        else:
+            self.fail("Workers were not restarted")
+
+    def test_stop(self):
+        worker = int(fetch(self.port))
+        self.process.send_signal(signal.SIGTERM)
+        self.assertEqual(0, self.process.wait())
+        with self.assertRaises(OSError):
+            os.kill(worker, 0)
@@ -0,0 +1,152 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from .. import headers as H
+from .. import status
+from ..response import Response
+
+
+def all_status_classes():
+    return [getattr(status, name) for name in sorted(status.__all__)]
+
+
+def substitute(exc, escape):
+    if exc.body is None:
+        return ""
+    data = exc.render_data
+    if escape:
+        for k in ("title", "message", "comment", "explanation"):
+            data[k] = status.html_escape(data[k])
+        return exc.body.safe_substitute(data)
+    return exc.plain_body.safe_substitute(data)
+
+
+class TestPrerenderedBodies(unittest.TestCase):
+    def test_default_bodies(self):
+        for cls in all_status_classes():
+            for plaintext in (False, True):
+                e = cls(plaintext=plaintext)
+                expected = substitute(e, not plaintext)
+                rendered = e.render_plain() if plaintext else e.render_html()
+                self.assertEqual(expected, rendered)
+                self.assertEqual(expected.encode("utf-8"),
+                        b"".join(e.body_buffers()))
+
+    def test_bodies_with_message(self):
+        for cls in all_status_classes():
+            for plaintext in (False, True):
+                e = cls(u"Foo <b>bar</b> & baz", plaintext=plaintext)
+                expected = substitute(e, not plaintext)
+                rendered = e.render_plain() if plaintext else e.render_html()
+                self.assertEqual(expected, rendered)
+                self.assertEqual(expected.encode("utf-8"),
+                        b"".join(e.body_buffers()))
+
+    def test_message_is_escaped(self):
+        body = status.HTTPNotFound(u"<script>").render_html()
+        self.assertIn(u"&lt;script&gt;", body)
+        self.assertNotIn(u"<script>", body)
+
+    def test_content_length(self):
+        for e in (status.HTTPNotFound(), status.HTTPNotFound(u"fóo"),
+                status.HTTPNotFound(plaintext=True),
+                status.HTTPBadRequest(u"foo", comment=u"bar")):
+            body = b"".join(e.body_buffers())
+            self.assertEqual(H.ContentLength(len(body)),
+                    e.headers[H.ContentLength])
+
+    def test_no_body(self):
+        e = status.HTTPNotModified()
+        self.assertNotIn(H.ContentLength, e.headers)
+        self.assertNotIn(H.ContentType, e.headers)
+        self.assertEqual([], e.body_buffers())
+
+    def test_default_body_is_shared(self):
+        a, b = status.HTTPNotFound(), status.HTTPNotFound()
+        self.assertIs(a.body_buffers()[0], b.body_buffers()[0])
+
+    def test_overridden_rendering(self):
+        class Custom(status.HTTPNotFound):
+            def render_html(self):
+                return u"<custom/>"
+        class CustomData(status.HTTPNotFound):
+            @property
+            def render_data(self):
+                return dict(super(CustomData, self).render_data,
+                        title=u"Gone Fishing")
+        self.assertEqual([b"<custom/>"], Custom().body_buffers())
+        self.assertEqual([b"<custom/>"], Custom(u"m").body_buffers())
+        self.assertEqual(H.ContentLength(9), Custom().headers[H.ContentLength])
+        for e in (CustomData(), CustomData(u"m"),
+                CustomData(plaintext=True)):
+            self.assertIn(b"Gone Fishing", b"".join(e.body_buffers()))
+
+    def test_extra_headers(self):
+        e = status.HTTPFound(location="/foo",
+                headers=(H.Server("nihil"),))
+        self.assertEqual(H.Location("/foo"), e.headers["Location"])
+        self.assertEqual(H.Server("nihil"), e.headers["Server"])
+        self.assertEqual(H.ContentType.TEXT_HTML, e.headers["Content-Type"])
+        self.assertNotIn(H.Location, status.HTTPNotFound().headers)
+
+
+class TestStatusMetadata(unittest.TestCase):
+    def test_titles(self):
+        self.assertEqual("Not Found", status.HTTPNotFound.title)
+        self.assertEqual("Multiple Choices", status.HTTPMultipleChoices.title)
+        self.assertEqual("Moved Permanently",
+                status.HTTPMovedPermanently.title)
+        self.assertEqual("Bad Request", status.HTTPBadRequest.title)
+        self.assertEqual("Internal Server Error",
+                status.HTTPInternalServerError.title)
+        self.assertEqual("OK", status.HTTPOk.title)
+        self.assertEqual("Not Found", status.HTTPNotFound().title)
+
+    def test_status_lines(self):
+        self.assertEqual(b"HTTP/1.1 404 Not Found\r\n",
+                status.HTTPNotFound.status_line)
+        self.assertEqual(b"HTTP/1.1 505 HTTP Version Not Supported\r\n",
+                status.HTTPVersionNotSupported.status_line)
+        self.assertEqual(b"HTTP/1.1 201 Created\r\n",
+                status.HTTPCreated().status_line)
+
+    def test_by_code(self):
+        self.assertIs(status.HTTPNotFound, status.by_code[404])
+        self.assertIs(status.HTTPBadRequest, status.by_code[400])
+        self.assertIs(status.HTTPInternalServerError, status.by_code[500])
+        self.assertIs(status.HTTPOk, status.by_code[200])
+        self.assertIsNone(status.by_code[499])
+        for cls in all_status_classes():
+            if cls.code is not None:
+                self.assertEqual(cls.code, status.by_code[cls.code].code)
+
+    def test_subclass_without_code(self):
+        class MyNotFound(status.HTTPNotFound):
+            pass
+        self.assertIs(status.HTTPNotFound, status.by_code[404])
+        self.assertEqual("Not Found", MyNotFound.title)
+        self.assertEqual(b"HTTP/1.1 404 Not Found\r\n",
+                MyNotFound.status_line)
+
+    def test_subclass_with_code(self):
+        class ApiNotFound(status.HTTPNotFound):
+            code = 404
+        self.assertIs(status.HTTPNotFound, status.by_code[404])
+        self.assertEqual(b"HTTP/1.1 404 Not Found\r\n",
+                status.HTTPNotFound.status_line)
+        self.assertEqual(b"HTTP/1.1 404 Api Not Found\r\n",
+                ApiNotFound().status_line)
+        response = Response()
+        response.code = 404
+        self.assertEqual(b"HTTP/1.1 404 Not Found\r\n",
+                response.status_line)
+        self.assertNotIn("ApiNotFound", status.__all__)
+        gone = ApiNotFound()
+        gone.code = 410
+        self.assertEqual(b"HTTP/1.1 410 Gone\r\n", gone.status_line)
@@ -0,0 +1,126 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the MIT license.
+
+import unittest2 as unittest
+from trololio import asyncio
+from ..protocol import HTTPProtocol
+from ..response import Response
+from ..timeouts import TimerWheel, Timeouts
+from .test_protocol import FakeTransport, run_pending
+
+
+class TestTimerWheel(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.wheel = TimerWheel(self.loop, resolution=0.01, size=4)
+        self.fired = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_fires_in_order(self):
+        for delay in (0.05, 0.01, 0.03):
+            self.wheel.schedule(delay, lambda d=delay: self.fired.append(d))
+        self.assertEqual(3, len(self.wheel))
+        run_pending(self.loop, 0.1)
+        self.assertEqual([0.01, 0.03, 0.05], self.fired)
+        self.assertEqual(0, len(self.wheel))
+
+    def test_not_before_delay(self):
+        self.wheel.schedule(0.05, lambda: self.fired.append(True))
+        run_pending(self.loop, 0.03)
+        self.assertEqual([], self.fired)
+        run_pending(self.loop, 0.05)
+        self.assertEqual([True], self.fired)
+
+    def test_not_before_delay_between_ticks(self):
+        self.wheel.schedule(1, lambda: None)
+        run_pending(self.loop, 0.015)
+        start = self.loop.time()
+        self.wheel.schedule(0.02,
+                lambda: self.fired.append(self.loop.time() - start))
+        run_pending(self.loop, 0.05)
+        self.assertEqual(1, len(self.fired))
+        self.assertGreaterEqual(self.fired[0], 0.02 - 0.001)
+
+    def test_cancel(self):
+        timer = self.wheel.schedule(0.02, lambda: self.fired.append(True))
+        timer.cancel()
+        timer.cancel()
+        self.assertEqual(0, len(self.wheel))
+        run_pending(self.loop, 0.05)
+        self.assertEqual([], self.fired)
+
+    def test_stops_ticking(self):
+        self.wheel.schedule(0.01, lambda: None)
+        run_pending(self.loop, 0.05)
+        self.assertIsNone(self.wheel._handle)
+
+
+class TestProtocolTimeouts(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.timeouts = Timeouts(header=0.05, body=0.05, idle=0.05,
+                handler=0.05, wheel=TimerWheel(self.loop, resolution=0.01))
+        self.transport = FakeTransport()
+        self.protocol = HTTPProtocol(self.handler, self.loop,
+                timeouts=self.timeouts)
+        self.protocol.connection_made(self.transport)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def handler(self, request):
+        if request.path == "/slow":
+            return asyncio.Future(loop=self.loop)
+        return Response(b"ok")
+
+    def test_idle(self):
+        run_pending(self.loop, 0.1)
+        self.assertTrue(self.transport.closed)
+        self.assertEqual(b"", self.transport.data)
+
+    def test_idle_after_response(self):
+        self.protocol.data_received(b"GET / HTTP/1.1\r\n\r\n")
+        run_pending(self.loop, 0.03)
+        self.assertFalse(self.transport.closed)
+        run_pending(self.loop, 0.07)
+        self.assertTrue(self.transport.closed)
+        self.assertEqual(1, self.transport.data.count(b"HTTP/1.1"))
+
+    def test_slow_headers(self):
+        # Trickling bytes does not extend the deadline.
+        for c in b"GET / HTTP/1.1\r\nHost: x":
+            self.protocol.data_received(bytes(bytearray((c,))))
+            run_pending(self.loop, 0.005)
+        run_pending(self.loop, 0.05)
+        self.assertTrue(self.transport.data.startswith(
+            b"HTTP/1.1 408 Request Timeout\r\n"))
+        self.assertTrue(self.transport.closed)
+
+    def test_slow_body(self):
+        self.protocol.data_received(b"POST / HTTP/1.1\r\n"
+                b"Content-Length: 10\r\n\r\n")
+        for _ in range(5):
+            run_pending(self.loop, 0.02)
+            self.protocol.data_received(b"x")
+        self.assertFalse(self.transport.closed)
+        run_pending(self.loop, 0.1)
+        self.assertTrue(self.transport.data.startswith(
+            b"HTTP/1.1 408 Request Timeout\r\n"))
+
+    def test_slow_handler(self):
+        self.protocol.data_received(b"GET /slow HTTP/1.1\r\n\r\n")
+        run_pending(self.loop, 0.1)
+        self.assertTrue(self.transport.data.startswith(
+            b"HTTP/1.1 504 Gateway Timeout\r\n"))
+        self.assertTrue(self.transport.closed)
+
+    def test_closed_connection(self):
+        self.protocol.connection_lost(None)
+        self.assertEqual(0, len(self.timeouts.wheel))
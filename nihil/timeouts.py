@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2014 Adrian Perez <aperez@igalia.com>
+#
+# Distributed under terms of the GPLv3 license.
+
+"""
+Connection timeouts.
+"""
+
+from trololio import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class Timer(object):
+    """
+    A callback scheduled in a :class:`TimerWheel`.
+    """
+    __slots__ = ("wheel", "deadline", "callback")
+
+    def __init__(self, wheel, deadline, callback):
+        self.wheel = wheel
+        self.deadline = deadline
+        self.callback = callback
+
+    def cancel(self):
+        if self.wheel is not None:
+            self.wheel._remove(self)
+            self.wheel = None
+
+
+class TimerWheel(object):
+    """
+    Hashed timer wheel, which runs callbacks after a delay with a precision
+    of `resolution` seconds. Timers are kept in `size` slots, one of which
+    is checked on each tick, so scheduling and cancelling them is cheap and
+    only one event loop timer is used regardless of how many timers there
+    are. The wheel does not tick while no timers are scheduled.
+
+    Callbacks run after their delay (rounded up to the resolution), and
+    before one more tick has passed.
+    """
+    def __init__(self, loop=None, resolution=1.0, size=512):
+        self.resolution = resolution
+        self._loop = loop
+        self._slots = [set() for _ in range(size)]
+        self._tick = 0
+        self._count = 0
+        self._handle = None
+        self._next = None
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, delay, callback):
+        """
+        Schedules a `callback` to be called without arguments after `delay`
+        seconds. Returns a :class:`Timer` which can be cancelled.
+        """
+        if self._handle is None:
+            ticks = int(-(-delay // self.resolution)) or 1
+        else:
+            # The next tick may be less than a resolution away: count the
+            # delay from it, to avoid running the callback early.
+            delay -= self._next - self._loop.time()
+            ticks = 1 + max(0, int(-(-delay // self.resolution)))
+        timer = Timer(self, self._tick + ticks, callback)
+        self._slots[timer.deadline % len(self._slots)].add(timer)
+        self._count += 1
+        if self._handle is None:
+            if self._loop is None:
+                self._loop = asyncio.get_event_loop()
+            self._next = self._loop.time() + self.resolution
+            self._handle = self._loop.call_at(self._next, self._run)
+        return timer
+
+    def _remove(self, timer):
+        self._slots[timer.deadline % len(self._slots)].discard(timer)
+        self._count -= 1
+
+    def _run(self):
+        self._tick += 1
+        slot = self._slots[self._tick % len(self._slots)]
+        expired = [t for t in slot if t.deadline <= self._tick]
+        for timer in expired:
+            slot.remove(timer)
+            timer.wheel = None
+        self._count -= len(expired)
+        for timer in expired:
+            try:
+                timer.callback()
+            except Exception:
+                log.exception("Unhandled exception in timer callback")
+        if self._count:
+            self._next += self.resolution
+            self._handle = self._loop.call_at(self._next, self._run)
+        else:
+            self._handle = None
+
+
+class Timeouts(object):
+    """
+    Timeouts, in seconds, applied by :class:`~nihil.protocol.HTTPProtocol`
+    to connections:
+
+    - `header`: to receive a complete request head, counting from its
+      first byte. A 408 Request Timeout is sent when it expires.
+    - `body`: between fragments of a request body. A 408 Request Timeout
+      is sent when it expires.
+    - `idle`: waiting for a request on an open connection, which is
+      closed when it expires.
+    - `handler`: for the handler to produce a response, after which a
+      504 Gateway Timeout is sent.
+
+    Any of them may be ``None`` to disable it. The timers of all the
+    connections share a :class:`TimerWheel`.
+    """
+    def __init__(self, header=10, body=30, idle=60, handler=None,
+            wheel=None):
+        self.header = header
+        self.body = body
+        self.idle = idle
+        self.handler = handler
+        self.wheel = TimerWheel() if wheel is None else wheel